@@ -0,0 +1,223 @@
+import numpy
+
+from Game.GameMode import GameMode
+from Game.PackedWord import PackedWord
+
+
+class BatchScorer(object):
+    """
+    BatchScorer - Scores many guesses against many answers in one call using NumPy.
+
+    The scoring semantics are the same as PackedWord.score (and therefore the same as
+    python_digits.DigitWord.compare): a bull is a digit in the right place and a cow
+    is a digit that is not in the right place but occurs in the answer.
+
+    Words are represented as integer arrays of shape (N, digits). Every word in a mode
+    also has an index in the mode's answer space (the digits read as a little endian
+    number in the mode's base), which is used by the precomputed score table. Table
+    entries are encoded as bulls * (digits + 1) + cows; use decode() to split them.
+
+    Use BatchScorer.for_mode() to share scorers (and their tables) across callers.
+
+    """
+    MAX_TABLE_CELLS = 10 ** 8   # Largest score table (answers x guesses) that will be built.
+    TABLE_CHUNK_CELLS = 2 ** 23 # Cells compared per chunk while building a table.
+
+    _BASES = {PackedWord.DIGIT: 10, PackedWord.HEXDIGIT: 16}
+    _scorers = {}
+
+    def __init__(self, mode=None):
+        """
+        Create a scorer for a game mode.
+
+        :param mode: <required> A GameMode object.
+        """
+        if mode is None:
+            raise ValueError("A GameMode must be provided to the BatchScorer")
+        if not isinstance(mode, GameMode):
+            raise TypeError("The mode passed to the BatchScorer is not a GameMode!")
+        if mode.digit_type not in self._BASES:
+            raise ValueError("The mode digit_type is not supported: {}".format(mode.digit_type))
+
+        self._mode = mode
+        self._digits = mode.digits
+        self._base = self._BASES[mode.digit_type]
+        self._weights = self._base ** numpy.arange(self._digits, dtype=numpy.int64)
+        self._table = None
+
+    #
+    # Class methods
+    #
+    @classmethod
+    def for_mode(cls, mode=None):
+        """
+        Return a (cached) BatchScorer for the mode.
+
+        :param mode: <required> A GameMode object.
+        :return: BatchScorer
+        """
+        if not isinstance(mode, GameMode):
+            raise TypeError("The mode passed to the BatchScorer is not a GameMode!")
+        _cache_key = (mode.mode, mode.digits, mode.digit_type)
+        _scorer = cls._scorers.get(_cache_key, None)
+        if _scorer is None:
+            _scorer = cls(mode=mode)
+            cls._scorers[_cache_key] = _scorer
+        return _scorer
+
+    #
+    # Properties
+    #
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def space(self):
+        """The number of distinct words (answers) in the mode. :return: <int>"""
+        return self._base ** self._digits
+
+    @property
+    def table(self):
+        """
+        The score table for the mode: a (space, space) uint8 array indexed by
+        [answer index, guess index]. The table is built the first time it is used.
+
+        :return: numpy.ndarray
+        """
+        if self._table is None:
+            self._table = self._build_table()
+        return self._table
+
+    #
+    # 'public' methods
+    #
+    def to_array(self, words=None):
+        """
+        Convert words to an (N, digits) array. Words may be an array (which is
+        validated and returned), a list of PackedWord objects, or a list of digit
+        lists (which are parsed with PackedWord.parse).
+
+        :param words: <required> The words to convert.
+        :return: numpy.ndarray
+        """
+        if isinstance(words, numpy.ndarray):
+            _array = words
+        else:
+            _array = numpy.array(
+                [
+                    word.digits if isinstance(word, PackedWord)
+                    else PackedWord.parse(word, wordtype=self._mode.digit_type).digits
+                    for word in words
+                ],
+                dtype=numpy.int8
+            ).reshape(-1, self._digits)
+
+        if _array.ndim != 2 or _array.shape[1] != self._digits:
+            raise ValueError("The DigitWord objects are of different lengths and so comparison fails.")
+        if _array.size and (_array.min() < 0 or _array.max() >= self._base):
+            raise ValueError("Words contain digits outside the range of the mode.")
+        return _array
+
+    def index(self, words=None):
+        """
+        Return the answer space index of each word.
+
+        :param words: <required> Words accepted by to_array.
+        :return: numpy.ndarray of int64
+        """
+        return self.to_array(words).astype(numpy.int64).dot(self._weights)
+
+    def words(self, indices=None):
+        """
+        Return the (N, digits) array of words for answer space indices.
+
+        :param indices: <required> An int or array like of ints.
+        :return: numpy.ndarray
+        """
+        _indices = numpy.asarray(indices, dtype=numpy.int64).reshape(-1, 1)
+        return ((_indices // self._weights) % self._base).astype(numpy.int8)
+
+    def score(self, answers=None, guesses=None):
+        """
+        Score guesses[i] against answers[i] for every row. Either argument may hold a
+        single word, in which case it is compared with every row of the other.
+
+        :param answers: <required> Words accepted by to_array.
+        :param guesses: <required> Words accepted by to_array.
+        :return: <tuple> of (bulls, cows) int arrays
+        """
+        _answers = self.to_array(answers)
+        _guesses = self.to_array(guesses)
+        if len(_answers) != len(_guesses) and 1 not in (len(_answers), len(_guesses)):
+            raise ValueError("answers and guesses must have the same number of rows (or one row).")
+        return self._score(_answers, _guesses)
+
+    def score_matrix(self, answers=None, guesses=None):
+        """
+        Score every guess against every answer.
+
+        :param answers: <required> Words accepted by to_array.
+        :param guesses: <required> Words accepted by to_array.
+        :return: <tuple> of (bulls, cows) int arrays of shape (len(answers), len(guesses))
+        """
+        _answers = self.to_array(answers)
+        _guesses = self.to_array(guesses)
+        return self._score(_answers[:, None, :], _guesses[None, :, :])
+
+    def lookup(self, answers=None, guesses=None):
+        """
+        Score guesses against answers (row wise, as score does) using the score table.
+
+        :param answers: <required> Words accepted by to_array.
+        :param guesses: <required> Words accepted by to_array.
+        :return: <tuple> of (bulls, cows) int arrays
+        """
+        return self.decode(self.table[self.index(answers), self.index(guesses)])
+
+    def decode(self, codes=None):
+        """
+        Split score table codes into bulls and cows.
+
+        :param codes: <required> An array of codes from the score table.
+        :return: <tuple> of (bulls, cows) int arrays
+        """
+        return numpy.divmod(codes, self._digits + 1)
+
+    #
+    # 'private' methods
+    #
+    def _score(self, answers, guesses):
+        _match = answers == guesses
+        _in_word = (guesses[..., :, None] == answers[..., None, :]).any(axis=-1)
+        bulls = _match.sum(axis=-1)
+        cows = (_in_word & ~_match).sum(axis=-1)
+        return bulls, cows
+
+    def _build_table(self):
+        _space = self.space
+        if _space * _space > self.MAX_TABLE_CELLS:
+            raise ValueError(
+                "The score table for mode {} would hold {} cells which is more than {}; "
+                "use score or score_matrix instead.".format(
+                    self._mode.mode, _space * _space, self.MAX_TABLE_CELLS
+                )
+            )
+
+        # Rather than comparing every digit pair, look up whether each guess digit is
+        # present in the answer from a (space, base) presence matrix.
+        _words = self.words(numpy.arange(_space))
+        _present = numpy.zeros((_space, self._base), dtype=bool)
+        for position in range(self._digits):
+            _present[numpy.arange(_space), _words[:, position]] = True
+
+        _table = numpy.empty((_space, _space), dtype=numpy.uint8)
+        _chunk = max(1, self.TABLE_CHUNK_CELLS // (_space * self._digits))
+        for start in range(0, _space, _chunk):
+            _answers = _words[start:start + _chunk]
+            _match = _answers[:, None, :] == _words[None, :, :]
+            _in_word = _present[start:start + _chunk][:, _words]
+            bulls = _match.sum(axis=-1, dtype=numpy.uint8)
+            cows = (_in_word & ~_match).sum(axis=-1, dtype=numpy.uint8)
+            _table[start:start + _chunk] = bulls * numpy.uint8(self._digits + 1) + cows
+        return _table
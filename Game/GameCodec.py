@@ -0,0 +1,268 @@
+import base64
+import json
+import struct
+import uuid
+import zlib
+
+from Game.GameMode import GameMode
+from Game.PackedWord import PackedWord
+
+
+class GameCodec(object):
+    """
+    GameCodec - Encodes a GameObject into the payload given to a persister and decodes
+    a persisted payload back into a game dict which can be loaded by a GameController.
+
+    Two codecs are provided:
+
+    * json - the GameObject.dump() serialized as JSON text, with the mode replaced by
+      a reference (see GameModeRegistry.reference).
+    * binary - a versioned, struct packed record holding the key, status, ttl, guesses
+      made, the packed answer and a reference (the name) to the game mode, optionally
+      compressed with zlib (binary-zlib). The record is base64 encoded and prefixed
+      with "cb<version>:" so that every persister can store it as text.
+
+    Decoding does not depend on the codec configured: any payload (including JSON
+    written before codecs were introduced) is decoded according to its format, so the
+    codec can be changed on a running system.
+
+    Use GameCodec.get(name) to fetch a (shared) codec.
+
+    """
+    NAME = None
+    FIELDS = False  # True if the payload is a JSON object of the game's fields (see GameController.changes)
+
+    _codecs = {}
+
+    #
+    # Class methods
+    #
+    @classmethod
+    def get(cls, name=None):
+        """
+        Return the codec registered with a name.
+
+        :param name: <optional> The codec name (json, binary, binary-zlib) or a GameCodec
+        object (which is returned as-is); json if not provided.
+        :return: GameCodec
+        """
+        if isinstance(name, GameCodec):
+            return name
+        _codec = cls._codecs.get(name or JsonCodec.NAME, None)
+        if _codec is None:
+            raise ValueError(
+                "Codec {} is not known; valid codecs are {}".format(name, ", ".join(sorted(cls._codecs)))
+            )
+        return _codec
+
+    @classmethod
+    def names(cls):
+        return sorted(cls._codecs)
+
+    @classmethod
+    def register(cls, codec=None):
+        if not isinstance(codec, GameCodec):
+            raise TypeError("Only GameCodec objects can be registered.")
+        cls._codecs[codec.NAME] = codec
+        return codec
+
+    @classmethod
+    def decode_any(cls, payload=None, registry=None):
+        """
+        Decode a persisted payload whatever codec encoded it.
+
+        :param payload: <required> A str (or bytes) payload.
+        :param registry: <required> The GameModeRegistry used to resolve mode references.
+        :return: <dict> the game
+        """
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        if payload.startswith(BinaryCodec.PREFIX):
+            return BinaryCodec.decode_payload(payload, registry)
+        return json.loads(payload)
+
+    #
+    # 'public' methods
+    #
+    def encode(self, game=None, registry=None):
+        """
+        Encode a game for persistence.
+
+        :param game: <required> A GameObject.
+        :param registry: <required> The GameModeRegistry the game was played with.
+        :return: <str> the payload
+        """
+        raise NotImplementedError()
+
+    def decode(self, payload=None, registry=None):
+        """
+        Decode a payload; see decode_any.
+        """
+        return self.decode_any(payload=payload, registry=registry)
+
+
+class JsonCodec(GameCodec):
+    NAME = "json"
+    FIELDS = True
+
+    def encode(self, game=None, registry=None):
+        _game = game.dump()
+        if registry is not None:
+            _game["mode"] = registry.reference(game.mode)
+        return json.dumps(_game)
+
+
+class BinaryCodec(GameCodec):
+    """
+    The binary record (version 1) is:
+
+        >BB  version, flags
+        then, compressed if FLAG_ZLIB is set:
+        >BBHI  digit_type, digits, guesses_made, ttl
+        key     16 bytes (a uuid) or, if FLAG_KEY_TEXT is set, >H length + utf-8
+        status  >B code (see STATUSES) or 255, >B length + utf-8
+        answer  the packed answer, (digits * PackedWord.BITS + 7) // 8 bytes big endian
+        mode    >B length + utf-8 mode name or, if FLAG_MODE_EMBEDDED is set, >H
+                length + JSON of the GameMode dump (modes other than the built-in modes)
+
+    """
+    VERSION = 1
+    PREFIX = "cb"
+
+    FLAG_ZLIB = 1
+    FLAG_KEY_TEXT = 2
+    FLAG_MODE_EMBEDDED = 4
+
+    STATUSES = ("", "playing", "won", "lost", "waiting")
+    STATUS_TEXT = 255
+
+    _HEADER = struct.Struct(">BB")
+    _GAME = struct.Struct(">BBHI")
+
+    def __init__(self, compress=False):
+        self.NAME = "binary-zlib" if compress else "binary"
+        self._compress = compress
+
+    #
+    # Class methods
+    #
+    @classmethod
+    def decode_payload(cls, payload=None, registry=None):
+        _version, _, _armoured = payload[len(cls.PREFIX):].partition(":")
+        if _version != str(cls.VERSION):
+            raise ValueError("Game payload version {} is not supported".format(_version))
+
+        _record = base64.b64decode(_armoured)
+        _, _flags = cls._HEADER.unpack_from(_record)
+        _body = _record[cls._HEADER.size:]
+        if _flags & cls.FLAG_ZLIB:
+            _body = zlib.decompress(_body)
+
+        _digit_type, _digits, _guesses_made, _ttl = cls._GAME.unpack_from(_body)
+        _offset = cls._GAME.size
+
+        if _flags & cls.FLAG_KEY_TEXT:
+            _key, _offset = cls._unpack_text(_body, _offset, ">H")
+        else:
+            _key = str(uuid.UUID(bytes=_body[_offset:_offset + 16]))
+            _offset += 16
+
+        _status_code = struct.unpack_from(">B", _body, _offset)[0]
+        _offset += 1
+        if _status_code == cls.STATUS_TEXT:
+            _status, _offset = cls._unpack_text(_body, _offset, ">B")
+        else:
+            _status = cls.STATUSES[_status_code]
+
+        _answer_length = (_digits * PackedWord.BITS + 7) // 8
+        _packed = int.from_bytes(_body[_offset:_offset + _answer_length], "big")
+        _offset += _answer_length
+
+        if _flags & cls.FLAG_MODE_EMBEDDED:
+            _mode_json, _offset = cls._unpack_text(_body, _offset, ">H")
+            _mode = GameMode(**json.loads(_mode_json))
+        else:
+            _mode_name, _offset = cls._unpack_text(_body, _offset, ">B")
+            _mode = registry.resolve({"mode": _mode_name})
+
+        return {
+            "key": _key,
+            "status": _status,
+            "ttl": _ttl,
+            "answer": PackedWord.from_packed(_packed, _digits, wordtype=_digit_type),
+            "mode": _mode,
+            "guesses_made": _guesses_made
+        }
+
+    #
+    # 'public' methods
+    #
+    def encode(self, game=None, registry=None):
+        _flags = 0
+        _mode = game.mode
+
+        _body = [self._GAME.pack(_mode.digit_type, _mode.digits, game.guesses_made, game.ttl)]
+
+        _key_bytes = self._uuid_bytes(game.key)
+        if _key_bytes is not None:
+            _body.append(_key_bytes)
+        else:
+            _flags |= self.FLAG_KEY_TEXT
+            _body.append(self._pack_text(game.key, ">H"))
+
+        if game.status in self.STATUSES:
+            _body.append(struct.pack(">B", self.STATUSES.index(game.status)))
+        else:
+            _body.append(struct.pack(">B", self.STATUS_TEXT) + self._pack_text(game.status, ">B"))
+
+        _answer_length = (_mode.digits * PackedWord.BITS + 7) // 8
+        _body.append(game.answer.packed.to_bytes(_answer_length, "big"))
+
+        if self._is_registered(_mode, registry):
+            _body.append(self._pack_text(_mode.mode, ">B"))
+        else:
+            _flags |= self.FLAG_MODE_EMBEDDED
+            _body.append(self._pack_text(json.dumps(_mode.dump()), ">H"))
+
+        _body = b"".join(_body)
+        if self._compress:
+            _flags |= self.FLAG_ZLIB
+            _body = zlib.compress(_body)
+
+        return "{}{}:{}".format(
+            self.PREFIX,
+            self.VERSION,
+            base64.b64encode(self._HEADER.pack(self.VERSION, _flags) + _body).decode("ascii")
+        )
+
+    #
+    # 'private' methods
+    #
+    @staticmethod
+    def _is_registered(mode, registry):
+        return registry is not None and "digits" not in registry.reference(mode)
+
+    @staticmethod
+    def _uuid_bytes(key):
+        # Keys are uuids in canonical form unless a game was loaded from elsewhere.
+        try:
+            _uuid = uuid.UUID(key)
+        except (ValueError, TypeError, AttributeError):
+            return None
+        return _uuid.bytes if str(_uuid) == key else None
+
+    @staticmethod
+    def _pack_text(text, length_format):
+        _bytes = text.encode("utf-8")
+        return struct.pack(length_format, len(_bytes)) + _bytes
+
+    @staticmethod
+    def _unpack_text(body, offset, length_format):
+        _length = struct.unpack_from(length_format, body, offset)[0]
+        offset += struct.calcsize(length_format)
+        return body[offset:offset + _length].decode("utf-8"), offset + _length
+
+
+GameCodec.register(JsonCodec())
+GameCodec.register(BinaryCodec())
+GameCodec.register(BinaryCodec(compress=True))
@@ -1,10 +1,9 @@
-import copy
-import json
-
+from Game.GameCodec import GameCodec
 from Game.GameObject import GameObject
 from Game.GameMode import GameMode
+from Game.GameModeRegistry import GameModeRegistry
+from Game.PackedWord import PackedWord
 
-from python_digits import DigitWord
 from flask_helpers.VersionHelpers import VersionHelpers
 from python_cowbull_server import error_handler
 
@@ -28,18 +27,22 @@ class GameController(object):
     version_helper = VersionHelpers()
     STRINGY = version_helper.stringtype
 
-    def __init__(self, game_json=None, game_modes=None, mode=None):
+    def __init__(self, game_json=None, game_modes=None, mode=None, codec=None):
         """
         Initialize a GameController object to allow the game to be played. The controller
         creates a game object (see GameObject.py) and allows guesses to be made against
         the 'hidden' object.
 
         :param game_json: <optional>, if provided is a JSON serialized representation
-        of a game; if not provided a new game is instantiated.
+        of a game, an already decoded dict, or a GameObject; if not provided a new game
+        is instantiated.
         :param game_modes: <optional>, a list of GameMode objects representing game modes.
         :param mode: <optional>, the mode the game should be played in; may be a GameMode
         object or a str representing the name of a GameMode object already defined (e.g.
         passed via game_modes).
+        :param codec: <optional>, the GameCodec (or name of the codec, e.g. binary) used
+        by save to encode the game; json if not provided. Loading accepts a payload in
+        any codec's format.
         """
         # execute_load error handler
         self.handler = error_handler
@@ -48,6 +51,7 @@ class GameController(object):
 
         # Set defaults
         self.default_mode = None
+        self.codec = GameCodec.get(codec)
 
         # Dump parameters to log
         self.handler.log(message="Parameter game_modes: Value {} Type {}".format(game_modes, type(game_modes)))
@@ -56,7 +60,7 @@ class GameController(object):
 
         # execute_load game_modes
         self.handler.log(message="Setup game modes")
-        self._game_modes = None
+        self._registry = None
         self.load_modes(input_modes=game_modes)
 
         # execute_load any game passed
@@ -70,18 +74,18 @@ class GameController(object):
 
     @property
     def game_modes(self):
-        return sorted(self._game_modes, key=lambda x: x.priority)
+        return list(self._registry.modes)
 
     @property
     def game_mode_names(self):
-        return [game_mode.mode for game_mode in sorted(self._game_modes, key=lambda x: x.priority)]
+        return list(self._registry.names)
 
     #
     # 'public' methods
     #
 
     def find(self, mode_number):
-        return self._game_modes[mode_number]
+        return self._registry.find(mode_number)
 
     def guess(self, *args):
         """
@@ -116,10 +120,48 @@ class GameController(object):
 
         return response_object
 
+    def outcome(self, analysis, *args):
+        """
+        Build the response to a guess which has already been applied to the game by
+        the persister (e.g. by the atomic_guess of the Redis persister), which also
+        scored the guess. The game must be the game as saved after the guess.
+
+        :param analysis: The per digit analysis of the guess returned by the persister
+        (as PackedWord.compare, with digits as ints), or None if the guess was not
+        applied because the game is over or the digits are not valid.
+        :param args: The digits guessed, as passed to guess.
+        :return: A dictionary object detailing the analysis and results of the guess
+        """
+
+        self.handler.method = "outcome"
+        if self.game is None:
+            raise ValueError("The Game is unexpectedly undefined!")
+
+        response_object = {
+            "bulls": None,
+            "cows": None,
+            "analysis": None,
+            "status": None
+        }
+
+        if analysis is None:
+            if self._check_game_on(response_object):
+                # The persister found the digits invalid; report why.
+                self.game.answer.compare(PackedWord.parse(args, wordtype=self.game.mode.digit_type))
+                raise ValueError("The digits provided could not be compared with the answer.")
+            return response_object
+
+        if self.game.mode.digit_type == PackedWord.HEXDIGIT:
+            analysis = [dict(entry, digit="{:x}".format(entry["digit"])) for entry in analysis]
+        self._count(response_object, analysis)
+        self._describe(response_object)
+        return response_object
+
     def load(self, game_json=None, mode=None):
         """
         Load a game from a serialized JSON representation. The game expects a well defined
-        structure as follows (Note JSON string format):
+        structure as follows (Note JSON string format; the same structure may be passed as
+        an already decoded dict, or a GameObject may be passed and is used as-is):
 
         '{
             "guesses_made": int,
@@ -127,7 +169,7 @@ class GameController(object):
             "status": "str: one of playing, won, lost",
             "mode": {
                 "digits": int,
-                "digit_type": DigitWord.DIGIT | DigitWord.HEXDIGIT,
+                "digit_type": PackedWord.DIGIT | PackedWord.HEXDIGIT,
                 "mode": GameMode(),
                 "priority": int,
                 "help_text": str,
@@ -138,10 +180,12 @@ class GameController(object):
             "answer": [int|str0, int|str1, ..., int|strN]
         }'
 
-        * "mode" will be cast to a GameMode object
-        * "answer" will be cast to a DigitWord object
+        * "mode" will be cast to a GameMode object; it may also be a reference to a
+          registered mode, {"mode": str, "hash": str}, as written by save (see
+          GameModeRegistry.reference), in which case the registered GameMode is used
+        * "answer" will be cast to a PackedWord object
 
-        :param game_json: The source JSON - MUST be a string
+        :param game_json: The source JSON - a string, dict, or GameObject
         :param mode: A mode (str or GameMode) for the game being loaded
         :return: A game object
         """
@@ -157,24 +201,42 @@ class GameController(object):
         else:
             _game_object = self._load_game(game_json)
 
-        self.handler.log(message="Deep copy loaded (or new) object")
-        self.game = copy.deepcopy(_game_object)
+        # The game object is freshly built above, so it is not copied; copying it would
+        # also copy its GameMode, which is shared with the mode registry.
+        self.game = _game_object
 
     def save(self):
         """
-        Save returns a string of the JSON serialized game object.
+        Save returns a string of the serialized game object, encoded with the
+        controller's codec (JSON unless another codec was given).
+
+        :return: str of serialized data
+        """
 
-        :return: str of JSON serialized data
+        return self.codec.encode(game=self.game, registry=self._registry)
+
+    def changes(self):
         """
+        Return the fields of the game which a guess changes (guesses_made and status),
+        for persister.update, or None if the controller's codec does not store games
+        field by field and the whole game must be saved.
 
-        return json.dumps(self.game.dump())
+        :return: dict or None
+        """
+        if not self.codec.FIELDS:
+            return None
+        return {
+            "guesses_made": self.game.guesses_made,
+            "status": self.game.status
+        }
 
     def load_modes(self, input_modes=None):
         """
         Loads modes (GameMode objects) to be supported by the game object. Four default
         modes are provided (normal, easy, hard, and hex) but others could be provided
         either by calling load_modes directly or passing a list of GameMode objects to
-        the instantiation call.
+        the instantiation call. The modes are held in a GameModeRegistry which is built
+        once per process for any given list of input modes and shared thereafter.
 
         :param input_modes: A list of GameMode objects; nb: even if only one new GameMode
         object is provided, it MUST be passed as a list - for example, passing GameMode gm1
@@ -183,80 +245,10 @@ class GameController(object):
         :return: A list of GameMode objects (both defaults and any added).
         """
 
-        # Set default game modes
         self.handler.method = "load_modes"
-        self.handler.log(message="Loading default modes")
-        _modes = [
-            GameMode(
-                mode="Normal",
-                priority=20,
-                digits=4,
-                digit_type=DigitWord.DIGIT,
-                guesses_allowed=10,
-                help_text="This is the normal (default) game. You need to guess 4 digits "
-                          "in the right place and each digit must be a whole number "
-                          "between 0 and 9. There are 10 tries to guess the "
-                          "correct answer.",
-                instruction_text="Enter 4 digits, each digit between 0 and 9 "
-                                 "(0, 1, 2, 3, 4, 5, 6, 7, 8, and 9)."
-            ),
-            GameMode(
-                mode="Easy",
-                priority=10,
-                digits=3,
-                digit_type=DigitWord.DIGIT,
-                guesses_allowed=6,
-                help_text="Easy. You need to guess 3 digits in the right place and each "
-                          "digit must be a whole number between 0 and 9. There are "
-                          "6 tries to guess the correct answer.",
-                instruction_text="Enter 3 digits, each digit between 0 and 9 "
-                                 "(0, 1, 2, 3, 4, 5, 6, 7, 8, and 9)."
-            ),
-            GameMode(
-                mode="Hard",
-                priority=30,
-                digits=6,
-                digit_type=DigitWord.DIGIT,
-                guesses_allowed=6,
-                help_text="Hard. You need to guess 6 digits in the right place and each "
-                          "digit must be a whole number between 0 and 9. There are "
-                          "only 6 tries to guess the correct answer.",
-                instruction_text="Enter 6 digits, each digit between 0 and 9 "
-                                 "(0, 1, 2, 3, 4, 5, 6, 7, 8, and 9)."
-            ),
-            GameMode(
-                mode="Hex",
-                priority=40,
-                digits=4,
-                digit_type=DigitWord.HEXDIGIT,
-                guesses_allowed=10,
-                help_text="Hex. You need to guess 4 digits in the right place and each "
-                          "digit must be a hexidecimal number between 0 and F. There are "
-                          "10 tries to guess the correct answer.",
-                instruction_text="Enter 4 digits, each digit between 0 and F "
-                                 "(0, 1, 2, 3, 4, 5, 6, 7, 8, 9, A, B, C, D, "
-                                 "E, and F)."
-            )
-        ]
-        self.handler.log(message="Loaded modes: {}".format(_modes))
-
-        if input_modes is not None:
-            if not isinstance(input_modes, list):
-                raise TypeError("Expected list of input_modes")
-
-            for mode in input_modes:
-                if not isinstance(mode, GameMode):
-                    _mode = GameMode(**mode)
-                else:
-                    _mode = mode
-                self.handler.log(
-                    message="Appending mode: {}".format(mode)
-                )
-                _modes.append(_mode)
-
-        self.handler.log(message="Deep copying modes")
-        self._game_modes = copy.deepcopy(_modes)
-        self.default_mode = "Normal"
+        self.handler.log(message="Fetching mode registry")
+        self._registry = GameModeRegistry.get(input_modes=input_modes)
+        self.default_mode = self._registry.default_mode
 
     #
     # 'private' methods
@@ -295,10 +287,10 @@ class GameController(object):
     ):
         self.handler.log(message="Game is valid and in play")
 
-        guess_made = DigitWord(*args, wordtype=self.game.mode.digit_type)
+        guess_made = PackedWord.parse(args, wordtype=self.game.mode.digit_type)
         self.handler.log(
-            message="Created DigitWord using digits provided: Value {} Type {}"
-                .format(guess_made.word, type(guess_made))
+            message="Created PackedWord using digits provided: Value {}"
+                .format(guess_made.digits)
         )
 
         self.handler.log(message="Comparing guess and answer")
@@ -306,40 +298,44 @@ class GameController(object):
 
         self.handler.log(message="Increment number of guesses made")
         self.game.guesses_made += 1
-        response_object["bulls"] = 0
-        response_object["cows"] = 0
-        response_object["analysis"] = []
-
-        self.handler.log(message="Process comparison analysis")
-        for comparison_object in comparison:
-            self.handler.log(message="Processing index {} value {}".format(
-                comparison_object.index,
-                comparison_object.digit
-            ))
-            if comparison_object.match:
-                response_object["bulls"] += 1
-            elif comparison_object.in_word:
-                response_object["cows"] += 1
-            response_object["analysis"].append(comparison_object.get_object())
+        self._count(response_object, comparison)
 
         if response_object["bulls"] == self.game.mode.digits:
             self.game.status = self.GAME_WON
             self.game.guesses_made = self.game.mode.guesses_allowed
-            response_object["status"] = self._start_again_message(
-                "Congratulations, you win!"
-            )
             self.handler.log(
                 message="The game has been won with the answers: {}"
                     .format(guess_made.word)
             )
         elif self.game.guesses_remaining < 1:
             self.game.status = self.GAME_LOST
+            self.handler.log(method="guess", message="Game lost.")
+        else:
+            self.game_status = self.GAME_PLAYING
+        self._describe(response_object)
+
+    def _count(self, response_object, comparison):
+        self.handler.log(message="Process comparison analysis")
+        response_object["bulls"] = 0
+        response_object["cows"] = 0
+        response_object["analysis"] = comparison
+        for comparison_object in comparison:
+            if comparison_object["match"]:
+                response_object["bulls"] += 1
+            elif comparison_object["in_word"]:
+                response_object["cows"] += 1
+
+    def _describe(self, response_object):
+        # The status message of a guess, from the state of the game after it.
+        if self.game.status == self.GAME_WON:
+            response_object["status"] = self._start_again_message(
+                "Congratulations, you win!"
+            )
+        elif self.game.status == self.GAME_LOST:
             response_object["status"] = self._start_again_message(
                 "Sorry, you lost!"
             )
-            self.handler.log(method="guess", message="Game lost.")
         else:
-            self.game_status = self.GAME_PLAYING
             response_object["status"] = "You have {} bulls and {} cows".format(
                 response_object["bulls"],
                 response_object["cows"]
@@ -351,19 +347,26 @@ class GameController(object):
 
     def _load_game(self, game_json):
         self.handler.log(message="JSON provided")
-        if not isinstance(game_json, self.STRINGY):
-            raise TypeError("Game must be passed as a serialized JSON string.")
-
-        self.handler.log(message="Attempting to execute_load")
-        game_dict = json.loads(game_json)
+        if isinstance(game_json, GameObject):
+            self.handler.log(message="GameObject provided; using it as-is")
+            return game_json
+        elif isinstance(game_json, dict):
+            game_dict = game_json
+        elif isinstance(game_json, self.STRINGY):
+            self.handler.log(message="Attempting to execute_load")
+            game_dict = GameCodec.decode_any(payload=game_json, registry=self._registry)
+        else:
+            raise TypeError("Game must be passed as a serialized JSON string, a dict, or a GameObject.")
 
         self.handler.log(message="Validating mode exists in JSON")
         if not 'mode' in game_dict:
             raise ValueError("Mode is not provided in JSON; game_json cannot be loaded!")
 
-        _mode = GameMode(**game_dict["mode"])
+        _mode = game_dict["mode"]
+        if not isinstance(_mode, GameMode):
+            _mode = self._registry.resolve(_mode)
 
-        if len(game_dict["answer"]) != game_dict["mode"]["digits"]:
+        if len(game_dict["answer"]) != _mode.digits:
             raise ValueError("JSON provided answer does not match the JSON game mode")
 
         _game_object = GameObject(mode=_mode, source_game=game_dict)
@@ -385,30 +388,14 @@ class GameController(object):
                 raise TypeError("Game mode must be a GameMode or string")
         else:
             self.handler.log(message="Game mode is None, so default mode used.")
-            _game_object = GameObject(mode=self._game_modes[0])
+            _game_object = GameObject(mode=self._registry.find(0))
         _game_object.status = self.GAME_PLAYING
         return _game_object
 
     def _match_mode(self, mode):
         self.handler.method = "_match_mode"
         self.handler.log(message="Attempting to match mode: {}".format(mode))
-        _mode = [game_mode for game_mode in self._game_modes if game_mode.mode == mode]
-
-        if len(_mode) < 1:
-            self.handler.log(method="_match_mode", message="No match found for: {}".format(mode))
-            raise ValueError("Mode {} not found - has it been initiated?".format(mode))
-
-        _mode = _mode[0]
-        if not _mode:
-            self.handler.log(
-                message="Something unexpected happened while matching mode: {}".format(mode)
-            )
-            raise ValueError("For some reason, the mode is defined but unavailable!")
-
-        self.handler.log(
-            message="Returning mode: {}, value: {}".format(mode, _mode.dump())
-        )
-        return _mode
+        return self._registry.match(mode)
 
     def _start_again_message(self, message=None):
         """Simple method to form a start again message and give the answer in readable form."""
@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 from python_cowbull_server import error_handler
 from flask_helpers.check_kwargs import check_kwargs
 
@@ -31,6 +34,8 @@ class GameMode(object):
         :param guesses_allowed: <int> Number of guesses permitted.
         :param instruction_text: <str> Instruction text (dependent upon caller to show)
         :param help_text: <str> Help text (dependent upon caller to show)
+        :param ttl: <int> Seconds a game in this mode is kept after it was last played;
+        if not given, GameObject.TTL.
 
         """
 
@@ -42,7 +47,8 @@ class GameMode(object):
                 "digit_type",
                 "guesses_allowed",
                 "instruction_text",
-                "help_text"
+                "help_text",
+                "ttl"
             ],
             caller="GameMode__init__",
             **kwargs
@@ -55,6 +61,7 @@ class GameMode(object):
         guesses_allowed=kwargs.get("guesses_allowed", None)
         instruction_text=kwargs.get("instruction_text", None)
         help_text=kwargs.get("help_text", None)
+        ttl=kwargs.get("ttl", None)
 
         # execute_load error handler
 #        self.handler = ErrorHandler(module="GameMode", method="__init__")
@@ -71,6 +78,7 @@ class GameMode(object):
         self._guesses_allowed = None
         self._instruction_text = None
         self._help_text = None
+        self._ttl = None
 
         # NOTICE: Properties are used to set 'private' fields (e.g. _mode) to handle
         # data validation in one place. When adding a new parameter to __init__ ensure
@@ -85,6 +93,7 @@ class GameMode(object):
         self.guesses_allowed = guesses_allowed
         self.instruction_text = instruction_text
         self.help_text = help_text
+        self.ttl = ttl
 
         self.handler.log(message="Mode {} created: {}".format(mode, self.dump()))
 
@@ -222,15 +231,43 @@ class GameMode(object):
             keyword="help_text", required=False, datatype=str, value=value
         )
 
+    @property
+    def ttl(self):
+        """
+        Seconds a game in this mode is kept after it was last played, or None for the
+        default (GameObject.TTL).
+
+        :return: <int>
+        """
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, value):
+        self._ttl = self._property_setter(
+            keyword="ttl", required=False, datatype=int, value=value
+        )
+        if self._ttl is not None and self._ttl < 1:
+            raise ValueError("ttl must be greater than 0.")
+
+    @property
+    def fingerprint(self):
+        """
+        A hash of the content of the mode, used to check that a mode referenced by name
+        (e.g. in a saved game) is the same mode as the one known by that name.
+        :return: <str>
+        """
+        return self.fingerprint_dump(self.dump())
+
     #
     # 'public' methods
     #
     def dump(self):
         """
-        Dump (convert to a dict) the GameMode object
+        Dump (convert to a dict) the GameMode object. The ttl is only included if it
+        is set, so that the dumps (and fingerprints) of modes without one are unchanged.
         :return: <dict>
         """
-        return {
+        _dump = {
             "mode": self._mode,
             "priority": self._priority,
             "digits": self._digits,
@@ -239,6 +276,21 @@ class GameMode(object):
             "instruction_text": self._instruction_text,
             "help_text": self._help_text
         }
+        if self._ttl is not None:
+            _dump["ttl"] = self._ttl
+        return _dump
+
+    @staticmethod
+    def fingerprint_dump(mode_dump):
+        """
+        Return the fingerprint of a dumped mode without building the GameMode.
+
+        :param mode_dump: <required> A dict as returned by dump.
+        :return: <str>
+        """
+        return hashlib.sha1(
+            json.dumps(mode_dump, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
 
     #
     # 'private' methods
@@ -0,0 +1,240 @@
+from collections import OrderedDict
+
+from Game.GameMode import GameMode
+
+from python_digits import DigitWord
+from python_cowbull_server import error_handler
+
+
+class GameModeRegistry(object):
+    """
+    GameModeRegistry - An immutable, name keyed collection of GameMode objects.
+
+    Building the four default modes (and any custom modes) involves validating every
+    property of every mode, so the registry is built once per worker and shared by
+    every GameController created afterwards. Use GameModeRegistry.get() rather than
+    instantiating the class directly so that the cached registry is returned.
+
+    """
+    DEFAULT_MODE = "Normal"     # The name of the mode used when none is requested.
+    CACHE_LIMIT = 16            # Maximum number of distinct registries kept per process.
+
+    # The default modes supported by the game. Custom modes are appended to these.
+    DEFAULT_MODES = [
+        {
+            "mode": "Normal",
+            "priority": 20,
+            "digits": 4,
+            "digit_type": DigitWord.DIGIT,
+            "guesses_allowed": 10,
+            "help_text": "This is the normal (default) game. You need to guess 4 digits "
+                         "in the right place and each digit must be a whole number "
+                         "between 0 and 9. There are 10 tries to guess the "
+                         "correct answer.",
+            "instruction_text": "Enter 4 digits, each digit between 0 and 9 "
+                                "(0, 1, 2, 3, 4, 5, 6, 7, 8, and 9)."
+        },
+        {
+            "mode": "Easy",
+            "priority": 10,
+            "digits": 3,
+            "digit_type": DigitWord.DIGIT,
+            "guesses_allowed": 6,
+            "help_text": "Easy. You need to guess 3 digits in the right place and each "
+                         "digit must be a whole number between 0 and 9. There are "
+                         "6 tries to guess the correct answer.",
+            "instruction_text": "Enter 3 digits, each digit between 0 and 9 "
+                                "(0, 1, 2, 3, 4, 5, 6, 7, 8, and 9)."
+        },
+        {
+            "mode": "Hard",
+            "priority": 30,
+            "digits": 6,
+            "digit_type": DigitWord.DIGIT,
+            "guesses_allowed": 6,
+            "help_text": "Hard. You need to guess 6 digits in the right place and each "
+                         "digit must be a whole number between 0 and 9. There are "
+                         "only 6 tries to guess the correct answer.",
+            "instruction_text": "Enter 6 digits, each digit between 0 and 9 "
+                                "(0, 1, 2, 3, 4, 5, 6, 7, 8, and 9)."
+        },
+        {
+            "mode": "Hex",
+            "priority": 40,
+            "digits": 4,
+            "digit_type": DigitWord.HEXDIGIT,
+            "guesses_allowed": 10,
+            "help_text": "Hex. You need to guess 4 digits in the right place and each "
+                         "digit must be a hexidecimal number between 0 and F. There are "
+                         "10 tries to guess the correct answer.",
+            "instruction_text": "Enter 4 digits, each digit between 0 and F "
+                                "(0, 1, 2, 3, 4, 5, 6, 7, 8, 9, A, B, C, D, "
+                                "E, and F)."
+        }
+    ]
+
+    _registries = OrderedDict()
+
+    def __init__(self, input_modes=None):
+        """
+        Build a registry from the default modes plus any input_modes provided.
+
+        :param input_modes: <optional> A list of GameMode objects or dicts of GameMode
+        parameters; nb: even if only one mode is provided, it MUST be passed as a list.
+        """
+        self.handler = error_handler
+        self.handler.module = "GameModeRegistry"
+        self.handler.method = "__init__"
+
+        if input_modes is not None and not isinstance(input_modes, list):
+            raise TypeError("Expected list of input_modes")
+
+        self.handler.log(message="Loading default modes")
+        _modes = [GameMode(**mode) for mode in self.DEFAULT_MODES]
+
+        for mode in input_modes or []:
+            if not isinstance(mode, GameMode):
+                _mode = GameMode(**mode)
+            else:
+                _mode = mode
+            self.handler.log(message="Appending mode: {}".format(mode))
+            _modes.append(_mode)
+
+        # If a custom mode re-uses a name, the first definition wins (as it always
+        # did when modes were matched by scanning the list).
+        _by_name = {}
+        for _mode in _modes:
+            _by_name.setdefault(_mode.mode, _mode)
+
+        self._modes = tuple(_modes)
+        self._by_name = _by_name
+        self._fingerprints = dict((_name, _mode.fingerprint) for _name, _mode in _by_name.items())
+        self._builtin = frozenset(mode["mode"] for mode in self.DEFAULT_MODES)
+        self._sorted = tuple(sorted(_modes, key=lambda x: x.priority))
+        self._names = tuple(_mode.mode for _mode in self._sorted)
+        self.handler.log(message="Registry built with modes: {}".format(self._names))
+
+    #
+    # Class methods
+    #
+    @classmethod
+    def get(cls, input_modes=None):
+        """
+        Return the registry for the default modes plus input_modes, building it only if
+        an identical list of input modes has not been seen before by this process.
+
+        :param input_modes: <optional> A list of GameMode objects or dicts (see __init__).
+        :return: A GameModeRegistry
+        """
+        if input_modes is None:
+            _cache_key = None
+        elif isinstance(input_modes, list):
+            _cache_key = (id(input_modes),) + tuple(id(mode) for mode in input_modes)
+        else:
+            raise TypeError("Expected list of input_modes")
+
+        _cached = cls._registries.get(_cache_key, None)
+        if _cached is not None:
+            return _cached[1]
+
+        _registry = cls(input_modes=input_modes)
+
+        # Hold a reference to the input list so its id cannot be reused by another
+        # object while the entry is cached.
+        cls._registries[_cache_key] = (input_modes, _registry)
+        while len(cls._registries) > cls.CACHE_LIMIT:
+            cls._registries.popitem(last=False)
+        return _registry
+
+    #
+    # Properties
+    #
+    @property
+    def modes(self):
+        """The GameMode objects sorted by priority. :return: <tuple>"""
+        return self._sorted
+
+    @property
+    def names(self):
+        """The mode names sorted by priority. :return: <tuple>"""
+        return self._names
+
+    @property
+    def default_mode(self):
+        return self.DEFAULT_MODE
+
+    #
+    # 'public' methods
+    #
+    def find(self, mode_number):
+        """Return the mode at position mode_number in the order the modes were loaded."""
+        return self._modes[mode_number]
+
+    def match(self, mode):
+        """
+        Return the GameMode named mode.
+
+        :param mode: <str> the name of the mode.
+        :return: GameMode
+        """
+        _mode = self._by_name.get(mode, None)
+        if _mode is None:
+            self.handler.log(method="match", message="No match found for: {}".format(mode))
+            raise ValueError("Mode {} not found - has it been initiated?".format(mode))
+        return _mode
+
+    def reference(self, mode):
+        """
+        Return the representation of a mode stored in a saved game: the mode name and
+        fingerprint for the built-in modes or, for any other mode, the full mode (so
+        that games in custom modes still load if the mode is later removed).
+
+        :param mode: <required> A GameMode.
+        :return: <dict>
+        """
+        _fingerprint = mode.fingerprint
+        if mode.mode in self._builtin and self._fingerprints.get(mode.mode, None) == _fingerprint:
+            return {"mode": mode.mode, "hash": _fingerprint}
+        _reference = mode.dump()
+        _reference["hash"] = _fingerprint
+        return _reference
+
+    def resolve(self, reference):
+        """
+        Return the GameMode for a mode stored in a saved game, i.e. a dict returned by
+        reference() or (for games saved before references were used) a full mode
+        dump. The registry's own GameMode is returned if it is the same mode;
+        otherwise a GameMode is built from the full mode, if the game holds one.
+
+        :param reference: <required> A dict.
+        :return: GameMode
+        """
+        if not isinstance(reference, dict) or "mode" not in reference:
+            raise ValueError("The game mode reference is malformed: {}".format(reference))
+
+        _name = reference["mode"]
+        _embedded = dict((k, v) for k, v in reference.items() if k != "hash")
+        _fingerprint = reference.get("hash", None)
+        if _fingerprint is None and len(_embedded) > 1:
+            _fingerprint = GameMode.fingerprint_dump(_embedded)
+
+        _mode = self._by_name.get(_name, None)
+        if _mode is not None and _fingerprint == self._fingerprints[_name]:
+            return _mode
+        if len(_embedded) > 1:
+            return GameMode(**_embedded)
+        if _mode is not None:
+            # Only the name was saved, and the mode has changed since; play on with
+            # the mode as it is now defined.
+            self.handler.log(method="resolve", message="Mode {} has changed since the game was saved".format(_name))
+            return _mode
+        raise ValueError("Mode {} not found - has it been initiated?".format(_name))
+
+    def __contains__(self, mode):
+        return mode in self._by_name
+
+    def __iter__(self):
+        return iter(self._sorted)
+
+    def __len__(self):
+        return len(self._modes)
@@ -1,6 +1,6 @@
 import uuid
-from python_digits.DigitWord import DigitWord
 from Game.GameMode import GameMode
+from Game.PackedWord import PackedWord
 
 
 class GameObject(object):
@@ -19,18 +19,21 @@ class GameObject(object):
             "status": "str: one of playing, won, lost",
             "mode": {
                 "digits": int,
-                "digit_type": DigitWord.DIGIT | DigitWord.HEXDIGIT,
+                "digit_type": PackedWord.DIGIT | PackedWord.HEXDIGIT,
                 "mode": GameMode(),
                 "priority": int,
                 "help_text": str,
                 "instruction_text": str,
-                "guesses_allowed": int
+                "guesses_allowed": int,
+                "ttl": int (optional)
             },
             "ttl": int,
             "answer": [int|str0, int|str1, ..., int|strN]
         }
 
     """
+    TTL = 3600  # Time to live (seconds) of a new game, unless its mode has a ttl
+
     def __init__(
             self,
             mode=None,
@@ -46,7 +49,7 @@ class GameObject(object):
         self._key = None                    # A Unique ID
         self._status = None                 # A representation of status (e.g. won, playing, etc.)
         self._ttl = None                    # Time to live - a representation of time in seconds
-        self._answer = None                 # A DigitWord object containing the answer
+        self._answer = None                 # A PackedWord object containing the answer
         self._mode = None                   # A GameMode object containing the mode of the current game
         self._guesses_remaining = None      # How many guesses are remaining -- calculated field
         self._guesses_made = None           # How many guesses have been made
@@ -54,7 +57,7 @@ class GameObject(object):
         if source_game:
             # There is a JSON game object, so a game should be loaded. Typically the JSON
             # will have been provided by a persister outside this object, e.g. Redis.
-            self.load(source=source_game)
+            self.load(source=source_game, mode=mode)
         else:
             # There is no JSON game, so a new game should be created using the mode provided
             # in the instantiation.
@@ -109,7 +112,7 @@ class GameObject(object):
     def dump(self):
         """
         Dump (return) a dict representation of the GameObject. This is a Python
-        dict and is NOT serialized. NB: the answer (a DigitWord object) and the
+        dict and is NOT serialized. NB: the answer (a PackedWord object) and the
         mode (a GameMode object) are converted to python objects of a list and
         dict respectively.
 
@@ -125,12 +128,14 @@ class GameObject(object):
             "guesses_made": self._guesses_made
         }
 
-    def load(self, source=None):
+    def load(self, source=None, mode=None):
         """
         Load the representation of a GameObject from a Python <dict> representing
         the game object.
 
         :param source: a Python <dict> as detailed above.
+        :param mode: <optional> A GameMode object already built from source["mode"];
+        if not provided, the mode is taken (or built) from the dict.
 
         :return:
         """
@@ -149,11 +154,16 @@ class GameObject(object):
         if not all(key in source for key in required_keys):
             raise ValueError("The dictionary passed is malformed: {}".format(source))
 
-        _mode = GameMode(**source["mode"])
+        _mode = mode or source["mode"]
+        if not isinstance(_mode, GameMode):
+            _mode = GameMode(**_mode)
         self._key = source["key"]
         self._status = source["status"]
         self._ttl = source["ttl"]
-        self._answer = DigitWord(*source["answer"], wordtype=_mode.digit_type)
+        _answer = source["answer"]
+        if not isinstance(_answer, PackedWord):
+            _answer = PackedWord.parse(_answer, wordtype=_mode.digit_type)
+        self._answer = _answer
         self._mode = _mode
         self._guesses_made = source["guesses_made"]
 
@@ -180,13 +190,10 @@ class GameObject(object):
                 "The mode passed to the game is not a GameMode!"
             )
 
-        dw = DigitWord(wordtype=mode.digit_type)
-        dw.random(mode.digits)
-
         self._key = str(uuid.uuid4())
         self._status = ""
-        self._ttl = 3600
-        self._answer = dw
+        self._ttl = mode.ttl or self.TTL
+        self._answer = PackedWord.random(mode.digits, wordtype=mode.digit_type)
         self._mode = mode
         self._guesses_remaining = mode.guesses_allowed
         self._guesses_made = 0
@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+import uuid
+
+from collections import deque
+
+from Game.GameController import GameController
+from Game.GameModeRegistry import GameModeRegistry
+from Game.GameObject import GameObject
+from Game.PackedWord import PackedWord
+
+from python_cowbull_server import error_handler
+
+
+class GamePool(object):
+    """
+    GamePool - A bounded pool of ready made new games for each game mode, filled by a
+    background thread, so that creating a game is (usually) a pop from the pool.
+
+    Games are generated in batches: the answers and the keys (uuid4) of a whole batch
+    are drawn from os.urandom in bulk rather than one call per game. When a pool falls below REFILL_FRACTION
+    of its depth the filler thread is woken to top it up; if a pool is empty, take()
+    returns None and the caller creates the game synchronously as before.
+
+    Pooled games are not persisted until they are handed out, so a game's ttl starts
+    when a player receives it rather than when it was generated.
+
+    The pool is per process. Games generated before a fork are discarded by the child
+    (so that two workers never hand out the same game) and the filler thread is started
+    in whichever process first uses the pool.
+
+    Use GamePool.from_config() to fetch the pool configured for the app.
+
+    """
+    REFILL_FRACTION = 0.5   # Wake the filler when a pool falls below this fraction of its depth.
+    BATCH_SIZE = 256        # The most games generated from one call for entropy.
+    IDLE_WAIT = 1.0         # Seconds the filler sleeps when no pool needs filling.
+
+    _BASES = {PackedWord.DIGIT: 10, PackedWord.HEXDIGIT: 16}
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, depth=None, input_modes=None):
+        """
+        :param depth: <required> The number of games to hold for each mode; either an
+        int (the same depth for every mode) or a dict of mode name to depth. Modes
+        with a depth of 0 (or not in the dict) are not pooled.
+        :param input_modes: <optional> The custom modes (see GameModeRegistry.get)
+        """
+        self.handler = error_handler
+        self.handler.module = "GamePool"
+        self.handler.method = "__init__"
+
+        self._registry = GameModeRegistry.get(input_modes=input_modes)
+        self._input_modes = input_modes
+
+        if isinstance(depth, int):
+            _depths = dict((name, depth) for name in self._registry.names)
+        elif isinstance(depth, dict):
+            _depths = dict(depth)
+        else:
+            raise TypeError("The pool depth must be an int or a dict of mode names to ints.")
+
+        for name, _depth in _depths.items():
+            if name not in self._registry:
+                raise ValueError("Mode {} not found - has it been initiated?".format(name))
+            if not isinstance(_depth, int) or _depth < 0:
+                raise ValueError("The pool depth for mode {} must be a whole number.".format(name))
+
+        self._depths = dict((name, _depth) for name, _depth in _depths.items() if _depth > 0)
+        self._games = dict((name, deque()) for name in self._depths)
+        self._stats = dict(
+            (name, {"taken": 0, "misses": 0, "generated": 0, "refill_rate": None})
+            for name in self._depths
+        )
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = os.getpid()
+
+    #
+    # Class methods
+    #
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Return the (shared) pool for the Flask app configuration, or None if
+        COWBULL_POOL_DEPTH is not set.
+
+        :param config: <required> The Flask app config.
+        :return: GamePool or None
+        """
+        _depth = config.get("COWBULL_POOL_DEPTH", None)
+        if not _depth:
+            return None
+        _input_modes = config.get("COWBULL_CUSTOM_MODES", None)
+
+        _cache_key = (repr(_depth), id(_input_modes))
+        with cls._pools_lock:
+            _pool = cls._pools.get(_cache_key, None)
+            if _pool is None or _pool._input_modes is not _input_modes:
+                _pool = cls(depth=_depth, input_modes=_input_modes)
+                cls._pools[_cache_key] = _pool
+        return _pool
+
+    #
+    # Properties
+    #
+    @property
+    def modes(self):
+        """The names of the modes which are pooled. :return: <list>"""
+        return sorted(self._depths)
+
+    #
+    # 'public' methods
+    #
+    def take(self, mode=None):
+        """
+        Take a new game from the pool.
+
+        :param mode: <optional> The name of the mode; the default mode if not provided.
+        :return: GameObject, or None if the mode is not pooled or its pool is empty.
+        """
+        _games = self.take_many(mode=mode, count=1)
+        return _games[0] if _games else None
+
+    def take_many(self, mode=None, count=1):
+        """
+        Take up to count new games of a mode from the pool. Fewer (possibly no) games
+        are returned if the pool holds fewer; the caller makes up the difference.
+
+        :param mode: <optional> The name of the mode; the default mode if not provided.
+        :param count: <optional> The number of games wanted.
+        :return: <list> of GameObject
+        """
+        _name = mode or self._registry.default_mode
+        _pool = self._games.get(_name, None)
+        if _pool is None:
+            return []
+
+        self._ensure_running()
+        _taken = []
+        while len(_taken) < count:
+            try:
+                _taken.append(_pool.popleft())
+            except IndexError:
+                break
+
+        with self._lock:
+            self._stats[_name]["taken"] += len(_taken)
+            self._stats[_name]["misses"] += count - len(_taken)
+
+        if len(_pool) < self._depths[_name] * self.REFILL_FRACTION:
+            self._wake.set()
+        return _taken
+
+    def fill(self, mode=None):
+        """
+        Fill the pool for a mode (or every pooled mode) up to its depth, in this thread.
+
+        :param mode: <optional> The name of the mode.
+        :return: <int> the number of games generated
+        """
+        _generated = 0
+        for _name in ([mode] if mode else self.modes):
+            _pool = self._games[_name]
+            _mode = self._registry.match(_name)
+            while len(_pool) < self._depths[_name]:
+                _count = min(self.BATCH_SIZE, self._depths[_name] - len(_pool))
+                _started = time.time()
+                _pool.extend(self._generate(_mode, _count))
+                _elapsed = time.time() - _started
+                _generated += _count
+                with self._lock:
+                    self._stats[_name]["generated"] += _count
+                    self._stats[_name]["refill_rate"] = round(_count / _elapsed, 1) if _elapsed > 0 else None
+        return _generated
+
+    def stats(self):
+        """
+        Return the pool metrics for each pooled mode: the configured depth, the number
+        of games currently pooled, the number of games taken from and generated into
+        the pool, the number of games which had to be created synchronously (misses),
+        and the rate (games per second) at which the most recent batch was generated.
+
+        :return: <dict>
+        """
+        with self._lock:
+            return dict(
+                (
+                    _name,
+                    dict(self._stats[_name], depth=self._depths[_name], size=len(self._games[_name]))
+                )
+                for _name in self._depths
+            )
+
+    #
+    # 'private' methods
+    #
+    def _ensure_running(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Games generated in the parent process would also be handed out by
+                # every other child, so they are discarded.
+                for _pool in self._games.values():
+                    _pool.clear()
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="GamePool")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while self._pid == os.getpid():
+            try:
+                self.fill()
+            except Exception as e:
+                self.handler.log(method="_run", message="Unable to fill the game pool: {}".format(str(e)))
+            self._wake.wait(self.IDLE_WAIT)
+            self._wake.clear()
+
+    def _generate(self, mode, count):
+        _keys = os.urandom(16 * count)
+        _answers = self._random_digits(self._BASES[mode.digit_type], mode.digits * count)
+        _games = []
+        for idx in range(count):
+            _answer = _answers[idx * mode.digits:(idx + 1) * mode.digits]
+            _games.append(GameObject(
+                mode=mode,
+                source_game={
+                    "key": str(uuid.UUID(bytes=_keys[idx * 16:(idx + 1) * 16], version=4)),
+                    "status": GameController.GAME_PLAYING,
+                    "ttl": mode.ttl or GameObject.TTL,
+                    "answer": PackedWord(_answer, wordtype=mode.digit_type),
+                    "mode": mode,
+                    "guesses_made": 0
+                }
+            ))
+        return _games
+
+    @staticmethod
+    def _random_digits(base, count):
+        # Digits are taken from bytes below the largest multiple of base so that
+        # every digit is equally likely.
+        _limit = 256 - 256 % base
+        _digits = []
+        while len(_digits) < count:
+            _needed = count - len(_digits)
+            _digits.extend(b % base for b in bytearray(os.urandom(_needed + _needed // 4 + 8)) if b < _limit)
+        return _digits[:count]
@@ -0,0 +1,225 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+from collections import OrderedDict
+from cryptography.fernet import Fernet, InvalidToken
+
+from Game.GameModeRegistry import GameModeRegistry
+from Game.PackedWord import PackedWord
+from Persistence.VersionConflict import VersionConflict
+
+
+class GameToken(object):
+    """
+    GameToken - Serializes the full state of a game into an encrypted, signed token
+    which the client holds instead of the server persisting the game.
+
+    The token carries the game key (a uuid), the mode name, the packed answer, the
+    number of guesses made, the status, and the time the game was created. It is a
+    Fernet token (AES-128-CBC with an HMAC-SHA256, from the cryptography package), so
+    the answer cannot be read by the client and the token cannot be altered. Every
+    guess returns a new token with the guess counter incremented.
+
+    Expiry is enforced twice: a token is rejected if it was issued more than max_age
+    seconds ago, and a game is rejected once its ttl has passed since it was created,
+    however recently the token was re-issued.
+
+    So that a client cannot re-present an earlier token of its game (resetting the
+    guesses made), the highest guess counter issued for each game is remembered until
+    the game expires, and a token with a lower counter is rejected. A token is only
+    replaced by one guess: the counter is advanced from the token's counter in one
+    compare-and-set, so if the same token is presented by concurrent requests, only
+    the first to be issued a new token succeeds. The counters are kept in memory,
+    shared by every GameToken of the process (the most recent MAX_COUNTERS games),
+    which protects a single process; pass a persister (COWBULL_TOKEN_COUNTERS=persister)
+    to share them between every worker and server.
+
+    """
+    SALT = "cowbull-game-token"
+    COUNTER_PREFIX = "cowbull-token-counter-"
+    MAX_COUNTERS = 100000   # Games whose counters are held in memory
+
+    _counters = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, secret=None, max_age=3600, persister=None):
+        """
+        :param secret: <required> The secret used to derive the encryption and signing keys.
+        :param max_age: <optional> The number of seconds for which an issued token is valid.
+        :param persister: <optional> A persister to hold the guess counters of games,
+        shared by every process using it; if None, they are held in memory.
+        """
+        if not secret:
+            raise ValueError("A secret must be provided to sign game tokens.")
+        if not isinstance(max_age, int) or max_age < 1:
+            raise ValueError("max_age must be a positive number of seconds.")
+
+        _secret = secret.encode("utf-8") if not isinstance(secret, bytes) else secret
+        self._fernet = Fernet(base64.urlsafe_b64encode(
+            hmac.new(_secret, self.SALT.encode("utf-8"), hashlib.sha256).digest()
+        ))
+        self._max_age = max_age
+        self._persister = persister
+
+    #
+    # Class methods
+    #
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Return a GameToken configured from the Flask app configuration, or None if
+        COWBULL_STATELESS is not set.
+
+        :param config: <required> The Flask app config.
+        :return: GameToken or None
+        """
+        if not config.get("COWBULL_STATELESS", False):
+            return None
+        if not config.get("COWBULL_TOKEN_SECRET", None):
+            raise ValueError(
+                "COWBULL_STATELESS is set but no COWBULL_TOKEN_SECRET has been "
+                "configured to sign game keys!"
+            )
+        _persister = None
+        if config.get("COWBULL_TOKEN_COUNTERS", None) == "persister":
+            if not config.get("PERSISTER", None):
+                raise ValueError(
+                    "COWBULL_TOKEN_COUNTERS is set to persister but no PERSISTER has "
+                    "been configured to hold them!"
+                )
+            _persister = config["PERSISTER"].persister
+        return cls(
+            secret=config["COWBULL_TOKEN_SECRET"],
+            max_age=config.get("COWBULL_TOKEN_MAX_AGE", None) or 3600,
+            persister=_persister
+        )
+
+    #
+    # Properties
+    #
+    @property
+    def max_age(self):
+        return self._max_age
+
+    #
+    # 'public' methods
+    #
+    def dumps(self, game=None, created=None, previous=0):
+        """
+        Serialize a game into a token. If guesses have been made since the token
+        the game was loaded from, that token is replaced: a KeyError is raised if it
+        has already been replaced by another request.
+
+        :param game: <required> A GameObject.
+        :param created: <optional> The time (seconds since the epoch) the game was
+        created; now if not provided (i.e. a new game).
+        :param previous: <optional> The guesses made when the game was loaded from
+        its token (see loads); 0 for a new game.
+        :return: <str> the token
+        """
+        _payload = json.dumps(
+            {
+                "k": game.key,
+                "m": game.mode.mode,
+                "a": game.answer.packed,
+                "g": game.guesses_made,
+                "s": game.status,
+                "t": game.ttl,
+                "c": int(created or time.time())
+            },
+            separators=(",", ":")
+        ).encode("utf-8")
+
+        self._advance(game.key, previous, game.guesses_made, int(created or time.time()) + game.ttl)
+        return self._fernet.encrypt(_payload).decode("ascii")
+
+    def loads(self, token=None, game_modes=None):
+        """
+        Verify, decrypt and expand a token into a game dict which can be loaded by a
+        GameController.
+
+        :param token: <required> The token (as returned by dumps)
+        :param game_modes: <optional> The custom modes (see GameModeRegistry.get)
+        :return: <tuple> of (game dict, created time)
+        """
+        if not token or not isinstance(token, str):
+            raise KeyError("The game token is missing or not a string.")
+
+        try:
+            _token = token.encode("ascii")
+            _payload = json.loads(self._fernet.decrypt(_token).decode("utf-8"))
+        except (InvalidToken, UnicodeEncodeError):
+            raise KeyError("The game token is not valid.")
+        if time.time() > self._fernet.extract_timestamp(_token) + self._max_age:
+            raise KeyError("The game token has expired.")
+
+        if time.time() > _payload["c"] + _payload["t"]:
+            raise KeyError("The game has expired.")
+        if _payload["g"] < self._counter(_payload["k"]):
+            raise KeyError("The game token has been replaced by a later one.")
+
+        _mode = GameModeRegistry.get(input_modes=game_modes).match(_payload["m"])
+        _answer = PackedWord.from_packed(_payload["a"], _mode.digits, wordtype=_mode.digit_type)
+        return {
+            "key": _payload["k"],
+            "status": _payload["s"],
+            "ttl": _payload["t"],
+            "answer": _answer.word,
+            "mode": _mode.dump(),
+            "guesses_made": _payload["g"]
+        }, _payload["c"]
+
+    #
+    # 'private' methods
+    #
+    def _counter(self, key):
+        # The highest guess counter issued for the game, or 0.
+        if self._persister is not None:
+            try:
+                return json.loads(self._persister.load(key=self.COUNTER_PREFIX + key))["g"]
+            except KeyError:
+                return 0
+        with self._lock:
+            _counter = self._counters.get(key)
+            if _counter is None or _counter[1] < time.time():
+                return 0
+            return _counter[0]
+
+    def _advance(self, key, previous, guesses_made, expires_at):
+        # Raise the game's counter from previous to guesses_made, unless another
+        # request has already raised it past previous (i.e. replaced the same token).
+        # Nothing is written if no guesses were made (e.g. a new game).
+        if guesses_made <= previous:
+            return
+        if self._persister is not None:
+            _key = self.COUNTER_PREFIX + key
+            try:
+                _stored, _version = self._persister.load_versioned(key=_key)
+                _counter = json.loads(_stored)["g"]
+            except KeyError:
+                _counter, _version = 0, None
+            if _counter > previous:
+                raise KeyError("The game token has been replaced by a later one.")
+            try:
+                self._persister.save(
+                    key=_key,
+                    jsonstr=json.dumps({"g": guesses_made}),
+                    expected_version=_version,
+                    ttl=max(1, int(expires_at - time.time()))
+                )
+            except VersionConflict:
+                raise KeyError("The game token has been replaced by a later one.")
+            return
+
+        with self._lock:
+            _counter = self._counters.pop(key, None)
+            if _counter is not None and _counter[1] >= time.time() and _counter[0] > previous:
+                self._counters[key] = _counter
+                raise KeyError("The game token has been replaced by a later one.")
+            self._counters[key] = (guesses_made, expires_at)
+            while len(self._counters) > self.MAX_COUNTERS:
+                self._counters.popitem(last=False)
@@ -0,0 +1,289 @@
+import random
+
+
+class PackedWord(object):
+    """
+    PackedWord - A compact, immutable representation of an answer or a guess.
+
+    The digits are held as a tuple of ints and packed, four bits per digit, into a
+    single int. Two bit masks record which digit values occur in the word and which
+    occur more than once, so a guess can be scored against an answer without creating
+    an object per digit. The scoring semantics (and the analysis produced) are the
+    same as python_digits.DigitWord.compare:
+
+    * a bull is a digit in the right place;
+    * a cow is a digit that is not in the right place but occurs in the answer.
+
+    """
+    __slots__ = ("_digits", "_wordtype", "_packed", "_present", "_multiple")
+
+    DIGIT = 0       # Same value as DigitWord.DIGIT
+    HEXDIGIT = 1    # Same value as DigitWord.HEXDIGIT
+    BITS = 4        # Bits used to pack each digit
+
+    _RANGES = {DIGIT: 10, HEXDIGIT: 16}
+    _TOKENS = {
+        DIGIT: dict(
+            [(i, i) for i in range(10)] + [(str(i), i) for i in range(10)]
+        ),
+        HEXDIGIT: dict(
+            [(i, i) for i in range(16)]
+            + [("{:x}".format(i), i) for i in range(16)]
+            + [("{:X}".format(i), i) for i in range(16)]
+            + [("0x{:x}".format(i), i) for i in range(16)]
+        )
+    }
+    _ERRORS = {
+        DIGIT: "Digit: A digit must be a string representation or integer "
+               "of a number between 0 (zero) and 9 (nine).",
+        HEXDIGIT: "Digit: A hex digit must be a string representation or integer "
+                  "of a number between 0 (zero) and F (fifteen)."
+    }
+
+    def __init__(self, digits=None, wordtype=DIGIT):
+        """
+        Create a PackedWord from a sequence of already validated int digits. To create
+        a PackedWord from user provided values use PackedWord.parse.
+
+        :param digits: <required> A list or tuple of ints.
+        :param wordtype: <optional> PackedWord.DIGIT (default) or PackedWord.HEXDIGIT
+        """
+        if wordtype not in self._RANGES:
+            raise ValueError("wordtype must be set to DigitWord.DIGIT or DigitWord.HEXDIGIT")
+        if not isinstance(digits, (list, tuple)):
+            raise TypeError("Expected list (or tuple) of integer digits or list of string representations!")
+
+        _digits = tuple(digits)
+        _packed = 0
+        _present = 0
+        _multiple = 0
+        for idx, digit in enumerate(_digits):
+            _bit = 1 << digit
+            _multiple |= _present & _bit
+            _present |= _bit
+            _packed |= digit << (idx * self.BITS)
+
+        object.__setattr__(self, "_digits", _digits)
+        object.__setattr__(self, "_wordtype", wordtype)
+        object.__setattr__(self, "_packed", _packed)
+        object.__setattr__(self, "_present", _present)
+        object.__setattr__(self, "_multiple", _multiple)
+
+    #
+    # Class methods
+    #
+    @classmethod
+    def parse(cls, values, wordtype=DIGIT):
+        """
+        Parse user provided digits (ints or str representations, e.g. 5, '5', 'a', 'A'
+        or '0xa' for hex words) into a PackedWord. Values are validated with the same
+        rules (and the same error messages) as python_digits.Digit and HexDigit.
+
+        :param values: A list or tuple of ints or strs
+        :param wordtype: PackedWord.DIGIT (default) or PackedWord.HEXDIGIT
+        :return: PackedWord
+        """
+        if wordtype not in cls._RANGES:
+            raise ValueError("wordtype must be set to DigitWord.DIGIT or DigitWord.HEXDIGIT")
+        if not isinstance(values, (list, tuple)):
+            raise TypeError("Expected list (or tuple) of integer digits or list of string representations!")
+
+        _tokens = cls._TOKENS[wordtype]
+        _digits = []
+        for value in values:
+            # Exact int and str values are looked up directly; everything else (bools,
+            # padded strings, etc.) goes through the full validation rules.
+            if type(value) in (int, str) and value in _tokens:
+                _digits.append(_tokens[value])
+            else:
+                _digits.append(cls._parse_digit(value, wordtype))
+        return cls(_digits, wordtype=wordtype)
+
+    @classmethod
+    def from_packed(cls, packed, length, wordtype=DIGIT):
+        """
+        Unpack a PackedWord from its packed int representation.
+
+        :param packed: <int> the packed digits
+        :param length: <int> the number of digits packed
+        :param wordtype: PackedWord.DIGIT (default) or PackedWord.HEXDIGIT
+        :return: PackedWord
+        """
+        _mask = (1 << cls.BITS) - 1
+        _digits = [(packed >> (idx * cls.BITS)) & _mask for idx in range(length)]
+        if any(digit >= cls._RANGES.get(wordtype, 0) for digit in _digits):
+            raise ValueError(cls._ERRORS.get(wordtype, "Invalid packed word"))
+        return cls(_digits, wordtype=wordtype)
+
+    @classmethod
+    def random(cls, length=4, wordtype=DIGIT, rng=None):
+        """
+        Create a random PackedWord of length digits.
+
+        :param length: <int> the number of digits
+        :param wordtype: PackedWord.DIGIT (default) or PackedWord.HEXDIGIT
+        :param rng: <optional> a random.Random like object; the random module is used
+        if none is provided.
+        :return: PackedWord
+        """
+        if not isinstance(length, int):
+            raise TypeError("DigitWord can only be randomized by an integer length")
+        if wordtype not in cls._RANGES:
+            raise TypeError("wordtype is invalid.")
+        _rng = rng or random
+        _top = cls._RANGES[wordtype] - 1
+        return cls([_rng.randint(0, _top) for _ in range(length)], wordtype=wordtype)
+
+    @classmethod
+    def _parse_digit(cls, value, wordtype):
+        _error = cls._ERRORS[wordtype]
+        if not isinstance(value, (int, str)):
+            raise ValueError("DigitWords must be made from digits (strings or ints) "
+                             "between 0 and 9 for decimal and 0 and 15 for hex")
+
+        _value = -1
+        if wordtype == cls.DIGIT:
+            try:
+                _value = int(value)
+            except ValueError:
+                pass
+        elif isinstance(value, str):
+            _str = value
+            if len(_str) > 3:
+                raise ValueError(_error)
+            if len(_str) > 1:
+                if _str[0:2] != "0x":
+                    raise ValueError(_error)
+                _str = _str[2:]
+            if _str.upper() > "F":
+                raise ValueError(_error)
+            try:
+                _value = int(_str, 16)
+            except ValueError:
+                raise ValueError(_error)
+        else:
+            _value = int(value)
+
+        if _value < 0 or _value >= cls._RANGES[wordtype]:
+            raise ValueError(_error)
+        return _value
+
+    #
+    # Overrides
+    #
+    def __setattr__(self, name, value):
+        raise AttributeError("PackedWord objects are immutable")
+
+    def __reduce__(self):
+        return (PackedWord, (self._digits, self._wordtype))
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedWord):
+            return False
+        return self._wordtype == other._wordtype and self._digits == other._digits
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self._wordtype, self._digits))
+
+    def __iter__(self):
+        return iter(self.word)
+
+    def __len__(self):
+        return len(self._digits)
+
+    def __str__(self):
+        return "".join(str(digit) for digit in self.word)
+
+    def __repr__(self):
+        return "<PackedWord: {}>".format(self.__str__())
+
+    #
+    # Properties
+    #
+    @property
+    def digits(self):
+        """The digits as a tuple of ints. :return: <tuple>"""
+        return self._digits
+
+    @property
+    def wordtype(self):
+        return self._wordtype
+
+    @property
+    def packed(self):
+        """The digits packed into an int, BITS bits per digit, first digit lowest."""
+        return self._packed
+
+    @property
+    def word(self):
+        """
+        The digits as a list in the same form as DigitWord.word: ints for a decimal
+        word and lower case hex strings (without a leading 0x) for a hex word.
+
+        :return: <list>
+        """
+        if self._wordtype == self.DIGIT:
+            return list(self._digits)
+        return ["{:x}".format(digit) for digit in self._digits]
+
+    #
+    # 'public' methods
+    #
+    def score(self, guess):
+        """
+        Score a guess against this word (the answer).
+
+        :param guess: PackedWord
+        :return: <tuple> of (bulls, cows)
+        """
+        self._validate_compare_parameters(guess)
+        if self._packed == guess._packed:
+            return len(self._digits), 0
+
+        bulls = 0
+        cows = 0
+        present = self._present
+        for answer_digit, guess_digit in zip(self._digits, guess._digits):
+            if answer_digit == guess_digit:
+                bulls += 1
+            elif (present >> guess_digit) & 1:
+                cows += 1
+        return bulls, cows
+
+    def compare(self, guess):
+        """
+        Compare a guess against this word (the answer) and return the per digit analysis
+        in the same form as DigitWordAnalysis.get_object, i.e. a list of dicts containing
+        index, digit, match, multiple, and in_word.
+
+        :param guess: PackedWord
+        :return: <list> of <dict>
+        """
+        self._validate_compare_parameters(guess)
+        present = self._present
+        multiple = self._multiple
+        hexword = self._wordtype == self.HEXDIGIT
+        return [
+            {
+                "index": idx,
+                "digit": "{:x}".format(guess_digit) if hexword else guess_digit,
+                "match": guess_digit == answer_digit,
+                "multiple": bool((multiple >> guess_digit) & 1),
+                "in_word": bool((present >> guess_digit) & 1)
+            }
+            for idx, (answer_digit, guess_digit) in enumerate(zip(self._digits, guess._digits))
+        ]
+
+    #
+    # 'private' methods
+    #
+    def _validate_compare_parameters(self, other):
+        if not isinstance(other, PackedWord):
+            raise TypeError("A PackedWord object can only be compared against another PackedWord object.")
+        if len(self._digits) != len(other._digits):
+            raise ValueError("The DigitWord objects are of different lengths and so comparison fails.")
+        if other._wordtype != self._wordtype:
+            raise ValueError("The DigitWord objects are different types and so comparison fails.")
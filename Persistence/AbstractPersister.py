@@ -8,6 +8,8 @@
 # DO NOT MODIFY THE CODE WITHOUT UNDERSTANDING THE IMPACT UPON PYTHON 2.7
 #
 import abc
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flask_helpers.ErrorHandler import ErrorHandler
 
 # Force compatibility with Python 2 *and* 3:
@@ -18,6 +20,10 @@ import logging
 
 
 class AbstractPersister(ABC):
+    MAX_WORKERS = 16    # Most concurrent requests made by _run_concurrently
+    TTL = 60 * 60       # Seconds a game is kept after its last save if no ttl is given
+    SINGLE_PROCESS = False  # Only one process may use the persister's store at a time
+
     def __init__(self):
         self.handler = ErrorHandler(
             module="AbstractPersister",
@@ -35,7 +41,18 @@ class AbstractPersister(ABC):
         self.handler.module = save_module_name
 
     @abc.abstractmethod
-    def save(self, key=None, jsonstr=None):
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        """
+        Persist a game. Every save (and update) increases the version stored with the
+        game. If expected_version is given, the game is only saved if the version
+        stored is still expected_version (as returned by load_versioned); otherwise
+        VersionConflict is raised. Persisters which do not keep versions (see
+        load_versioned) are never passed an expected_version.
+
+        Every save (and update) also sets when the game expires: ttl seconds (the
+        game's ttl, or TTL if None) later. Once expired, a game cannot be loaded and
+        is deleted, by the backend or by sweep.
+        """
         save_module_name = self.handler.module
         self.handler.module = "Base Persister"
         self.handler.method = "save"
@@ -53,3 +70,225 @@ class AbstractPersister(ABC):
         self.handler.log(message="Saving key {} with {} to persister".format(key, jsonstr))
 
         self.handler.module = save_module_name
+
+    def load_versioned(self, key=None):
+        """
+        Load a persisted game with its version, for a later save (or update) with an
+        expected_version. Persisters which keep versions must override this method;
+        the default returns a version of None, meaning the game is not versioned and
+        saves are unconditional.
+
+        :param key: <required> The key of the game.
+        :return: <tuple> of the persisted JSON and the version.
+        """
+        return self.load(key=key), None
+
+    def load_many(self, keys=None):
+        """
+        Load several persisted games. Persisters that can fetch several keys in one
+        round trip should override this method; the default simply calls load for
+        each key.
+
+        :param keys: <required> A list of keys.
+        :return: <dict> of key to the persisted JSON (None if the key could not be loaded).
+        """
+        _keys = self._check_keys(keys=keys, method="load_many")
+        _results = {}
+        for _key in _keys:
+            try:
+                _results[_key] = self.load(key=_key)
+            except KeyError:
+                _results[_key] = None
+        return _results
+
+    def load_many_versioned(self, keys=None):
+        """
+        Load several persisted games with their versions (see load_versioned), for
+        later writes with an expected_version. Persisters that can fetch several keys
+        and their versions in one round trip should override this method; the
+        default simply calls load_versioned for each key.
+
+        :param keys: <required> A list of keys.
+        :return: <dict> of key to a tuple of the persisted JSON and the version
+        ((None, None) if the key could not be loaded).
+        """
+        _keys = self._check_keys(keys=keys, method="load_many_versioned")
+        _results = {}
+        for _key in _keys:
+            try:
+                _results[_key] = self.load_versioned(key=_key)
+            except KeyError:
+                _results[_key] = (None, None)
+        return _results
+
+    def save_many(self, items=None, ttl=None):
+        """
+        Persist several games. Persisters that can write several keys in one round
+        trip should override this method; the default simply calls save for each key.
+
+        :param items: <required> A dict of key to JSON.
+        :param ttl: <optional> The ttl of every game, or a dict of key to ttl.
+        """
+        _items = self._check_items(items=items, method="save_many")
+        for _key, _jsonstr in _items.items():
+            self.save(key=_key, jsonstr=_jsonstr, ttl=self._ttl_for(ttl, _key))
+
+    def update(self, key=None, fields=None, jsonstr=None, expected_version=None, ttl=None):
+        """
+        Update some of the fields (e.g. guesses_made and status) of a persisted game
+        rather than rewriting the whole game. Persisters that can update fields in
+        place should override this method; the default simply saves jsonstr, which
+        persisters that override it also fall back to if the game is not stored in a
+        form they can update (e.g. it was saved with a binary codec).
+
+        :param key: <required> The key of the game.
+        :param fields: <required> A dict of the names of the fields of the game which
+        changed to their new values.
+        :param jsonstr: <required> The whole game, saved if fields cannot be updated.
+        :param expected_version: <optional> As for save.
+        :param ttl: <optional> As for save.
+        """
+        if not isinstance(fields, dict):
+            raise TypeError("Fields must be provided as a dict of field name to value.")
+        self.save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+
+    def write_many(self, writes=None):
+        """
+        Make several saves and updates, each of which succeeds or fails on its own
+        (e.g. with a VersionConflict), as one batch. Used by GroupCommitPersister to
+        commit the writes of concurrent requests together. Persisters that can make
+        several conditional writes in one round trip should override this method; the
+        default simply calls save or update for each write.
+
+        :param writes: <required> A list of dicts with the key, jsonstr and (optionally)
+        expected_version and ttl of a save, or also the fields of an update.
+        :return: <list> of None or the exception raised, for each write in order.
+        """
+        _writes = self._check_writes(writes=writes, method="write_many")
+        _results = []
+        for _write in _writes:
+            _key, _jsonstr, _version = _write["key"], _write["jsonstr"], _write.get("expected_version")
+            try:
+                if _write.get("fields") is None:
+                    self.save(key=_key, jsonstr=_jsonstr, expected_version=_version, ttl=_write.get("ttl"))
+                else:
+                    self.update(
+                        key=_key,
+                        fields=_write["fields"],
+                        jsonstr=_jsonstr,
+                        expected_version=_version,
+                        ttl=_write.get("ttl")
+                    )
+                _results.append(None)
+            except Exception as e:
+                _results.append(e)
+        return _results
+
+    def sweep(self, limit=None):
+        """
+        Delete expired games. Persisters whose backend cannot expire games itself
+        must override this method; ExpirySweeper calls it periodically. The default
+        does nothing.
+
+        :param limit: <optional> The most games to delete in one call.
+        :return: <int> the number of games deleted.
+        """
+        return 0
+
+    def stats(self):
+        """
+        Return statistics about the persister (e.g. its connection pools), or None if
+        the persister keeps none.
+
+        :return: <dict> or None
+        """
+        return None
+
+    def delete(self, key=None):
+        """
+        Delete a persisted game. Deleting a key which does not exist is not an error.
+        Persisters must override this method to support deletes.
+
+        :param key: <required> The key of the game.
+        """
+        self._check_keys(keys=[key], method="delete")
+        raise NotImplementedError("{} does not support deleting games.".format(self.handler.module))
+
+    def delete_many(self, keys=None):
+        """
+        Delete several persisted games. Persisters that can delete several keys in one
+        round trip should override this method; the default simply calls delete for
+        each key.
+
+        :param keys: <required> A list of keys.
+        """
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        for _key in _keys:
+            self.delete(key=_key)
+
+    #
+    # 'private' methods
+    #
+    def _run_concurrently(self, function, args_list):
+        # For persisters with no bulk API: make the (blocking) single key calls on a
+        # pool of threads and return the results in order.
+        if not args_list:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(args_list))) as executor:
+            return list(executor.map(lambda args: function(*args), args_list))
+
+    def _ttl_for(self, ttl, key=None):
+        # The ttl of key given the ttl passed to a method: a number, a dict of key to
+        # ttl, or None for the default.
+        if isinstance(ttl, dict):
+            ttl = ttl.get(key)
+        return int(ttl) if ttl else self.TTL
+
+    def _expires_at(self, ttl, key=None):
+        return time.time() + self._ttl_for(ttl, key)
+
+    def _check_keys(self, keys=None, method=None):
+        save_module_name = self.handler.module
+        self.handler.module = "Base Persister"
+        self.handler.method = method or "_check_keys"
+        self.handler.log(message="Validating keys: {}".format(keys))
+        if not isinstance(keys, (list, tuple)):
+            raise TypeError("Keys must be provided as a list.")
+        if any(_key is None for _key in keys):
+            raise ValueError("Key must be present to load a persisted game.")
+        self.handler.module = save_module_name
+        return list(keys)
+
+    def _check_items(self, items=None, method=None):
+        save_module_name = self.handler.module
+        self.handler.module = "Base Persister"
+        self.handler.method = method or "_check_items"
+        self.handler.log(message="Validating {} items".format(len(items or {})))
+        if not isinstance(items, dict):
+            raise TypeError("Items must be provided as a dict of key to JSON.")
+        for _key, _jsonstr in items.items():
+            if _key is None:
+                raise ValueError("Key must be present to persist game.")
+            if _jsonstr is None:
+                raise ValueError("JSON is badly formed or not present")
+        self.handler.module = save_module_name
+        return items
+
+    def _check_writes(self, writes=None, method=None):
+        save_module_name = self.handler.module
+        self.handler.module = "Base Persister"
+        self.handler.method = method or "_check_writes"
+        self.handler.log(message="Validating {} writes".format(len(writes or [])))
+        if not isinstance(writes, (list, tuple)):
+            raise TypeError("Writes must be provided as a list.")
+        for _write in writes:
+            if not isinstance(_write, dict):
+                raise TypeError("Each write must be a dict of key, jsonstr, expected_version and fields.")
+            if _write.get("key") is None:
+                raise ValueError("Key must be present to persist game.")
+            if _write.get("jsonstr") is None:
+                raise ValueError("JSON is badly formed or not present")
+            if _write.get("fields") is not None and not isinstance(_write["fields"], dict):
+                raise TypeError("Fields must be provided as a dict of field name to value.")
+        self.handler.module = save_module_name
+        return list(writes)
@@ -0,0 +1,77 @@
+import os
+import threading
+
+from flask_helpers.ErrorHandler import ErrorHandler
+
+
+class ExpirySweeper(object):
+    """
+    ExpirySweeper - Periodically deletes expired games from a persister whose backend
+    cannot expire them itself (see AbstractPersister.sweep), on a daemon thread. The
+    thread does not survive a fork, so it is started (again) in each process by the
+    first call to start after the fork; PersistenceEngine calls start whenever its
+    persister is used.
+
+    """
+    def __init__(self, persister=None, interval=300, limit=1000):
+        """
+        :param persister: <required> The persister to sweep.
+        :param interval: <optional> Seconds between sweeps.
+        :param limit: <optional> The most games deleted by one sweep.
+        """
+        if persister is None:
+            raise ValueError("A persister must be provided to sweep.")
+        if interval <= 0:
+            raise ValueError("The sweep interval must be greater than 0.")
+
+        self.handler = ErrorHandler(module="ExpirySweeper", method="__init__")
+        self._persister = persister
+        self._interval = interval
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._pid = None
+        self._counts = {"sweeps": 0, "deleted": 0, "errors": 0}
+
+    #
+    # 'public' methods
+    #
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopped.clear()
+            _thread = threading.Thread(target=self._run, name="expiry-sweeper")
+            _thread.daemon = True
+            _thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stopped.set()
+
+    def sweep(self):
+        """Sweep once. :return: <int> the number of games deleted"""
+        try:
+            _deleted = self._persister.sweep(limit=self._limit)
+        except Exception as e:
+            self.handler.log(method="sweep", message="Unable to sweep expired games: {}".format(str(e)))
+            with self._lock:
+                self._counts["errors"] += 1
+            return 0
+        with self._lock:
+            self._counts["sweeps"] += 1
+            self._counts["deleted"] += _deleted
+        return _deleted
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    #
+    # 'private' methods
+    #
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.sweep()
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from Persistence.AbstractPersister import AbstractPersister
+
+
+class GroupCommitPersister(AbstractPersister):
+    """
+    GroupCommitPersister - Wraps a persister and commits the saves and updates made
+    by concurrent requests together: a write waits up to window_ms for others to
+    join it, then all of them are made with one write_many (one pipeline to each
+    Redis node, one Mongo bulk_write). Each request still waits until its own write
+    has been made and sees its own outcome (e.g. a VersionConflict), so what a
+    successful save means does not change.
+
+    The first write of a batch leads it: it waits for the window, takes up to
+    max_batch writes and makes them; writes which arrive meanwhile wait for the next
+    leader, the oldest of them. No background thread is used, so the wrapper is safe
+    to create before a worker forks.
+
+    All other methods are passed to the wrapped persister.
+
+    """
+    def __init__(self, persister=None, window_ms=2, max_batch=500):
+        """
+        :param persister: <required> The persister to wrap.
+        :param window_ms: <optional> Milliseconds a write waits for others to join it.
+        :param max_batch: <optional> The most writes made together.
+        """
+        super(GroupCommitPersister, self).__init__()
+        if not isinstance(persister, AbstractPersister):
+            raise TypeError("The persister must be a subclass of an AbstractPersister!")
+        if window_ms < 0 or not isinstance(max_batch, int) or max_batch < 1:
+            raise ValueError("window_ms must not be negative and max_batch must be greater than 0.")
+
+        self.handler.module = "Group Commit Persister"
+        self._persister = persister
+        self._window = window_ms / 1000.0
+        self._max_batch = max_batch
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._leading = False
+        self._counts = {"writes": 0, "batches": 0, "largest_batch": 0}
+
+    def __getattr__(self, name):
+        # e.g. atomic_guesses, partial_updates and atomic_guess of the Redis persister.
+        if name.startswith("__") or "_persister" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self._persister, name)
+
+    #
+    # Properties
+    #
+    @property
+    def persister(self):
+        return self._persister
+
+    #
+    # 'public' methods
+    #
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(GroupCommitPersister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+        self._commit({"key": key, "jsonstr": jsonstr, "expected_version": expected_version, "ttl": ttl})
+
+    def update(self, key=None, fields=None, jsonstr=None, expected_version=None, ttl=None):
+        self._commit(self._check_writes(
+            writes=[{
+                "key": key,
+                "fields": fields,
+                "jsonstr": jsonstr,
+                "expected_version": expected_version,
+                "ttl": ttl
+            }],
+            method="update"
+        )[0])
+
+    def write_many(self, writes=None):
+        return self._persister.write_many(writes=writes)
+
+    def load(self, key=None):
+        return self._persister.load(key=key)
+
+    def load_versioned(self, key=None):
+        return self._persister.load_versioned(key=key)
+
+    def load_many(self, keys=None):
+        return self._persister.load_many(keys=keys)
+
+    def load_many_versioned(self, keys=None):
+        return self._persister.load_many_versioned(keys=keys)
+
+    def save_many(self, items=None, ttl=None):
+        self._persister.save_many(items=items, ttl=ttl)
+
+    def delete(self, key=None):
+        self._persister.delete(key=key)
+
+    def delete_many(self, keys=None):
+        self._persister.delete_many(keys=keys)
+
+    def sweep(self, limit=None):
+        return self._persister.sweep(limit=limit)
+
+    def stats(self):
+        with self._lock:
+            _counts = dict(self._counts)
+        _counts["mean_batch"] = round(_counts["writes"] / float(_counts["batches"]), 2) if _counts["batches"] else 0.0
+        _stats = dict(self._persister.stats() or {})
+        _stats["group_commit"] = _counts
+        return _stats
+
+    #
+    # 'private' methods
+    #
+    def _commit(self, write):
+        _entry = {"write": write, "wake": threading.Event(), "lead": False, "done": False, "result": None}
+        with self._lock:
+            self._pending.append(_entry)
+            if not self._leading:
+                self._leading = _entry["lead"] = True
+
+        if _entry["lead"]:
+            time.sleep(self._window)
+        else:
+            _entry["wake"].wait()
+        while _entry["lead"] and not _entry["done"]:
+            # Promoted (or the first): make the next batch, which holds this write.
+            self._flush()
+
+        if _entry["result"] is not None:
+            raise _entry["result"]
+
+    def _flush(self):
+        with self._lock:
+            _batch = self._pending[:self._max_batch]
+            del self._pending[:self._max_batch]
+
+        try:
+            _results = self._persister.write_many(writes=[_entry["write"] for _entry in _batch])
+        except Exception as e:
+            _results = [e] * len(_batch)
+
+        with self._lock:
+            self._counts["writes"] += len(_batch)
+            self._counts["batches"] += 1
+            self._counts["largest_batch"] = max(self._counts["largest_batch"], len(_batch))
+            if self._pending:
+                # The oldest waiting write leads the next batch.
+                self._pending[0]["lead"] = True
+                self._pending[0]["wake"].set()
+            else:
+                self._leading = False
+
+        for _entry, _result in zip(_batch, _results):
+            _entry["result"] = _result
+            _entry["done"] = True
+            _entry["wake"].set()
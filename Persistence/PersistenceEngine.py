@@ -1,5 +1,8 @@
 from flask_helpers.ErrorHandler import ErrorHandler
 from Persistence.AbstractPersister import AbstractPersister
+from Persistence.ExpirySweeper import ExpirySweeper
+from Persistence.GroupCommitPersister import GroupCommitPersister
+from Persistence.WriteBehindPersister import WriteBehindPersister
 from os import listdir
 from os import getcwd
 from sys import path
@@ -16,6 +19,10 @@ class PersistenceEngine(object):
         self.handler.log(message="Getting persistence engine arguments")
         engine_name = kwargs.get('engine_name', None)
         parameters = kwargs.get('parameters', None)
+        group_commit_ms = kwargs.get('group_commit_ms', None)
+        group_commit_max_batch = kwargs.get('group_commit_max_batch', 500)
+        write_behind = kwargs.get('write_behind', None)
+        sweep_interval = kwargs.get('sweep_interval', 300)
 
         if not engine_name:
             raise ValueError(
@@ -25,10 +32,16 @@ class PersistenceEngine(object):
             raise TypeError(
                 "'parameters' must be a dictionary of objects"
             )
+        if write_behind is not None and not isinstance(write_behind, dict):
+            raise TypeError(
+                "'write_behind' must be a dictionary of write behind options"
+            )
 
         self._engine_name = engine_name
         self._parameters = parameters
+        self._write_behind = write_behind
         self._persister = None
+        self._sweeper = None
 
         # Step 1 - Build path
         self.handler.log(message="Build import path")
@@ -77,6 +90,25 @@ class PersistenceEngine(object):
 
         self.handler.log(message="Instantiating Persister")
         self._persister = self._persister.Persister(**self._parameters)
+        self._single_process = self._persister.SINGLE_PROCESS
+
+        # Persisters whose backend cannot expire games delete them with sweep.
+        if sweep_interval and type(self._persister).sweep is not AbstractPersister.sweep:
+            self.handler.log(message="Sweeping expired games every {} seconds".format(sweep_interval))
+            self._sweeper = ExpirySweeper(persister=self._persister, interval=sweep_interval)
+            self._sweeper.start()
+
+        if group_commit_ms:
+            self.handler.log(message="Committing writes in groups every {} ms".format(group_commit_ms))
+            self._persister = GroupCommitPersister(
+                persister=self._persister,
+                window_ms=group_commit_ms,
+                max_batch=group_commit_max_batch
+            )
+
+        if write_behind is not None:
+            self.handler.log(message="Writing behind with {}".format(write_behind))
+            self._persister = WriteBehindPersister(persister=self._persister, **write_behind)
         return
 
     @property
@@ -89,8 +121,39 @@ class PersistenceEngine(object):
 
     @property
     def persister(self):
+        # The sweeper's thread does not survive a fork (e.g. of a gunicorn worker),
+        # so it is started again in each process which uses the persister.
+        if self._sweeper is not None:
+            self._sweeper.start()
         return self._persister
 
+    @property
+    def sweeper(self):
+        return self._sweeper
+
+    def check_workers(self, workers=1):
+        """
+        Raise a ValueError if the persister is configured to keep state in each
+        process, which the other worker processes would not see, and there is more
+        than one worker.
+
+        :param workers: <optional> The number of worker processes using the persister.
+        """
+        if workers <= 1:
+            return
+        if self._single_process:
+            raise ValueError(
+                "The {} persister can only be used by one process, but WORKERS is {}. Set "
+                "WORKERS to 1 (and THREADS to serve requests concurrently) or use the sqlite "
+                "or file persister.".format(self._engine_name, workers)
+            )
+        if self._write_behind is not None:
+            raise ValueError(
+                "write_behind queues writes in each process, so the other workers would "
+                "load games without them, but WORKERS is {}. Set WORKERS to 1 (and THREADS "
+                "to serve requests concurrently) or remove write_behind.".format(workers)
+            )
+
     def __repr__(self):
         return "<persister>{}".format(self._engine_name)
 
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import redis
+
+
+class RedisConnectionPool(redis.BlockingConnectionPool):
+    """
+    RedisConnectionPool - A BlockingConnectionPool (a bounded pool which makes callers
+    wait, up to a timeout, for a free connection rather than opening another one) which
+    also keeps statistics on its use: connections in use and idle, and how long callers
+    waited for a connection.
+
+    Connections are TCP connections unless a socket_path is given, in which case they
+    are unix domain socket connections (e.g. to a sidecar Redis).
+
+    """
+    def __init__(
+        self,
+        max_connections=50,
+        timeout=5,
+        socket_path=None,
+        **connection_kwargs
+    ):
+        """
+        :param max_connections: <optional> The most connections the pool will open.
+        :param timeout: <optional> Seconds to wait for a free connection before a
+        ConnectionError is raised; None waits forever.
+        :param socket_path: <optional> The path of a unix domain socket to connect to.
+        :param connection_kwargs: <optional> Passed to each connection, e.g. host, port,
+        password, db, socket_timeout, socket_connect_timeout, socket_keepalive and
+        health_check_interval.
+        """
+        if socket_path:
+            connection_kwargs["path"] = socket_path
+            for _tcp_only in ("host", "port", "socket_connect_timeout", "socket_keepalive"):
+                connection_kwargs.pop(_tcp_only, None)
+            connection_kwargs["connection_class"] = redis.UnixDomainSocketConnection
+
+        super(RedisConnectionPool, self).__init__(
+            max_connections=max_connections,
+            timeout=timeout,
+            **connection_kwargs
+        )
+
+    #
+    # Overrides
+    #
+    def reset(self):
+        # reset is called by __init__ and again in a child process after a fork.
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._gets = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        super(RedisConnectionPool, self).reset()
+
+    def get_connection(self, *args, **kwargs):
+        _started = time.time()
+        _connection = super(RedisConnectionPool, self).get_connection(*args, **kwargs)
+        _waited = time.time() - _started
+        with self._stats_lock:
+            self._in_use += 1
+            self._gets += 1
+            self._wait_total += _waited
+            self._wait_max = max(self._wait_max, _waited)
+        return _connection
+
+    def release(self, connection):
+        with self._stats_lock:
+            self._in_use = max(0, self._in_use - 1)
+        super(RedisConnectionPool, self).release(connection)
+
+    #
+    # 'public' methods
+    #
+    def stats(self):
+        """
+        Return the pool statistics: the most connections allowed, the connections
+        opened, in use and idle, the number of connections handed out, and the
+        average and longest wait (in milliseconds) for a connection.
+
+        :return: <dict>
+        """
+        with self._stats_lock:
+            _created = len([_c for _c in self._connections if _c is not None])
+            return {
+                "max_connections": self.max_connections,
+                "created": _created,
+                "in_use": self._in_use,
+                "idle": max(0, _created - self._in_use),
+                "requests": self._gets,
+                "wait_ms_avg": round(1000 * self._wait_total / self._gets, 3) if self._gets else 0.0,
+                "wait_ms_max": round(1000 * self._wait_max, 3)
+            }
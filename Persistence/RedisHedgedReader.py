@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class RedisHedgedReader(object):
+    """
+    RedisHedgedReader - Makes reads against a set of Redis nodes (the replicas and,
+    as a last resort, the master) and hedges slow ones: a read is sent to one replica
+    and, if it has not answered within the hedge delay (or fails), the same read is
+    sent to another replica (or the master if there is only one replica) and the
+    first answer is used.
+
+    The hedge delay is a percentile (e.g. the 95th) of the recent latencies of the
+    node first asked, bounded by a minimum and maximum delay, so that only the slowest
+    few percent of reads are hedged. Replicas are asked first in turn.
+
+    """
+    WINDOW = 256        # Latencies kept for each node
+    MIN_SAMPLES = 20    # Latencies needed before the percentile is used
+    MAX_WORKERS = 32    # Most reads in flight from one process
+
+    def __init__(self, replicas=None, master=None, percentile=95, min_delay_ms=1, max_delay_ms=50):
+        """
+        :param replicas: <required> A dict of node name (host:port) to a Redis client.
+        :param master: <required> The client for the master.
+        :param percentile: <optional> The percentile of a node's latency after which a
+        read is hedged.
+        :param min_delay_ms: <optional> The shortest hedge delay.
+        :param max_delay_ms: <optional> The longest hedge delay; also used until a node
+        has MIN_SAMPLES latencies.
+        """
+        if not replicas:
+            raise ValueError("At least one replica is needed to hedge reads.")
+        if not 0 < percentile < 100:
+            raise ValueError("The hedge percentile must be between 0 and 100.")
+
+        self._nodes = list(replicas.items())
+        self._master = ("master", master)
+        self._percentile = percentile
+        self._min_delay = min_delay_ms / 1000.0
+        self._max_delay = max_delay_ms / 1000.0
+
+        self._lock = threading.Lock()
+        self._next = 0
+        self._latencies = dict((_name, deque(maxlen=self.WINDOW)) for _name, _ in self._nodes + [self._master])
+        self._counts = {"reads": 0, "hedged": 0, "hedge_wins": 0}
+        self._executor = None
+        self._pid = None
+
+    #
+    # 'public' methods
+    #
+    def read(self, function=None):
+        """
+        Make a read, hedging it if the first node asked is slow.
+
+        :param function: <required> A function which makes the read given a Redis client.
+        :return: the result of the first node to answer.
+        """
+        _first, _second = self._choose()
+        _executor = self._get_executor()
+
+        _futures = {_executor.submit(self._timed, _first, function): _first[0]}
+        _done, _ = wait(list(_futures), timeout=self._delay(_first[0]))
+        _hedged = not _done or next(iter(_done)).exception() is not None
+        if _hedged:
+            _futures[_executor.submit(self._timed, _second, function)] = _second[0]
+
+        with self._lock:
+            self._counts["reads"] += 1
+            self._counts["hedged"] += 1 if _hedged else 0
+
+        _pending = set(_futures)
+        _error = None
+        while _pending:
+            _done, _pending = wait(_pending, return_when=FIRST_COMPLETED)
+            for _future in _done:
+                if _future.exception() is None:
+                    if _futures[_future] == _second[0] and _hedged:
+                        with self._lock:
+                            self._counts["hedge_wins"] += 1
+                    return _future.result()
+                _error = _future.exception()
+        raise _error
+
+    def stats(self):
+        """
+        Return the number of reads, the fraction which were hedged (hedge_rate), the
+        number won by the hedge, and each node's p50 and p99 latency (in milliseconds)
+        and current hedge delay.
+
+        :return: <dict>
+        """
+        with self._lock:
+            _counts = dict(self._counts)
+            _latencies = dict((_name, sorted(_samples)) for _name, _samples in self._latencies.items())
+        _counts["hedge_rate"] = round(_counts["hedged"] / float(_counts["reads"]), 4) if _counts["reads"] else 0.0
+        _counts["nodes"] = dict(
+            (_name, {
+                "samples": len(_samples),
+                "p50_ms": round(1000 * self._value_at(_samples, 50), 3) if _samples else None,
+                "p99_ms": round(1000 * self._value_at(_samples, 99), 3) if _samples else None,
+                "hedge_delay_ms": round(1000 * self._delay(_name), 3)
+            })
+            for _name, _samples in _latencies.items()
+        )
+        return _counts
+
+    #
+    # 'private' methods
+    #
+    def _choose(self):
+        with self._lock:
+            _index = self._next % len(self._nodes)
+            self._next += 1
+        _first = self._nodes[_index]
+        _second = self._nodes[(_index + 1) % len(self._nodes)] if len(self._nodes) > 1 else self._master
+        return _first, _second
+
+    def _delay(self, name):
+        with self._lock:
+            _samples = sorted(self._latencies[name])
+        if len(_samples) < self.MIN_SAMPLES:
+            return self._max_delay
+        return min(self._max_delay, max(self._min_delay, self._value_at(_samples, self._percentile)))
+
+    def _timed(self, node, function):
+        _name, _client = node
+        _started = time.time()
+        _result = function(_client)
+        with self._lock:
+            self._latencies[_name].append(time.time() - _started)
+        return _result
+
+    def _get_executor(self):
+        # The executor's threads do not survive a fork, so each process starts its own.
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+                    self._pid = os.getpid()
+        return self._executor
+
+    @staticmethod
+    def _value_at(samples, percentile):
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100.0))]
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class RedisReplicaTracker(object):
+    """
+    RedisReplicaTracker - Decides whether a read of a key may be served by the Redis
+    replicas (Sentinel) or must go to the master, so that a request always sees the
+    writes made before it (read-your-writes).
+
+    After each write the persister records the master's replication offset against
+    the keys written (see written). The replicas' offsets are taken from the master's
+    INFO replication, which the persister fetches with each write and which is
+    refreshed at most every REFRESH_INTERVAL seconds when a read needs it. A key may
+    be read from the replicas once every online replica has reached the offset of its
+    last write; keys which have not been written by this process may always be read
+    from the replicas (the persister re-reads a key from the master if a replica does
+    not have it).
+
+    """
+    REFRESH_INTERVAL = 0.1  # Seconds the replica offsets are trusted for
+    MAX_KEYS = 10000        # Most keys whose write offsets are remembered
+
+    def __init__(self, master=None):
+        """
+        :param master: <required> The connection to the Redis master.
+        """
+        self._master = master
+        self._lock = threading.Lock()
+        self._written = OrderedDict()
+        self._master_offset = 0
+        self._replicas = {}
+        self._refreshed = 0.0
+        self._reads = {"replica": 0, "master": 0, "master_fallback": 0}
+
+    #
+    # 'public' methods
+    #
+    def written(self, keys=None, info=None):
+        """
+        Record a write to keys.
+
+        :param keys: <required> The keys written.
+        :param info: <required> The master's INFO replication, fetched after the write.
+        """
+        with self._lock:
+            self._update(info)
+            for _key in keys:
+                self._written.pop(_key, None)
+                self._written[_key] = self._master_offset
+            while len(self._written) > self.MAX_KEYS:
+                self._written.popitem(last=False)
+
+    def use_replica(self, keys=None):
+        """
+        Return True if the keys may be read from the replicas.
+
+        :param keys: <required> The keys to be read.
+        :return: <bool>
+        """
+        with self._lock:
+            _needed = max([self._written.get(_key, 0) for _key in keys] or [0])
+        if _needed and self._replica_offset() < _needed:
+            self._refresh()
+        _use_replica = not _needed or self._replica_offset() >= _needed
+        with self._lock:
+            self._reads["replica" if _use_replica else "master"] += 1
+        return _use_replica
+
+    def fell_back(self):
+        """Record a read which a replica could not serve and was made on the master."""
+        with self._lock:
+            self._reads["master_fallback"] += 1
+
+    def stats(self):
+        """
+        Return the master's replication offset, each replica's offset and lag (in bytes
+        behind the master) and the number of reads served by the replicas and by the
+        master.
+
+        :return: <dict>
+        """
+        with self._lock:
+            return {
+                "master_offset": self._master_offset,
+                "replicas": dict(
+                    (_name, {
+                        "offset": _offset,
+                        "lag_bytes": max(0, self._master_offset - _offset)
+                    })
+                    for _name, _offset in self._replicas.items()
+                ),
+                "reads": dict(self._reads)
+            }
+
+    #
+    # 'private' methods
+    #
+    def _replica_offset(self):
+        with self._lock:
+            if not self._replicas:
+                return 0
+            return min(self._replicas.values())
+
+    def _refresh(self):
+        if time.time() - self._refreshed < self.REFRESH_INTERVAL:
+            return
+        try:
+            _info = self._master.info("replication")
+        except Exception:
+            return
+        with self._lock:
+            self._update(_info)
+
+    def _update(self, info):
+        if not info:
+            return
+        self._refreshed = time.time()
+        self._master_offset = max(self._master_offset, int(info.get("master_repl_offset", 0)))
+        _replicas = {}
+        for _name, _replica in info.items():
+            if _name.startswith("slave") and isinstance(_replica, dict) and _replica.get("state") == "online":
+                _replicas["{}:{}".format(_replica.get("ip"), _replica.get("port"))] = int(_replica.get("offset", 0))
+        self._replicas = _replicas
@@ -0,0 +1,159 @@
+import bisect
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+import redis
+
+
+class RedisRouter(object):
+    """
+    RedisRouter - Decides which of several Redis nodes holds a key, so that the Redis
+    persister can spread games across more than one node. Two routers are provided:
+
+    * RedisHashRing - client-side consistent hashing across independent nodes.
+    * RedisClusterRouter - the slot map of a Redis Cluster.
+
+    """
+    #
+    # 'public' methods
+    #
+    def node_for(self, key=None):
+        """
+        Return the node holding a key.
+
+        :param key: <required> The key.
+        :return: <tuple> of the node name (host:port) and its Redis client.
+        """
+        raise NotImplementedError()
+
+    def group(self, keys=None):
+        """
+        Group keys by the node holding them, so that bulk operations make one round
+        trip to each node.
+
+        :param keys: <required> A list of keys.
+        :return: <list> of tuples of a Redis client and the keys it holds.
+        """
+        _groups = OrderedDict()
+        for _key in keys:
+            _name, _client = self.node_for(key=_key)
+            _groups.setdefault(_name, (_client, []))[1].append(_key)
+        return list(_groups.values())
+
+    def redirect(self, error=None):
+        """
+        Return where to resend a command which was redirected (by a MOVED or ASK error).
+
+        :param error: <required> The redis.exceptions.MovedError or AskError.
+        :return: <tuple> of the Redis client and whether ASKING must be sent first.
+        """
+        raise error
+
+    def clients(self):
+        """The Redis client of each node. :return: <dict> of node name to client"""
+        raise NotImplementedError()
+
+
+class RedisHashRing(RedisRouter):
+    """
+    A consistent hash ring: each node is placed on the ring at virtual_nodes points
+    (the md5 of "<node name>#<n>") and a key belongs to the first node at or after
+    the md5 of the key. When a node is added, only the keys which fall between its
+    points and the points before them (about 1/n of the keys) move to it.
+
+    """
+    def __init__(self, nodes=None, virtual_nodes=160):
+        """
+        :param nodes: <required> A dict of node name (host:port) to a Redis client.
+        :param virtual_nodes: <optional> The points each node has on the ring.
+        """
+        if not nodes:
+            raise ValueError("At least one Redis node must be provided.")
+        if not isinstance(virtual_nodes, int) or virtual_nodes < 1:
+            raise ValueError("virtual_nodes must be a whole number greater than 0.")
+
+        self._virtual_nodes = virtual_nodes
+        self._lock = threading.Lock()
+        self._nodes = {}
+        self._points = []
+        self._owners = []
+        for _name, _client in nodes.items():
+            self.add_node(name=_name, client=_client)
+
+    #
+    # 'public' methods
+    #
+    def add_node(self, name=None, client=None):
+        with self._lock:
+            self._nodes[name] = client
+            self._build()
+
+    def remove_node(self, name=None):
+        with self._lock:
+            if len(self._nodes) == 1 and name in self._nodes:
+                raise ValueError("The last node cannot be removed.")
+            self._nodes.pop(name, None)
+            self._build()
+
+    def node_for(self, key=None):
+        _point = self._hash(str(key))
+        with self._lock:
+            _index = bisect.bisect_left(self._points, _point) % len(self._points)
+            _name = self._owners[_index]
+            return _name, self._nodes[_name]
+
+    def clients(self):
+        with self._lock:
+            return dict(self._nodes)
+
+    #
+    # 'private' methods
+    #
+    def _build(self):
+        _ring = sorted(
+            (self._hash("{}#{}".format(_name, _n)), _name)
+            for _name in self._nodes
+            for _n in range(self._virtual_nodes)
+        )
+        self._points = [_point for _point, _ in _ring]
+        self._owners = [_name for _, _name in _ring]
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class RedisClusterRouter(RedisRouter):
+    """
+    Routes keys by the slot map of a Redis Cluster, kept by a redis.cluster.RedisCluster
+    client. Commands are sent to each node's own client; a MOVED error refreshes the
+    slot map and an ASK error (a slot being migrated) resends the command to the node
+    named, preceded by ASKING.
+
+    """
+    def __init__(self, cluster=None):
+        """
+        :param cluster: <required> A redis.cluster.RedisCluster client.
+        """
+        self._cluster = cluster
+
+    def node_for(self, key=None):
+        _node = self._cluster.get_node_from_key(str(key))
+        return _node.name, _node.redis_connection
+
+    def redirect(self, error=None):
+        _asking = isinstance(error, redis.exceptions.AskError)
+        if not _asking:
+            self._cluster.nodes_manager.initialize()
+        _node = self._cluster.get_node(host=error.host, port=error.port)
+        if _node is None:
+            self._cluster.nodes_manager.initialize()
+            _node = self._cluster.get_node(host=error.host, port=error.port)
+        if _node is None:
+            raise error
+        return _node.redis_connection, _asking
+
+    def clients(self):
+        return dict((_node.name, _node.redis_connection) for _node in self._cluster.get_primaries())
@@ -0,0 +1,14 @@
+class VersionConflict(Exception):
+    """
+    VersionConflict - Raised by a persister when a game is saved with an
+    expected_version which is no longer the version stored, i.e. the game was
+    changed by another request after it was loaded. The caller may load the
+    game again and retry.
+
+    """
+    def __init__(self, key=None, expected_version=None):
+        self.key = key
+        self.expected_version = expected_version
+        super(VersionConflict, self).__init__(
+            "Key {} is no longer at version {}".format(key, expected_version)
+        )
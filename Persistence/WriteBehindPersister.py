@@ -0,0 +1,326 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from Persistence.AbstractPersister import AbstractPersister
+
+
+class WriteBehindPersister(AbstractPersister):
+    """
+    WriteBehindPersister - Wraps a persister so that saves, updates and deletes
+    return as soon as they are queued in memory; a background thread writes the
+    queue to the wrapped persister every interval_ms (or sooner once max_batch keys
+    are waiting), with save_many and delete_many. Writes to the same key are
+    coalesced, so only the last is written. Reads see queued writes.
+
+    Queued writes are also appended to a spool file in spool_dir, which is emptied
+    once they have been written. When a persister starts, it replays the spools left
+    by processes which are no longer running (e.g. a worker which crashed), so
+    only writes not yet appended to the spool (or not yet synced to disk, unless
+    fsync is set) can be lost. close, which is called at exit, writes the queue.
+    Each spooled write records when it was made, so that where several spools hold
+    writes to a key, the latest is replayed.
+
+    Writes are unconditional (last write wins): games are loaded with a version of
+    None, so they are saved without an expected_version, and atomic guesses are
+    not used.
+
+    """
+    SPOOL_PREFIX = "cowbull-write-behind-"
+
+    atomic_guesses = False
+
+    def __init__(self, persister=None, spool_dir=None, interval_ms=100, max_batch=500, fsync=False):
+        """
+        :param persister: <required> The persister to wrap.
+        :param spool_dir: <optional> The directory for spool files; if None, queued
+        writes are only held in memory.
+        :param interval_ms: <optional> Milliseconds between writes of the queue.
+        :param max_batch: <optional> The number of queued keys which causes the queue
+        to be written early, and the most keys written in one call.
+        :param fsync: <optional> Sync the spool to disk after every write.
+        """
+        super(WriteBehindPersister, self).__init__()
+        if not isinstance(persister, AbstractPersister):
+            raise TypeError("The persister must be a subclass of an AbstractPersister!")
+        if interval_ms <= 0 or not isinstance(max_batch, int) or max_batch < 1:
+            raise ValueError("interval_ms and max_batch must be greater than 0.")
+
+        self.handler.module = "Write Behind Persister"
+        self._persister = persister
+        self._spool_dir = spool_dir
+        self._interval = interval_ms / 1000.0
+        self._max_batch = max_batch
+        self._fsync = fsync
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._closed = False
+        self._start()
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        # e.g. partial_updates of the Redis persister.
+        if name.startswith("__") or "_persister" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self._persister, name)
+
+    #
+    # Properties
+    #
+    @property
+    def persister(self):
+        return self._persister
+
+    #
+    # 'public' methods
+    #
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(WriteBehindPersister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+        self._enqueue({key: (jsonstr, ttl)})
+
+    def update(self, key=None, fields=None, jsonstr=None, expected_version=None, ttl=None):
+        self._check_writes(writes=[{"key": key, "fields": fields, "jsonstr": jsonstr}], method="update")
+        self._enqueue({key: (jsonstr, ttl)})
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        self._enqueue(OrderedDict((_key, (_jsonstr, self._ttl_for(ttl, _key))) for _key, _jsonstr in _items.items()))
+
+    def write_many(self, writes=None):
+        _writes = self._check_writes(writes=writes, method="write_many")
+        self._enqueue(OrderedDict((_write["key"], (_write["jsonstr"], _write.get("ttl"))) for _write in _writes))
+        return [None] * len(_writes)
+
+    def delete(self, key=None):
+        self.delete_many(keys=[key])
+
+    def delete_many(self, keys=None):
+        self._enqueue(OrderedDict((_key, (None, None)) for _key in self._check_keys(keys=keys, method="delete_many")))
+
+    def load(self, key=None):
+        super(WriteBehindPersister, self).load(key=key)
+        _found, _jsonstr = self._queued(key)
+        if not _found:
+            return self._persister.load(key=key)
+        if _jsonstr is None:
+            raise KeyError("Unable to load key {}".format(key))
+        return _jsonstr
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        _results, _missing = {}, []
+        for _key in _keys:
+            _found, _jsonstr = self._queued(_key)
+            if _found:
+                _results[_key] = _jsonstr
+            else:
+                _missing.append(_key)
+        if _missing:
+            _results.update(self._persister.load_many(keys=_missing))
+        return _results
+
+    def load_many_versioned(self, keys=None):
+        # Games are not versioned (see above).
+        return dict(
+            (_key, (_jsonstr, None) if _jsonstr is not None else (None, None))
+            for _key, _jsonstr in self.load_many(keys=keys).items()
+        )
+
+    def stats(self):
+        with self._lock:
+            _counts = dict(self._counts, queued=len(self._queue), in_flight=len(self._in_flight))
+        _stats = dict(self._persister.stats() or {})
+        _stats["write_behind"] = _counts
+        return _stats
+
+    def sweep(self, limit=None):
+        return self._persister.sweep(limit=limit)
+
+    def close(self):
+        """Stop the background thread and write the queue to the wrapped persister."""
+        self._closed = True
+        if self._pid != os.getpid():
+            return
+        self._wake.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        while self._queue and self._flush():
+            pass
+
+    #
+    # 'private' methods
+    #
+    def _start(self):
+        # The background thread does not survive a fork, so each process starts its
+        # own (with its own queue and spool).
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = OrderedDict()
+            self._in_flight = {}
+            self._counts = {"written": 0, "failed_flushes": 0, "replayed": 0}
+            self._spool = None
+            self._replay()
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="write-behind")
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _enqueue(self, items):
+        self._start()
+        _now = time.time()
+        with self._lock:
+            for _key, _write in items.items():
+                _write = _write + (_now,)
+                self._spool_write(_key, _write)
+                self._queue.pop(_key, None)
+                self._queue[_key] = _write
+            self._spool_sync()
+            if len(self._queue) >= self._max_batch:
+                self._wake.set()
+
+    def _queued(self, key):
+        self._start()
+        with self._lock:
+            if key in self._queue:
+                return True, self._queue[key][0]
+            if key in self._in_flight:
+                return True, self._in_flight[key][0]
+        return False, None
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if not self._closed:
+                self._flush()
+
+    def _flush(self):
+        # Write the whole queue; its spool is set aside (as <spool>.flushing) until
+        # it has been written.
+        with self._lock:
+            if not self._queue:
+                return True
+            _batch, self._queue = self._queue, OrderedDict()
+            self._in_flight = _batch
+            self._spool_rotate()
+
+        _saves = [(_key, _write) for _key, _write in _batch.items() if _write[0] is not None]
+        _deletes = [_key for _key, _write in _batch.items() if _write[0] is None]
+        try:
+            for _start in range(0, len(_saves), self._max_batch):
+                _chunk = _saves[_start:_start + self._max_batch]
+                self._persister.save_many(
+                    items=dict((_key, _write[0]) for _key, _write in _chunk),
+                    ttl=dict((_key, _write[1]) for _key, _write in _chunk)
+                )
+            for _start in range(0, len(_deletes), self._max_batch):
+                self._persister.delete_many(keys=_deletes[_start:_start + self._max_batch])
+        except Exception as e:
+            self.handler.log(message="Unable to write {} queued keys: {}".format(len(_batch), str(e)))
+            with self._lock:
+                # Queue the writes again (unless the keys were written since).
+                for _key, _write in _batch.items():
+                    if _key not in self._queue:
+                        self._spool_write(_key, _write)
+                        self._queue[_key] = _write
+                self._spool_sync()
+                self._in_flight = {}
+                self._counts["failed_flushes"] += 1
+                self._spool_remove(".flushing")
+            return False
+
+        with self._lock:
+            self._in_flight = {}
+            self._counts["written"] += len(_batch)
+            self._spool_remove(".flushing")
+        return True
+
+    def _spool_path(self, pid=None):
+        return os.path.join(self._spool_dir, "{}{}.spool".format(self.SPOOL_PREFIX, pid or os.getpid()))
+
+    def _spool_write(self, key, write):
+        if self._spool is not None:
+            self._spool.write(json.dumps({"key": key, "jsonstr": write[0], "ttl": write[1], "at": write[2]}) + "\n")
+
+    def _spool_sync(self):
+        if self._spool is not None:
+            self._spool.flush()
+            if self._fsync:
+                os.fsync(self._spool.fileno())
+
+    def _spool_rotate(self):
+        if self._spool is not None:
+            self._spool.close()
+            os.rename(self._spool_path(), self._spool_path() + ".flushing")
+            self._spool = open(self._spool_path(), "a")
+
+    def _spool_remove(self, suffix):
+        if self._spool is not None and os.path.exists(self._spool_path() + suffix):
+            os.remove(self._spool_path() + suffix)
+
+    def _replay(self):
+        # Queue the writes in the spools of processes which are no longer running
+        # (and this process's, e.g. after a restart with the same pid). The order of
+        # the spools says nothing of the order of writes to a key in different
+        # spools, so the write made last (by its time) is kept.
+        if not self._spool_dir:
+            return
+        if not os.path.isdir(self._spool_dir):
+            os.makedirs(self._spool_dir)
+
+        _claimed = []
+        for _name in sorted(os.listdir(self._spool_dir), key=lambda _name: not _name.endswith(".flushing")):
+            if not _name.startswith(self.SPOOL_PREFIX):
+                continue
+            _pid = _name[len(self.SPOOL_PREFIX):].split(".")[0]
+            if not _pid.isdigit() or (int(_pid) != os.getpid() and self._running(int(_pid))):
+                continue
+            _path = os.path.join(self._spool_dir, _name)
+            _claim = "{}.replay-{}".format(self._spool_path(), len(_claimed))
+            while os.path.exists(_claim) and _claim != _path:
+                _claim += "-"
+            try:
+                # Renaming claims the spool, should another process be replaying too.
+                os.rename(_path, _claim)
+            except OSError:
+                continue
+            _claimed.append(_claim)
+            with open(_claim) as _spool:
+                for _line in _spool:
+                    try:
+                        _entry = json.loads(_line)
+                    except ValueError:
+                        # A write cut short by the crash.
+                        continue
+                    _at = _entry.get("at", 0)
+                    if _entry["key"] in self._queue and self._queue[_entry["key"]][2] > _at:
+                        continue
+                    self._queue.pop(_entry["key"], None)
+                    self._queue[_entry["key"]] = (_entry["jsonstr"], _entry.get("ttl"), _at)
+
+        self._spool = open(self._spool_path(), "a")
+        for _key, _write in self._queue.items():
+            self._spool_write(_key, _write)
+        self._spool_sync()
+        for _claim in _claimed:
+            os.remove(_claim)
+        self._counts["replayed"] = len(self._queue)
+        if self._queue:
+            self.handler.log(message="Replayed {} queued keys from {} spools".format(len(self._queue), len(_claimed)))
+
+    @staticmethod
+    def _running(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            # EPERM: the process exists but belongs to another user.
+            return e.errno == 1
+        return True
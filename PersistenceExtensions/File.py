@@ -1,59 +1,313 @@
 from flask_helpers.ErrorHandler import ErrorHandler
 from Persistence.AbstractPersister import AbstractPersister
-import io
-import json
-import pymongo
+from Persistence.VersionConflict import VersionConflict
+import errno
+import fcntl
+import hashlib
+import os
+import threading
+import time
 
 
 class Persister(AbstractPersister):
+    # Each key file starts with a header line holding the game's version and one
+    # holding when it expires (seconds since the epoch); files written before
+    # versions were kept have no headers, are at version 0 and do not expire.
+    # Expired files are treated as missing and deleted by sweep.
+    VERSION_HEADER = "cowbull-version:"
+    EXPIRES_HEADER = "cowbull-expires:"
+
+    FSYNC_POLICIES = ("none", "always", "batch")
+
+    # Writers lock one of LOCK_STRIPES lock files (<root>/.locks/<nn>), chosen by
+    # the md5 of the key. Lock files are never removed: a process could otherwise
+    # lock a file another had just unlinked, and two writers would each hold "the"
+    # lock of a key.
+    LOCK_DIRECTORY = ".locks"
+    LOCK_STRIPES = 256
+
     def __init__(
-        self
+        self,
+        root="/tmp/cowbull",
+        shard_depth=2,
+        fsync="none",
+        fsync_interval_ms=1000,
+        legacy_root="/tmp"
     ):
+        """
+        :param root: <optional> The directory holding the key files.
+        :param shard_depth: <optional> Key files are kept in shard_depth levels of
+        subdirectories named by the leading pairs of hex digits of the md5 of the
+        key (e.g. <root>/3f/a2/<key>.cow), so that no directory holds more than a
+        few hundred entries (or, at depth 2, about 1/65536 of the games); 0 keeps
+        them all in root.
+        :param fsync: <optional> When written key files are synced to disk: none (left
+        to the operating system), always (before a save returns) or batch (every
+        fsync_interval_ms, if there were writes).
+        :param fsync_interval_ms: <optional> The interval of the batch fsync policy.
+        :param legacy_root: <optional> The directory of key files written by earlier
+        releases (<legacy_root>/<key>.cow). A game not found in root is loaded from
+        there, and moved into root when it is next saved; None disables this.
+        """
         super(Persister, self).__init__()
 
         self.handler.module="File Persister"
-        self.handler.log(message="Preparing file system")
+        self.handler.log(message="Preparing file system at {}".format(root))
 
+        if not isinstance(shard_depth, int) or not 0 <= shard_depth <= 4:
+            raise ValueError("shard_depth must be a whole number from 0 to 4.")
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError("fsync must be one of {}.".format(", ".join(self.FSYNC_POLICIES)))
 
-    def save(self, key=None, jsonstr=None):
-        super(Persister, self).save(key=key, jsonstr=jsonstr)
+        self._root = os.path.abspath(root)
+        self._legacy_root = os.path.abspath(legacy_root) if legacy_root else None
+        self._shard_depth = shard_depth
+        self._fsync = fsync
+        self._fsync_interval = fsync_interval_ms / 1000.0
+        self._unsynced = threading.Event()
+        self._unsynced_lock = threading.Lock()
+        self._unsynced_paths = set()
+        self._syncer_pid = None
 
-        filename = '/tmp/{}.cow'.format(key)
+        self._make_directory(os.path.join(self._root, self.LOCK_DIRECTORY))
 
-        self.handler.log(message="Opening file: {}".format(filename))
-        try:
-            f=open(filename, 'w')
-        except IOError as ioe:
-            raise KeyError("Unable to open the key file: {}".format(str(filename)))
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+
+        filename = self._filename(key)
 
         self.handler.log(message="Writing key {} and json {} to file: {}".format(key, jsonstr, filename))
-        try:
-            f.write(jsonstr)
-        except IOError as ioe:
-            raise KeyError("Unable to write to the key file: {}".format(str(filename)))
-        finally:
-            f.close()
-        self.handler.log(message="Key set.")
+        _version = self._write(key, jsonstr, expected_version=expected_version, ttl=ttl)
+        self.handler.log(message="Key set at version {}.".format(_version))
 
     def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
         super(Persister, self).load(key=key)
 
-        filename = '/tmp/{}.cow'.format(key)
+        filename = self._filename(key)
 
-        self.handler.log(message="Opening file: {}".format(filename))
+        self.handler.log(message="Reading key {} from file: {}".format(key, filename))
         try:
-            f=open(filename, 'r')
+            json_return, _version = self._read_key(key)
         except IOError as ioe:
             raise KeyError("Unable to open the key file: {}".format(str(filename)))
 
-        self.handler.log(message="Reading key {} from file: {}".format(key, filename))
-        json_return = None
+        self.handler.log(message="Fetched {} from key {} in file: {}".format(json_return, key, filename))
+        return json_return, _version
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        self.handler.log(message="Reading {} key files".format(len(_keys)))
+        _results = {}
+        for _key in _keys:
+            try:
+                _results[_key] = self._read_key(_key)[0]
+            except (IOError, KeyError):
+                _results[_key] = None
+        return _results
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        self.handler.log(message="Writing {} key files".format(len(_items)))
+        for _key, _jsonstr in _items.items():
+            self._write(_key, _jsonstr, ttl=self._ttl_for(ttl, _key))
+
+    def delete(self, key=None):
+        self.delete_many(keys=[key])
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        self.handler.log(message="Deleting {} key files".format(len(_keys)))
+        for _key in _keys:
+            _filename = self._filename(_key)
+            try:
+                with open(self._lockname(_key), 'a') as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    self._remove(_filename)
+                    self._remove(self._legacy_filename(_key))
+            except (IOError, OSError):
+                raise KeyError("Unable to delete the key file: {}".format(_filename))
+
+    def sweep(self, limit=None):
+        _deleted = 0
+        for _directory, _, _names in os.walk(self._root):
+            for _name in _names:
+                if limit is not None and _deleted >= limit:
+                    return _deleted
+                if _name.endswith(".cow") and self._sweep_file(os.path.join(_directory, _name)):
+                    _deleted += 1
+                elif _name.endswith(".tmp"):
+                    self._sweep_temporary(os.path.join(_directory, _name))
+        if _deleted:
+            self.handler.log(message="Swept {} expired key files".format(_deleted))
+        return _deleted
+
+    def _sweep_file(self, filename):
         try:
-            json_return=f.read()
-        except IOError as ioe:
-            raise KeyError("Unable to open the key file: {}".format(str(filename)))
+            with open(self._lockname(os.path.basename(filename)[:-len(".cow")]), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not self._expired(filename):
+                    return False
+                os.remove(filename)
+            return True
+        except (IOError, OSError) as e:
+            self.handler.log(message="Unable to sweep {}: {}".format(filename, str(e)))
+            return False
+
+    def _sweep_temporary(self, filename):
+        # A temporary file left by a process which died while writing it.
+        try:
+            if os.path.getmtime(filename) < time.time() - self.TTL:
+                os.remove(filename)
+        except OSError:
+            pass
+
+    def _write(self, key, jsonstr, expected_version=None, ttl=None):
+        # The key file is replaced by renaming a new file over it, so readers see
+        # either the old or the new game, never a partly written one. Writers (in any
+        # process) hold an exclusive lock on the key's lock file (see LOCK_STRIPES)
+        # while they check the version and replace the file.
+        filename = self._filename(key)
+        try:
+            self._make_directory(os.path.dirname(filename))
+            with open(self._lockname(key), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    _version = self._read_key(key)[1]
+                except IOError:
+                    _version = None
+                if expected_version is not None and _version != expected_version:
+                    raise VersionConflict(key=key, expected_version=expected_version)
+
+                _version = (_version or 0) + 1
+                _temporary = "{}.{}.{}.tmp".format(filename, os.getpid(), threading.current_thread().ident)
+                with open(_temporary, 'w') as f:
+                    f.write("{}{}\n{}{:.3f}\n{}".format(
+                        self.VERSION_HEADER, _version, self.EXPIRES_HEADER, self._expires_at(ttl), jsonstr
+                    ))
+                    if self._fsync == "always":
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(_temporary, filename)
+                self._remove(self._legacy_filename(key))
+                self._synced(filename)
+        except (IOError, OSError):
+            raise KeyError("Unable to write to the key file: {}".format(str(filename)))
+        return _version
+
+    def _synced(self, filename):
+        # Apply the fsync policy once a key file has been replaced: the rename is
+        # durable once its directory is synced.
+        if self._fsync == "always":
+            self._fsync_path(os.path.dirname(filename))
+        elif self._fsync == "batch":
+            self._start_syncer()
+            with self._unsynced_lock:
+                self._unsynced_paths.add(filename)
+                self._unsynced_paths.add(os.path.dirname(filename))
+            self._unsynced.set()
+
+    def _start_syncer(self):
+        # The syncing thread does not survive a fork, so each process starts its own.
+        if self._syncer_pid == os.getpid():
+            return
+        self._syncer_pid = os.getpid()
+        _thread = threading.Thread(target=self._sync_batches, name="file-fsync")
+        _thread.daemon = True
+        _thread.start()
+
+    def _sync_batches(self):
+        # Only the key files written since the last batch, and their directories,
+        # are synced.
+        while True:
+            self._unsynced.wait()
+            time.sleep(self._fsync_interval)
+            with self._unsynced_lock:
+                self._unsynced.clear()
+                _paths, self._unsynced_paths = self._unsynced_paths, set()
+            for _path in sorted(_paths, key=len, reverse=True):
+                try:
+                    self._fsync_path(_path)
+                except OSError as ose:
+                    # e.g. a key file deleted since it was written.
+                    if ose.errno != errno.ENOENT:
+                        self.handler.log(message="Unable to sync {}: {}".format(_path, str(ose)))
+
+    @staticmethod
+    def _fsync_path(path):
+        _fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(_fd)
         finally:
-            f.close()
+            os.close(_fd)
 
-        self.handler.log(message="Fetched {} from key {} in file: {}".format(json_return, key, filename))
-        return json_return
+    def _read_key(self, key):
+        # The key file in root or, failing that, one written by an earlier release.
+        try:
+            return self._read(self._filename(key))
+        except IOError as ioe:
+            _legacy = self._legacy_filename(key)
+            if ioe.errno != errno.ENOENT or _legacy is None or not os.path.isfile(_legacy):
+                raise
+        return self._read(_legacy)
+
+    def _read(self, filename):
+        with open(filename, 'r') as f:
+            _content = f.read()
+        if not _content.startswith(self.VERSION_HEADER):
+            return _content, 0
+        _header, _, _content = _content.partition("\n")
+        if _content.startswith(self.EXPIRES_HEADER):
+            _expires, _, _content = _content.partition("\n")
+            if float(_expires[len(self.EXPIRES_HEADER):]) <= time.time():
+                raise IOError(errno.ENOENT, "The key file has expired", filename)
+        return _content, int(_header[len(self.VERSION_HEADER):])
+
+    def _expired(self, filename):
+        # Only the headers are read.
+        with open(filename, 'r') as f:
+            _header = f.readline()
+            _expires = f.readline() if _header.startswith(self.VERSION_HEADER) else ""
+        if not _expires.startswith(self.EXPIRES_HEADER):
+            return False
+        return float(_expires[len(self.EXPIRES_HEADER):]) <= time.time()
+
+    @staticmethod
+    def _remove(filename):
+        if filename is None:
+            return
+        try:
+            os.remove(filename)
+        except OSError as ose:
+            if ose.errno != errno.ENOENT:
+                raise
+
+    @staticmethod
+    def _make_directory(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as ose:
+            if ose.errno != errno.EEXIST:
+                raise
+
+    def _filename(self, key):
+        _key = str(key)
+        if not _key or os.sep in _key or _key.startswith("."):
+            raise KeyError("Invalid key: {}".format(_key))
+        _digest = hashlib.md5(_key.encode("utf-8")).hexdigest()
+        return os.path.join(
+            self._root,
+            *([_digest[2 * _level:2 * _level + 2] for _level in range(self._shard_depth)] + ["{}.cow".format(_key)])
+        )
+
+    def _legacy_filename(self, key):
+        if self._legacy_root is None:
+            return None
+        _filename = os.path.join(self._legacy_root, "{}.cow".format(key))
+        return None if _filename == self._filename(key) else _filename
+
+    def _lockname(self, key):
+        _stripe = int(hashlib.md5(str(key).encode("utf-8")).hexdigest(), 16) % self.LOCK_STRIPES
+        return os.path.join(self._root, self.LOCK_DIRECTORY, "{:02x}".format(_stripe))
@@ -1,10 +1,19 @@
 from google.cloud import storage
+from google.cloud.exceptions import NotFound, PreconditionFailed
 from google.oauth2 import service_account
 from Persistence.AbstractPersister import AbstractPersister
+from Persistence.VersionConflict import VersionConflict
+from datetime import datetime
+import calendar
 import google.auth
+import time
 
 
 class Persister(AbstractPersister):
+    # Each blob's custom_time is when the game expires. Loads treat an expired game
+    # as missing; the bucket should have a lifecycle rule deleting blobs once
+    # daysSinceCustomTime is 0 (see the README).
+
     def __init__(self, bucket=None, credentials_file=None, project=None):
         super(Persister, self).__init__()
         self.handler.module = "GAEStorage"
@@ -84,7 +93,7 @@ class Persister(AbstractPersister):
         )
         return downloaded_string
 
-    def _set_blob_content(self, blob=None, content=None):
+    def _set_blob_content(self, blob=None, content=None, expected_version=None, ttl=None):
         if not blob:
             raise ValueError("_get_blob_content: blob is none.")
         if not content:
@@ -93,19 +102,78 @@ class Persister(AbstractPersister):
             raise TypeError("_get_blob: Non-string content passed.")
 
         self.handler.log(message="Uploading key with value {}".format(content))
-        blob.upload_from_string(
-            data=content,
-            content_type="application/json"
-        )
+        # The version of a game is its blob generation; with an expected_version the
+        # blob is only replaced if it is still at that generation.
+        blob.custom_time = datetime.utcfromtimestamp(self._expires_at(ttl))
+        try:
+            blob.upload_from_string(
+                data=content,
+                content_type="application/json",
+                if_generation_match=expected_version
+            )
+        except PreconditionFailed:
+            raise VersionConflict(key=blob.name, expected_version=expected_version)
         self.handler.log(message="Completed upload")
 
     def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
         super(Persister, self).load(key=key)
-        blob = self._get_blob(key=key)
+        # get_blob fetches the blob's generation; the download is then of that
+        # generation, so the game returned is the game at the version returned.
+        blob = self.bucket.get_blob(key)
+        if blob is None or self._expired(blob):
+            raise KeyError("Unable to load key {}".format(key))
         downloaded_string = self._get_blob_content(blob=blob)
-        return downloaded_string
+        return downloaded_string, blob.generation
 
-    def save(self, key=None, jsonstr=None):
-        super(Persister, self).save(key=key, jsonstr=jsonstr)
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
         blob = self._get_blob(key=key)
-        self._set_blob_content(blob=blob, content=jsonstr)
+        self._set_blob_content(blob=blob, content=jsonstr, expected_version=expected_version, ttl=ttl)
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        self.handler.log(message="Fetching {} blobs concurrently".format(len(_keys)))
+        return dict(zip(_keys, self._run_concurrently(
+            self._load_or_none,
+            [(_key,) for _key in _keys]
+        )))
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        self.handler.log(message="Uploading {} blobs concurrently".format(len(_items)))
+        self._run_concurrently(
+            lambda _key, _jsonstr: self.save(key=_key, jsonstr=_jsonstr, ttl=self._ttl_for(ttl, _key)),
+            list(_items.items())
+        )
+
+    def delete(self, key=None):
+        self._check_keys(keys=[key], method="delete")
+        self.handler.log(message="Deleting blob {}".format(key))
+        try:
+            self._get_blob(key=key).delete()
+        except NotFound:
+            self.handler.log(message="Blob {} does not exist".format(key))
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        self.handler.log(message="Deleting {} blobs concurrently".format(len(_keys)))
+        self._run_concurrently(
+            lambda _key: self.delete(key=_key),
+            [(_key,) for _key in _keys]
+        )
+
+    @staticmethod
+    def _expired(blob):
+        if blob.custom_time is None:
+            return False
+        return calendar.timegm(blob.custom_time.utctimetuple()) <= time.time()
+
+    def _load_or_none(self, key):
+        try:
+            return self.load(key=key)
+        except Exception as e:
+            self.handler.log(message="Unable to load blob {}: {}".format(key, str(e)))
+            return None
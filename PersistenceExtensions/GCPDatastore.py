@@ -1,10 +1,19 @@
 from datetime import datetime
 from flask_helpers.ErrorHandler import ErrorHandler
 from google.cloud import datastore
+from google.cloud.exceptions import Conflict
 from Persistence.AbstractPersister import AbstractPersister
+from Persistence.VersionConflict import VersionConflict
+import time
 
 
 class Persister(AbstractPersister):
+    BATCH_LIMIT = 500   # Most entities Datastore accepts in one multi call
+
+    # Each game holds when it expires (expires_at, seconds since the epoch). Datastore
+    # cannot expire entities, so expired games are treated as missing and deleted
+    # by sweep.
+
     def __init__(self):
         super(Persister, self).__init__()
 
@@ -22,7 +31,6 @@ class Persister(AbstractPersister):
             self.handler.log(message="Creating datastore key: {}".format(key))
             _key = self.datastore_client.key(self.kind, key)
         except Exception as e:
-            print("Exception while getting datastore client - {}".format(str(e)))
             self.handler.log(message="In GCPDatastorePersist __init__ an exception occurred: {}".format(repr(e)))
             raise
 
@@ -31,7 +39,6 @@ class Persister(AbstractPersister):
             _save = datastore.Entity(key=_key)
             _save['game'] = "validation: {}".format(current_date)
         except Exception as e:
-            print("Exception while getting datastore Entity - {}".format(str(e)))
             self.handler.log(message="In GCPDatastorePersist __init__ an exception occurred: {}".format(repr(e)))
             raise
 
@@ -39,59 +46,147 @@ class Persister(AbstractPersister):
         try:
             self.datastore_client.put(_save)
         except Exception as e:
-            print("Exception while putting data - {}".format(str(e)))
             self.handler.log(message="In GCPDatastorePersist __init__ an exception occurred: {}".format(repr(e)))
             raise
 
         self.handler.log(message="Datastore client fetched")
 
-    def save(self, key=None, jsonstr=None):
-        super(Persister, self).save(key=key, jsonstr=jsonstr)
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
 
         self.handler.log(message="Creating datastore key: {}".format(key))
         try:
             _key = self.datastore_client.key(self.kind, key)
         except Exception as e:
-            print("Exception - {}".format(str(e)))
-            return self.handler.error(status=500, message="Exception {}".format(repr(e)))
+            raise KeyError("An exception occurred: {}".format(str(e)))
 
         if not _key:
             raise ValueError("The key was returned as None!")
 
-        self.handler.log(message="Fetching entity: {}".format(_key))
-        try:
-            _save = datastore.Entity(key=_key)
-        except Exception as e:
-            print("Exception - {}".format(str(e)))
-            return self.handler.error(status=500, message="Exception {}".format(repr(e)))
-
-        _save["game"] = jsonstr
+        # The version is read and the game written in one transaction, so a
+        # concurrent save of the same game makes one of the transactions fail.
         self.handler.log(message="Writing game to GCP Datastore")
         try:
-            self.datastore_client.put(_save)
+            with self.datastore_client.transaction():
+                _save = self.datastore_client.get(_key)
+                _version = _save.get("version", 0) if not self._expired(_save) else None
+                if expected_version is not None and _version != expected_version:
+                    raise VersionConflict(key=key, expected_version=expected_version)
+                if _save is None:
+                    _save = datastore.Entity(key=_key)
+                _save["game"] = jsonstr
+                _save["version"] = (_version or 0) + 1
+                _save["expires_at"] = self._expires_at(ttl)
+                self.datastore_client.put(_save)
+        except VersionConflict:
+            raise
+        except Conflict:
+            raise VersionConflict(key=key, expected_version=expected_version)
         except Exception as e:
-            print("Exception - {}".format(str(e)))
-            return self.handler.error(status=500, message="Exception {}".format(repr(e)))
+            raise KeyError("An exception occurred: {}".format(str(e)))
 
     def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
         super(Persister, self).load(key=key)
 
         self.handler.log(message="Calling datastore query on key: {}".format(key))
         self.handler.log(message="Creating datastore key: {}".format(key))
         try:
             _key = self.datastore_client.key(self.kind, key)
-        except Exception as e:
-            print("Exception - {}".format(str(e)))
-            return self.handler.error(status=500, message="Exception {}".format(repr(e)))
-
-        try:
             save = self.datastore_client.get(_key)
-            if not save:
-                raise ValueError("Key not found")
         except Exception as e:
-            print("Exception - {}".format(str(e)))
-            return self.handler.error(status=500, message="Exception {}".format(repr(e)))
+            raise KeyError("An exception occurred: {}".format(str(e)))
+        if self._expired(save):
+            raise KeyError("Unable to load key {}".format(key))
 
         self.handler.log(message="Query returned: {}".format(save))
         self.handler.log(message="Query returned: {}".format(save["game"]))
-        return save["game"]
+        return save["game"], save.get("version", 0)
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        if not _items:
+            return
+
+        self.handler.log(message="Creating {} datastore entities".format(len(_items)))
+        self.handler.log(message="Writing games to GCP Datastore")
+        try:
+            for _chunk in self._chunks(list(_items)):
+                # The versions of existing games are read so that they continue to
+                # increase; the games are not locked (see save for that).
+                _keys = [self.datastore_client.key(self.kind, _key) for _key in _chunk]
+                _versions = dict(
+                    (_entity.key.name, _entity.get("version", 0))
+                    for _entity in self.datastore_client.get_multi(_keys)
+                )
+                _entities = []
+                for _key, _datastore_key in zip(_chunk, _keys):
+                    _save = datastore.Entity(key=_datastore_key)
+                    _save["game"] = _items[_key]
+                    _save["version"] = _versions.get(_key, 0) + 1
+                    _save["expires_at"] = self._expires_at(ttl, _key)
+                    _entities.append(_save)
+                self.datastore_client.put_multi(_entities)
+        except Exception as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        if not _keys:
+            return {}
+
+        self.handler.log(message="Fetching {} datastore entities".format(len(_keys)))
+        try:
+            _entities = []
+            for _chunk in self._chunks(_keys):
+                _entities.extend(self.datastore_client.get_multi(
+                    [self.datastore_client.key(self.kind, _key) for _key in _chunk]
+                ))
+        except Exception as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+
+        _found = dict((_entity.key.name, _entity["game"]) for _entity in _entities if not self._expired(_entity))
+        return dict((_key, _found.get(_key, None)) for _key in _keys)
+
+    def delete(self, key=None):
+        self.delete_many(keys=[key])
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        if not _keys:
+            return
+
+        self.handler.log(message="Deleting {} datastore entities".format(len(_keys)))
+        for _chunk in self._chunks(_keys):
+            self.datastore_client.delete_multi(
+                [self.datastore_client.key(self.kind, _key) for _key in _chunk]
+            )
+
+    def sweep(self, limit=None):
+        # Expired games are found by a keys only query, read a page at a time (each
+        # page continuing from the cursor of the last).
+        query = self.datastore_client.query(kind=self.kind)
+        query.add_filter("expires_at", "<=", time.time())
+        query.keys_only()
+        _deleted = 0
+        for _page in query.fetch(limit=limit).pages:
+            _keys = [_entity.key for _entity in _page]
+            for _chunk in self._chunks(_keys):
+                self.datastore_client.delete_multi(_chunk)
+            _deleted += len(_keys)
+        if _deleted:
+            self.handler.log(message="Swept {} expired datastore entities".format(_deleted))
+        return _deleted
+
+    @staticmethod
+    def _expired(entity):
+        # Missing, or expired. Games saved before expiry was kept do not expire.
+        if not entity:
+            return True
+        _expires_at = entity.get("expires_at")
+        return _expires_at is not None and _expires_at <= time.time()
+
+    def _chunks(self, values):
+        return [values[i:i + self.BATCH_LIMIT] for i in range(0, len(values), self.BATCH_LIMIT)]
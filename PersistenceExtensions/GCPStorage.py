@@ -3,17 +3,26 @@ from google.oauth2 import service_account
 from io import StringIO
 from io import BytesIO
 from Persistence.AbstractPersister import AbstractPersister
+from Persistence.VersionConflict import VersionConflict
 from six import text_type
 
 import googleapiclient.discovery
+import googleapiclient.errors
 import googleapiclient.http
+import calendar
 import os
+import threading
+import time
 
 
 class Persister(AbstractPersister):
 
     #TODO : Refine error checking and logging
 
+    # Each object's customTime is when the game expires. Loads treat an expired game
+    # as missing; the bucket should have a lifecycle rule deleting objects once
+    # daysSinceCustomTime is 0 (see the README).
+
     def __init__(self, bucket=None, credentials_file=None):
         if not bucket:
             raise ValueError('A bucket name must be provided!')
@@ -25,29 +34,30 @@ class Persister(AbstractPersister):
         self.handler.module="GCPStoragePersist"
         self.handler.log(message="Validating if credentials are defined or if defaults should be used")
         secret_name = credentials_file
+        self.credentials = None
         if not os.path.isfile(secret_name):
             self.handler.log(message="Requesting storage client with default credentials.", status=0)
             self.storage_client = googleapiclient.discovery.build('storage', 'v1', cache_discovery=False)
         else:
             self.handler.log(message="Requesting storage client with secret credentials.", status=0)
-            credentials = service_account.Credentials.from_service_account_file(secret_name)
-            self.handler.log(message="Credentials received: {}".format(credentials))
+            self.credentials = service_account.Credentials.from_service_account_file(secret_name)
+            self.handler.log(message="Credentials received: {}".format(self.credentials))
 
             self.handler.log(message="Requesting discovery of storage client.")
-            self.storage_client = googleapiclient.discovery.build(
-                'storage',
-                'v1',
-                credentials=credentials,
-                cache_discovery=False
-            )
+            self.storage_client = self._build_client()
             self.handler.log(message="Storage client retrieved.")
 
+        # The HTTP object used by a storage client is not thread safe, so each
+        # thread used by the *_many methods builds its own client.
+        self._local = threading.local()
+        self._local.storage_client = self.storage_client
+
 
         self.handler.log(message="Storage client received. Setting bucket to {}".format(bucket), status=0)
         self.bucket = bucket
 
-    def save(self, key=None, jsonstr=None):
-        super(Persister, self).save(key=key, jsonstr=jsonstr)
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
 
         self.handler.log(message="Saving key {} with json {}".format(key, jsonstr))
 
@@ -58,15 +68,23 @@ class Persister(AbstractPersister):
         body = {
             'name': key,
             'contentType': 'application/json',
-            'mimeType': 'application/json'
+            'mimeType': 'application/json',
+            'customTime': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._expires_at(ttl)))
         }
 
+        # The version of a game is its object generation; with an expected_version
+        # the object is only replaced if it is still at that generation.
+        _preconditions = {}
+        if expected_version is not None:
+            _preconditions["ifGenerationMatch"] = expected_version
+
         self.handler.log(message="Creating insert request")
-        req = self.storage_client.objects().insert(
+        req = self._client().objects().insert(
             bucket=self.bucket,
             body=body,
             media_mime_type='application/json',
-            media_body=googleapiclient.http.MediaIoBaseUpload(contents, 'application/json')
+            media_body=googleapiclient.http.MediaIoBaseUpload(contents, 'application/json'),
+            **_preconditions
         )
         self.handler.log(message="Insert request returned {}".format(req))
 
@@ -74,6 +92,11 @@ class Persister(AbstractPersister):
         try:
             resp = req.execute()
             self.handler.log(message="Response from execute: {}".format(resp))
+        except googleapiclient.errors.HttpError as he:
+            if he.resp.status == 412:
+                raise VersionConflict(key=key, expected_version=expected_version)
+            self.handler.log(message="Exception: {}".format(repr(he)))
+            raise
         except Exception as e:
             self.handler.log(message="Exception: {}".format(repr(e)))
             raise
@@ -81,8 +104,33 @@ class Persister(AbstractPersister):
         self.handler.log(message="Closed temp file/stream with game data")
 
     def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
         super(Persister, self).load(key=key)
 
+        # The generation is read first and then that generation downloaded, so the
+        # game returned is the game at the version returned.
+        self.handler.log(message="Fetching the generation of {}".format(key))
+        try:
+            _object = self._client().objects().get(
+                bucket=self.bucket,
+                object=key,
+                fields="generation,customTime"
+            ).execute()
+        except Exception as e:
+            self.handler.log(message="Exception: {}".format(repr(e)))
+            raise KeyError("Unable to load key {}".format(key))
+        if self._expired(_object.get("customTime")):
+            self.handler.log(message="Object {} has expired".format(key))
+            raise KeyError("Unable to load key {}".format(key))
+        _generation = _object["generation"]
+        _jsonstr = self._download(key=key, generation=_generation)
+        if _jsonstr is None:
+            raise KeyError("Unable to load key {}".format(key))
+        return _jsonstr, int(_generation)
+
+    def _download(self, key=None, generation=None):
         self.handler.log(message="Creating temporary file to hold results")
 
         return_result = None
@@ -92,9 +140,13 @@ class Persister(AbstractPersister):
             self.handler.log(message="File opened")
 
             self.handler.log(message="Issuing get_media request on {}".format(key))
-            req = self.storage_client.objects().get_media(
+            _preconditions = {}
+            if generation is not None:
+                _preconditions["generation"] = generation
+            req = self._client().objects().get_media(
                 bucket=self.bucket,
-                object=key
+                object=key,
+                **_preconditions
             )
             self.handler.log(message="Request on {} formed".format(key))
 
@@ -128,3 +180,67 @@ class Persister(AbstractPersister):
             self.handler.log(message="Exception: {}".format(repr(e)))
 
         return return_result
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        self.handler.log(message="Fetching {} objects concurrently".format(len(_keys)))
+        return dict(zip(_keys, self._run_concurrently(
+            self._load_or_none,
+            [(_key,) for _key in _keys]
+        )))
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        self.handler.log(message="Saving {} objects concurrently".format(len(_items)))
+        self._run_concurrently(
+            lambda _key, _jsonstr: self.save(key=_key, jsonstr=_jsonstr, ttl=self._ttl_for(ttl, _key)),
+            list(_items.items())
+        )
+
+    def delete(self, key=None):
+        self._check_keys(keys=[key], method="delete")
+        self.handler.log(message="Deleting object {}".format(key))
+        try:
+            self._client().objects().delete(bucket=self.bucket, object=key).execute()
+        except googleapiclient.errors.HttpError as he:
+            if he.resp.status != 404:
+                raise
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        self.handler.log(message="Deleting {} objects concurrently".format(len(_keys)))
+        self._run_concurrently(
+            lambda _key: self.delete(key=_key),
+            [(_key,) for _key in _keys]
+        )
+
+    @staticmethod
+    def _expired(custom_time):
+        # customTime is RFC 3339, e.g. 2020-06-01T12:00:00.000Z
+        if not custom_time:
+            return False
+        return calendar.timegm(time.strptime(custom_time[:19], "%Y-%m-%dT%H:%M:%S")) <= time.time()
+
+    def _load_or_none(self, key):
+        try:
+            return self.load(key=key)
+        except KeyError as e:
+            self.handler.log(message="Unable to load object {}: {}".format(key, str(e)))
+            return None
+
+    def _client(self):
+        _storage_client = getattr(self._local, "storage_client", None)
+        if _storage_client is None:
+            _storage_client = self._build_client()
+            self._local.storage_client = _storage_client
+        return _storage_client
+
+    def _build_client(self):
+        if self.credentials is None:
+            return googleapiclient.discovery.build('storage', 'v1', cache_discovery=False)
+        return googleapiclient.discovery.build(
+            'storage',
+            'v1',
+            credentials=self.credentials,
+            cache_discovery=False
+        )
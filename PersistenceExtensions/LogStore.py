@@ -0,0 +1,569 @@
+from flask_helpers.ErrorHandler import ErrorHandler
+from Persistence.AbstractPersister import AbstractPersister
+from Persistence.VersionConflict import VersionConflict
+import errno
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+
+class Persister(AbstractPersister):
+    """
+    LogStore - Keeps games in a log of segment files in one directory, for a single
+    node without Redis. Every save (or delete) appends a record to the active
+    segment, which is memory mapped; an index held in memory maps each key to where
+    its latest record is, so a load is one dict lookup and a decode of the game
+    straight out of the mapped segment (the str returned is the only copy), and a
+    save is a copy into it.
+
+    A record is a header (a CRC32 of the rest of the record, its kind, the lengths
+    of the key and the game, the game's version and when it expires) followed by
+    the key and the game. When the active segment is full it is sealed and a new
+    one started. The index is rebuilt when the store is opened by reading the
+    segments in order (stopping at the first record of a segment whose CRC does not
+    match, e.g. one cut short by a crash), or the hint file written with a
+    compacted segment, which holds just the headers and keys.
+
+    sweep (run by ExpirySweeper) drops expired games from the index and, once dead
+    records (superseded, deleted or expired games) are compact_ratio of the sealed
+    segments, compacts them: the live records of all the sealed segments are copied
+    into one new segment, which replaces the newest of them, and the others are
+    deleted.
+
+    The index is private to the process which opened the store, so only one process
+    may use a directory at a time (it is locked); run a single worker with threads.
+    The store is opened by the first call in a process, not by __init__, so it can
+    be created before a worker forks.
+
+    """
+    SEGMENT_SUFFIX = ".segment"
+    HINT_SUFFIX = ".hint"
+    LOCK_NAME = "LOCK"
+
+    # crc32, kind, key length, value length, version, expires at
+    HEADER = struct.Struct(">IBHIQd")
+    # key length, record offset, value length, version, expires at
+    HINT = struct.Struct(">HQIQd")
+    # The size of the segment the hint file describes
+    HINT_HEADER = struct.Struct(">Q")
+
+    PUT = 1
+    DELETE = 2
+    TOMBSTONE = 0.0     # The expiry of a delete record (no saved game expires at 0)
+
+    FSYNC_POLICIES = ("none", "always", "batch")
+
+    # The store is locked by the first process to use it (see _open), so the
+    # PersistenceEngine refuses more than one worker process.
+    SINGLE_PROCESS = True
+
+    def __init__(
+        self,
+        directory="/tmp/cowbull-log",
+        segment_size_mb=64,
+        compact_ratio=0.5,
+        fsync="none",
+        fsync_interval_ms=1000
+    ):
+        """
+        :param directory: <optional> The directory holding the segments.
+        :param segment_size_mb: <optional> The size at which the active segment is
+        sealed and a new one started.
+        :param compact_ratio: <optional> The share of the sealed segments taken by dead
+        records at which sweep compacts them.
+        :param fsync: <optional> When appended records are synced to disk: none (left to
+        the operating system), always (before a save returns) or batch (every
+        fsync_interval_ms, if there were writes).
+        :param fsync_interval_ms: <optional> The interval of the batch fsync policy.
+        """
+        super(Persister, self).__init__()
+
+        self.handler.module = "Log Store Persister"
+        self.handler.log(message="Preparing log store at {}".format(directory))
+
+        if segment_size_mb <= 0:
+            raise ValueError("segment_size_mb must be greater than 0.")
+        if not 0 < compact_ratio <= 1:
+            raise ValueError("compact_ratio must be greater than 0 and at most 1.")
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError("fsync must be one of {}.".format(", ".join(self.FSYNC_POLICIES)))
+
+        self._directory = os.path.abspath(directory)
+        self._segment_size = int(segment_size_mb * 1024 * 1024)
+        self._compact_ratio = compact_ratio
+        self._fsync = fsync
+        self._fsync_interval = fsync_interval_ms / 1000.0
+
+        self._lock = threading.Lock()
+        self._compacting = threading.Lock()
+        self._unsynced = threading.Event()
+        self._syncer_pid = None
+        self._pid = None
+
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+    #
+    # 'public' methods
+    #
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+        _result = self.write_many(writes=[
+            {"key": key, "jsonstr": jsonstr, "expected_version": expected_version, "ttl": ttl}
+        ])[0]
+        if _result is not None:
+            raise _result
+
+    def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
+        super(Persister, self).load(key=key)
+        _jsonstr, _version = self._read([key])[0]
+        if _jsonstr is None:
+            raise KeyError("Unable to load key {}".format(key))
+        return _jsonstr, _version
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        return dict((_key, _read[0]) for _key, _read in zip(_keys, self._read(_keys)))
+
+    def load_many_versioned(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many_versioned")
+        return dict(zip(_keys, self._read(_keys)))
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        self.handler.log(message="Appending {} games".format(len(_items)))
+        self._open()
+        with self._lock:
+            self._append([
+                (self.PUT, _key, _jsonstr, self._version_of(_key) + 1, self._expires_at(ttl, _key))
+                for _key, _jsonstr in _items.items()
+            ])
+
+    def write_many(self, writes=None):
+        # The writes are checked and appended together, and synced once.
+        _writes = self._check_writes(writes=writes, method="write_many")
+        self._open()
+        _results, _records, _versions = [], [], {}
+        with self._lock:
+            for _write in _writes:
+                _key = _write["key"]
+                _version = _versions[_key] if _key in _versions else self._version_of(_key, missing=None)
+                _expected = _write.get("expected_version")
+                if _expected is not None and _version != _expected:
+                    _results.append(VersionConflict(key=_key, expected_version=_expected))
+                    continue
+                _versions[_key] = (_version or 0) + 1
+                _records.append((self.PUT, _key, _write["jsonstr"], _versions[_key], self._expires_at(_write.get("ttl"))))
+                _results.append(None)
+            self._append(_records)
+        return _results
+
+    def delete(self, key=None):
+        self.delete_many(keys=[key])
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        self.handler.log(message="Deleting {} games".format(len(_keys)))
+        self._open()
+        with self._lock:
+            self._append([(self.DELETE, _key, "", 0, self.TOMBSTONE) for _key in _keys if str(_key) in self._index])
+
+    def sweep(self, limit=None):
+        # Not in a process which has not used the store (e.g. the master of forked
+        # workers), so that the directory is not locked there.
+        if self._pid != os.getpid():
+            return 0
+        _now = time.time()
+        with self._lock:
+            _expired = [_key for _key, _entry in self._index.items() if _entry[4] <= _now]
+            if limit is not None:
+                _expired = _expired[:limit]
+            for _key in _expired:
+                self._supersede(self._index.pop(_key))
+        if _expired:
+            self.handler.log(message="Swept {} expired games".format(len(_expired)))
+        self.compact()
+        return len(_expired)
+
+    def compact(self, force=False):
+        """
+        Compact the sealed segments if dead records are at least compact_ratio of them
+        (or, if force is set, at all).
+
+        :param force: <optional> Compact regardless of compact_ratio.
+        :return: <bool> whether the segments were compacted.
+        """
+        if self._pid != os.getpid() or not self._compacting.acquire(False):
+            return False
+        try:
+            with self._lock:
+                _sealed = sorted(_segment for _segment in self._maps if _segment != self._active)
+                _size = sum(self._sizes[_segment] for _segment in _sealed)
+                _dead = sum(self._dead[_segment] for _segment in _sealed)
+                if not _sealed or not _dead or (not force and _dead < self._compact_ratio * _size):
+                    return False
+                _entries = [(_key, _entry) for _key, _entry in self._index.items() if _entry[0] in _sealed]
+                # Keys held by later segments, which a rebuild reads after the sealed ones.
+                _live = set(_key for _key, _entry in self._index.items() if _entry[0] not in _sealed)
+                _maps = dict((_segment, self._maps[_segment]) for _segment in _sealed)
+            self._compact(_sealed, _entries, _maps, _live)
+            return True
+        finally:
+            self._compacting.release()
+
+    def stats(self):
+        if self._pid != os.getpid():
+            return None
+        with self._lock:
+            return {"log_store": {
+                "keys": len(self._index),
+                "segments": len(self._maps),
+                "bytes": sum(self._sizes.values()),
+                "dead_bytes": sum(self._dead.values()),
+                "compactions": self._compactions
+            }}
+
+    def close(self):
+        """Sync and unmap the segments and unlock the directory."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._pid = None
+            self._maps[self._active].flush()
+            os.close(self._lock_fd)
+
+    #
+    # 'private' methods
+    #
+    def _open(self):
+        # The store is opened by the first call in each process: the index is only
+        # valid in the process which built it.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = None
+            self._lock_fd = os.open(os.path.join(self._directory, self.LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                os.close(self._lock_fd)
+                raise IOError("The log store {} is in use by another process.".format(self._directory))
+
+            self._index, self._maps, self._sizes, self._dead = {}, {}, {}, {}
+            self._compactions = 0
+            for _name in os.listdir(self._directory):
+                if _name.endswith(".tmp"):
+                    # Left by a compaction cut short.
+                    os.remove(os.path.join(self._directory, _name))
+            _segments = sorted(
+                int(_name[:-len(self.SEGMENT_SUFFIX)]) for _name in os.listdir(self._directory)
+                if _name.endswith(self.SEGMENT_SUFFIX)
+            )
+            for _segment in _segments:
+                self._load_segment(_segment)
+
+            _now = time.time()
+            for _key in [_key for _key, _entry in self._index.items() if _entry[4] <= _now]:
+                self._supersede(self._index.pop(_key))
+            self._start_segment((_segments[-1] if _segments else 0) + 1, 0)
+            self._pid = os.getpid()
+            self.handler.log(message="Opened {} games in {} segments".format(len(self._index), len(_segments)))
+
+    def _load_segment(self, segment):
+        _path = self._path(segment, self.SEGMENT_SUFFIX)
+        _file_size = os.path.getsize(_path)
+        if _file_size == 0:
+            os.remove(_path)
+            return
+        _map = self._map(_path)
+        if not self._load_hint(segment, _map):
+            _length = self._scan(segment, _map)
+            if _length < _file_size:
+                # Drop the unused (or torn) end of the segment which was active.
+                _map.close()
+                if not _length:
+                    os.remove(_path)
+                    return
+                os.truncate(_path, _length)
+                _map = self._map(_path)
+        self._maps[segment] = _map
+
+    def _scan(self, segment, data):
+        self._sizes[segment], self._dead[segment] = 0, 0
+        _offset = 0
+        for _offset, _end, _kind, _key, _value_length, _version, _expires_at in self._records(data):
+            self._sizes[segment] = _end
+            if _kind == self.PUT:
+                self._index_put(_key, (segment, _end - _value_length, _value_length, _version, _expires_at, _end - _offset))
+            else:
+                self._index_put(_key, None)
+                self._dead[segment] += _end - _offset
+            _offset = _end
+        return _offset
+
+    def _records(self, data, check=True):
+        # The records of a segment, as (offset, end, kind, key, value length, version,
+        # expires at), up to the first which is not whole (or, if check is set, whose
+        # CRC does not match).
+        _offset = 0
+        while _offset + self.HEADER.size <= len(data):
+            _crc, _kind, _key_length, _value_length, _version, _expires_at = self.HEADER.unpack_from(data, _offset)
+            _end = _offset + self.HEADER.size + _key_length + _value_length
+            if _kind not in (self.PUT, self.DELETE) or _end > len(data):
+                return
+            if check and zlib.crc32(data[_offset + 4:_end]) & 0xffffffff != _crc:
+                return
+            _key_start = _offset + self.HEADER.size
+            _key = data[_key_start:_key_start + _key_length].decode("utf-8")
+            yield _offset, _end, _kind, _key, _value_length, _version, _expires_at
+            _offset = _end
+
+    def _load_hint(self, segment, data):
+        _path = self._path(segment, self.HINT_SUFFIX)
+        try:
+            with open(_path, "rb") as f:
+                _hint = f.read()
+        except (IOError, OSError):
+            return False
+        if len(_hint) < self.HINT_HEADER.size or self.HINT_HEADER.unpack_from(_hint, 0)[0] != len(data):
+            self.handler.log(message="Ignoring the hint file {}, which does not match its segment".format(_path))
+            return False
+
+        self._sizes[segment], self._dead[segment] = len(data), 0
+        _offset = self.HINT_HEADER.size
+        while _offset < len(_hint):
+            _key_length, _record, _value_length, _version, _expires_at = self.HINT.unpack_from(_hint, _offset)
+            _offset += self.HINT.size
+            _key = _hint[_offset:_offset + _key_length].decode("utf-8")
+            _offset += _key_length
+            _value = _record + self.HEADER.size + _key_length
+            if _expires_at == self.TOMBSTONE:
+                self._index_put(_key, None)
+                self._dead[segment] += _value - _record
+            else:
+                self._index_put(_key, (segment, _value, _value_length, _version, _expires_at, _value + _value_length - _record))
+        return True
+
+    def _index_put(self, key, entry):
+        if key in self._index:
+            self._supersede(self._index.pop(key))
+        if entry is not None:
+            self._index[key] = entry
+
+    def _supersede(self, entry):
+        self._dead[entry[0]] += entry[5]
+
+    def _version_of(self, key, missing=0):
+        _entry = self._index.get(str(key))
+        if _entry is None or _entry[4] <= time.time():
+            return missing
+        return _entry[3]
+
+    def _read(self, keys):
+        # The entries and their segments are taken together under the lock (a
+        # compaction changes both); the games are decoded out of the maps after,
+        # through a memoryview so that no intermediate bytes are made.
+        self._open()
+        _now = time.time()
+        with self._lock:
+            _found = []
+            for _key in keys:
+                _entry = self._index.get(str(_key))
+                _found.append((_entry, self._maps[_entry[0]]) if _entry is not None and _entry[4] > _now else None)
+        return [
+            (None, None) if _item is None
+            else (self._decode(_item[1], _item[0][1], _item[0][2]), _item[0][3])
+            for _item in _found
+        ]
+
+    @staticmethod
+    def _decode(data, offset, length):
+        with memoryview(data) as _view:
+            return str(_view[offset:offset + length], "utf-8")
+
+    def _append(self, records):
+        # Called with the lock held. records are (kind, key, value, version, expires at).
+        _written = set()
+        for _kind, _key, _value, _version, _expires_at in records:
+            _key, _key_bytes, _value_bytes = str(_key), str(_key).encode("utf-8"), _value.encode("utf-8")
+            _body = self.HEADER.pack(0, _kind, len(_key_bytes), len(_value_bytes), _version, _expires_at)[4:]
+            _body += _key_bytes + _value_bytes
+            _record = struct.pack(">I", zlib.crc32(_body) & 0xffffffff) + _body
+
+            if self._position + len(_record) > len(self._maps[self._active]):
+                self._start_segment(self._active + 1, len(_record))
+            _offset = self._position
+            self._maps[self._active][_offset:_offset + len(_record)] = _record
+            self._position += len(_record)
+            self._sizes[self._active] = self._position
+            _written.add(self._active)
+
+            if _kind == self.PUT:
+                _value_offset = _offset + self.HEADER.size + len(_key_bytes)
+                self._index_put(_key, (self._active, _value_offset, len(_value_bytes), _version, _expires_at, len(_record)))
+            else:
+                self._index_put(_key, None)
+                self._dead[self._active] += len(_record)
+        self._synced(_written)
+
+    def _start_segment(self, segment, length):
+        # Called with the lock held (or while opening). The segment is created at
+        # its full size and mapped once; the records are copied into the map.
+        if self._pid is not None and self._fsync != "none":
+            self._maps[self._active].flush()
+        _path = self._path(segment, self.SEGMENT_SUFFIX)
+        _fd = os.open(_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            os.ftruncate(_fd, max(self._segment_size, length))
+            self._maps[segment] = mmap.mmap(_fd, 0, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(_fd)
+        self._sync_directory()
+        self._active, self._position = segment, 0
+        self._sizes[segment], self._dead[segment] = 0, 0
+
+    def _synced(self, segments):
+        # Apply the fsync policy once records have been appended.
+        if self._fsync == "always":
+            for _segment in segments:
+                self._maps[_segment].flush()
+        elif self._fsync == "batch" and segments:
+            self._start_syncer()
+            self._unsynced.set()
+
+    def _start_syncer(self):
+        # The syncing thread does not survive a fork, so each process starts its own.
+        if self._syncer_pid == os.getpid():
+            return
+        self._syncer_pid = os.getpid()
+        _thread = threading.Thread(target=self._sync_batches, name="log-store-fsync")
+        _thread.daemon = True
+        _thread.start()
+
+    def _sync_batches(self):
+        while True:
+            self._unsynced.wait()
+            time.sleep(self._fsync_interval)
+            self._unsynced.clear()
+            with self._lock:
+                _map = self._maps[self._active] if self._pid == os.getpid() else None
+            if _map is not None:
+                _map.flush()
+
+    def _compact(self, sealed, entries, maps, live):
+        # The live records are copied (as they are) into a new segment which replaces
+        # the newest sealed segment; the others are then deleted, oldest first. So
+        # that the segments left if this is cut short still rebuild the same index,
+        # the new segment also holds a delete record for every key which is not live
+        # (deleted, or expired and not copied) but is saved in an older segment.
+        _now = time.time()
+        _target = sealed[-1]
+        _path = self._path(_target, self.SEGMENT_SUFFIX)
+        _hint_path = self._path(_target, self.HINT_SUFFIX)
+        _moved = []
+        _offset = 0
+        with open(_path + ".tmp", "wb") as segment_file, open(_hint_path + ".tmp", "wb") as hint_file:
+            _hint = [None]
+            _copied = set()
+            for _key, _entry in entries:
+                if _entry[4] <= _now:
+                    _moved.append((_key, _entry, None))
+                    continue
+                _key_bytes = _key.encode("utf-8")
+                _record = _entry[1] - self.HEADER.size - len(_key_bytes)
+                segment_file.write(maps[_entry[0]][_record:_record + _entry[5]])
+                _hint.append(self.HINT.pack(len(_key_bytes), _offset, _entry[2], _entry[3], _entry[4]) + _key_bytes)
+                _moved.append((_key, _entry, (_target, _offset + _entry[1] - _record) + _entry[2:]))
+                _copied.add(_key)
+                _offset += _entry[5]
+
+            _dead = 0
+            for _key in sorted(self._saved_keys(sealed[:-1], maps) - _copied - live):
+                _key_bytes = _key.encode("utf-8")
+                _body = self.HEADER.pack(0, self.DELETE, len(_key_bytes), 0, 0, self.TOMBSTONE)[4:] + _key_bytes
+                segment_file.write(struct.pack(">I", zlib.crc32(_body) & 0xffffffff) + _body)
+                _hint.append(self.HINT.pack(len(_key_bytes), _offset, 0, 0, self.TOMBSTONE) + _key_bytes)
+                _offset += len(_body) + 4
+                _dead += len(_body) + 4
+            _hint[0] = self.HINT_HEADER.pack(_offset)
+            hint_file.write(b"".join(_hint))
+            for f in (segment_file, hint_file):
+                f.flush()
+                os.fsync(f.fileno())
+
+        with self._lock:
+            for _segment in sealed:
+                self._remove(self._path(_segment, self.HINT_SUFFIX))
+            if _offset:
+                os.replace(_path + ".tmp", _path)
+                os.replace(_hint_path + ".tmp", _hint_path)
+            else:
+                self._remove(_path + ".tmp")
+                self._remove(_hint_path + ".tmp")
+                self._remove(_path)
+            self._sync_directory()
+            for _segment in sealed[:-1]:
+                self._remove(self._path(_segment, self.SEGMENT_SUFFIX))
+            self._sync_directory()
+
+            # Segments still being read keep their (old) map until the reads finish.
+            for _segment in sealed:
+                del self._maps[_segment], self._sizes[_segment], self._dead[_segment]
+            if _offset:
+                self._maps[_target] = self._map(_path)
+                self._sizes[_target], self._dead[_target] = _offset, _dead
+            for _key, _old, _new in _moved:
+                if self._index.get(_key) is not _old:
+                    # Saved, deleted or swept while the copy was made.
+                    if _new is not None:
+                        self._supersede(_new)
+                elif _new is None:
+                    # Expired, so not copied.
+                    del self._index[_key]
+                else:
+                    self._index[_key] = _new
+            self._compactions += 1
+        self.handler.log(message="Compacted {} segments into {} bytes".format(len(sealed), _offset))
+
+    def _saved_keys(self, segments, maps):
+        # The keys saved (by a record still in the file) in any of the segments.
+        _keys = set()
+        for _segment in segments:
+            for _, _, _kind, _key, _, _, _ in self._records(maps[_segment], check=False):
+                if _kind == self.PUT:
+                    _keys.add(_key)
+        return _keys
+
+    def _sync_directory(self):
+        if self._fsync == "none":
+            return
+        _fd = os.open(self._directory, os.O_RDONLY)
+        try:
+            os.fsync(_fd)
+        finally:
+            os.close(_fd)
+
+    def _path(self, segment, suffix):
+        return os.path.join(self._directory, "{:010d}{}".format(segment, suffix))
+
+    @staticmethod
+    def _map(path):
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError as ose:
+            if ose.errno != errno.ENOENT:
+                raise
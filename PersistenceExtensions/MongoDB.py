@@ -1,56 +1,104 @@
 from flask_helpers.ErrorHandler import ErrorHandler
 from Persistence.AbstractPersister import AbstractPersister
+from Persistence.VersionConflict import VersionConflict
+from bson import ObjectId
+from datetime import datetime
 import json
 import pymongo
+import threading
 
 
 class Persister(AbstractPersister):
+    # Games expire by a TTL index on expires_at. MongoDB removes expired documents
+    # about once a minute, so loads also treat an expired game as not found.
+
+    # Only the fields needed to return a game (and check its version and expiry)
+    # are fetched.
+    PROJECTION = {"game": True, "payload": True, "version": True, "expires_at": True}
+
     def __init__(
         self, 
         host="localhost", 
         port=27017, 
         db="cowbull",
-        server_selection_timeout_ms=30000
+        server_selection_timeout_ms=30000,
+        max_pool_size=100,
+        min_pool_size=0,
+        wait_queue_timeout_ms=None,
+        read_preference="primary",
+        w=None,
+        journal=None
     ):
+        """
+        :param host: <optional> The MongoDB host (or a mongodb:// URI).
+        :param port: <optional> The MongoDB port.
+        :param db: <optional> The database holding the games collection.
+        :param server_selection_timeout_ms: <optional> Milliseconds to wait for a server.
+        :param max_pool_size: <optional> The most connections to each server.
+        :param min_pool_size: <optional> The connections kept open to each server.
+        :param wait_queue_timeout_ms: <optional> Milliseconds to wait for a pooled
+        connection; None waits indefinitely.
+        :param read_preference: <optional> e.g. primary, primaryPreferred or nearest.
+        Games read from a secondary may be stale; a guess against a stale game is
+        rejected with a version conflict rather than lost.
+        :param w: <optional> The write concern, e.g. 1 or "majority".
+        :param journal: <optional> Wait for writes to be journaled.
+        """
         super(Persister, self).__init__()
 
         self.handler.module="MongoDB Persister"
         self.handler.log(message="Persistence engine MongoDB establishing client to database: {} {}.".format(host, port))
+        _options = {}
+        if wait_queue_timeout_ms is not None:
+            _options["waitQueueTimeoutMS"] = wait_queue_timeout_ms
+        if w is not None:
+            _options["w"] = w
+        if journal is not None:
+            _options["journal"] = journal
         self.connection = pymongo.MongoClient(
             host=host, 
             port=port,
-            serverSelectionTimeoutMS=server_selection_timeout_ms
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            readPreference=read_preference,
+            **_options
             )
 
         self.handler.log(message="Establishing connection.")
         self.mdb = self.connection[db]
+        self._indexed = False
+
+        # The index is created in the background so that startup does not wait (for
+        # up to server_selection_timeout_ms) if MongoDB is unavailable.
+        _indexer = threading.Thread(target=self._ensure_indexes, name="mongodb-indexes")
+        _indexer.daemon = True
+        _indexer.start()
 
         self.handler.log(message="Persistence engine initialization complete.")
 
-    def save(self, key=None, jsonstr=None):
-        super(Persister, self).save(key=key, jsonstr=jsonstr)
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
 
         self.handler.log(message="Using the games database")
         games = self.mdb.games
 
-        self.handler.log(message="Checking if {} already exists".format(key))
-        game = games.find_one({"_id": key})
-
-        if game:
-            self.handler.log(message="Key {} exists, so update".format(key))
-            games.update_one(
-                {"_id": key},
-                {"$set":
-                    {
-                        "game": json.loads(jsonstr)
-                    }
-                }
-            )
-        else:
-            self.handler.log(message="Key {} does not exist, so insert.".format(key))
-            games.insert_one({"_id": key, "game": json.loads(jsonstr)})
+        # Games are upserted (or, with an expected_version, replaced only if they are
+        # still at that version) and their version incremented in one operation.
+        self.handler.log(message="Writing key {}".format(key))
+        _result = games.update_one(
+            self._version_filter(key, expected_version),
+            self._write(jsonstr, self._expiry(ttl)),
+            upsert=expected_version is None
+        )
+        if expected_version is not None and not _result.matched_count:
+            raise VersionConflict(key=key, expected_version=expected_version)
+        self._ensure_indexes()
 
     def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
         super(Persister, self).load(key=key)
 
         self.handler.log(message="Connecting to the games database")
@@ -58,15 +106,212 @@ class Persister(AbstractPersister):
 
         self.handler.log(message="Finding key {}".format(key))
         try:
-            return_result = games.find_one({"_id": key})
-            if not return_result:
+            return_result = games.find_one({"_id": key}, self.PROJECTION)
+            if not return_result or self._expired(return_result):
                 raise KeyError("Unable to load key {}".format(key))
         except Exception as e:
             raise KeyError("An exception occurred: {}".format(str(e)))
 
         if return_result:
-            self.handler.log(message="Key {} returned {}".format(key, return_result["game"]))
-            return json.dumps(return_result["game"])
+            self.handler.log(message="Key {} returned {}".format(key, return_result))
+            return self._payload(return_result), return_result.get("version", 0)
 
         self.handler.log(message="Key {} was not found! An exception will be raised.".format(key))
-        return return_result
+        return return_result, None
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        if not _items:
+            return
+
+        self.handler.log(message="Using the games database")
+        games = self.mdb.games
+
+        self.handler.log(message="Writing {} keys in one bulk write".format(len(_items)))
+        games.bulk_write(
+            [
+                pymongo.UpdateOne(
+                    {"_id": _key},
+                    self._write(_jsonstr, self._expiry(ttl, _key)),
+                    upsert=True
+                )
+                for _key, _jsonstr in _items.items()
+            ],
+            ordered=False
+        )
+        self._ensure_indexes()
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        return dict(
+            (_key, _loaded[0]) for _key, _loaded in self.load_many_versioned(keys=_keys).items()
+        )
+
+    def load_many_versioned(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many_versioned")
+        if not _keys:
+            return {}
+
+        self.handler.log(message="Finding {} keys".format(len(_keys)))
+        games = self.mdb.games
+        try:
+            _found = dict(
+                (return_result["_id"], (self._payload(return_result), return_result.get("version", 0)))
+                for return_result in games.find({"_id": {"$in": _keys}}, self.PROJECTION)
+                if not self._expired(return_result)
+            )
+        except Exception as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+        return dict((_key, _found.get(_key, (None, None))) for _key in _keys)
+
+    def update(self, key=None, fields=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).load(key=key)
+        if not isinstance(fields, dict):
+            raise TypeError("Fields must be provided as a dict of field name to value.")
+
+        self.handler.log(message="Updating {} in key {}".format(", ".join(sorted(fields)), key))
+        _filter = self._version_filter(key, expected_version)
+        _filter["game"] = {"$exists": True}
+        _result = self.mdb.games.update_one(_filter, self._update(fields, self._expiry(ttl)))
+        if not _result.matched_count:
+            # The game is missing, was not stored as a document or has changed; save
+            # raises VersionConflict in the last case.
+            self.handler.log(message="Key {} cannot be updated in place, so save".format(key))
+            self.save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+
+    def write_many(self, writes=None):
+        _writes = self._check_writes(writes=writes, method="write_many")
+        if not _writes:
+            return []
+
+        # Each conditional write (with an expected_version, or an update) stamps the
+        # game with its own write_id, so that if some did not match, those which were
+        # applied can be told apart from those which were not.
+        _operations, _tokens = [], []
+        for _write in _writes:
+            _expected = _write.get("expected_version")
+            _filter = self._version_filter(_write["key"], _expected)
+            if _write.get("fields") is None:
+                _update = self._write(_write["jsonstr"], self._expiry(_write.get("ttl")))
+            else:
+                _filter["game"] = {"$exists": True}
+                _update = self._update(_write["fields"], self._expiry(_write.get("ttl")))
+            _conditional = _expected is not None or _write.get("fields") is not None
+            _tokens.append(ObjectId() if _conditional else None)
+            if _conditional:
+                _update["$set"]["write_id"] = _tokens[-1]
+            _operations.append(pymongo.UpdateOne(_filter, _update, upsert=not _conditional))
+
+        self.handler.log(message="Writing {} keys in one bulk write".format(len(_operations)))
+        games = self.mdb.games
+        _errors = {}
+        try:
+            _result = games.bulk_write(_operations, ordered=False).bulk_api_result
+        except pymongo.errors.BulkWriteError as bwe:
+            _result = bwe.details
+            _errors = dict((_error["index"], _error) for _error in _result.get("writeErrors", []))
+        except Exception as e:
+            return [e] * len(_writes)
+        self._ensure_indexes()
+
+        _results = [
+            KeyError("An exception occurred: {}".format(_errors[_index].get("errmsg"))) if _index in _errors else None
+            for _index in range(len(_writes))
+        ]
+        if _result.get("nMatched", 0) + _result.get("nUpserted", 0) + len(_errors) == len(_writes):
+            return _results
+
+        _stamped = dict(
+            (_document["_id"], _document.get("write_id"))
+            for _document in games.find(
+                {"_id": {"$in": list(set(_write["key"] for _write in _writes))}},
+                {"write_id": True}
+            )
+        )
+        for _index, (_write, _token) in enumerate(zip(_writes, _tokens)):
+            if _token is None or _index in _errors or _stamped.get(_write["key"]) == _token:
+                continue
+            _results[_index] = VersionConflict(key=_write["key"], expected_version=_write.get("expected_version"))
+            if _write.get("fields") is not None:
+                # The game may not be stored as a document; as for update.
+                try:
+                    self.save(
+                        key=_write["key"],
+                        jsonstr=_write["jsonstr"],
+                        expected_version=_write.get("expected_version"),
+                        ttl=_write.get("ttl")
+                    )
+                    _results[_index] = None
+                except Exception as e:
+                    _results[_index] = e
+        return _results
+
+    def delete(self, key=None):
+        self.delete_many(keys=[key])
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        if not _keys:
+            return
+
+        self.handler.log(message="Deleting {} keys".format(len(_keys)))
+        self.mdb.games.delete_many({"_id": {"$in": _keys}})
+
+    @staticmethod
+    def _document(jsonstr):
+        # JSON games are stored as documents (so they can be queried); games
+        # encoded by another codec (see Game/GameCodec.py) are stored as-is.
+        try:
+            return {"game": json.loads(jsonstr)}
+        except ValueError:
+            return {"payload": jsonstr}
+
+    def _ensure_indexes(self):
+        # Created in the background at startup (creating an index which exists does
+        # nothing) or, if MongoDB was unavailable then, after the first successful
+        # write.
+        if self._indexed:
+            return
+        try:
+            self.mdb.games.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+            self._indexed = True
+        except Exception as e:
+            self.handler.log(message="Unable to create the expiry index: {}".format(str(e)))
+
+    def _expiry(self, ttl, key=None):
+        return datetime.utcfromtimestamp(self._expires_at(ttl, key))
+
+    @staticmethod
+    def _expired(document):
+        _expires_at = document.get("expires_at")
+        return _expires_at is not None and _expires_at <= datetime.utcnow()
+
+    @classmethod
+    def _write(cls, jsonstr, expires_at):
+        # The update which stores a game, sets its expiry and increments its version.
+        _document = cls._document(jsonstr)
+        _other = "payload" if "game" in _document else "game"
+        _document["expires_at"] = expires_at
+        return {"$set": _document, "$unset": {_other: ""}, "$inc": {"version": 1}}
+
+    @staticmethod
+    def _update(fields, expires_at):
+        # The update which sets fields of a game stored as a document.
+        _set = dict(("game.{}".format(_field), _value) for _field, _value in fields.items())
+        _set["expires_at"] = expires_at
+        return {"$set": _set, "$inc": {"version": 1}}
+
+    @staticmethod
+    def _version_filter(key, expected_version):
+        if expected_version is None:
+            return {"_id": key}
+        if expected_version == 0:
+            # Games saved before versions were kept have no version.
+            return {"_id": key, "version": {"$in": [0, None]}}
+        return {"_id": key, "version": expected_version}
+
+    @staticmethod
+    def _payload(document):
+        if "payload" in document:
+            return document["payload"]
+        return json.dumps(document["game"])
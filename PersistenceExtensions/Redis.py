@@ -1,11 +1,172 @@
 from flask_helpers.ErrorHandler import ErrorHandler
 from Persistence.AbstractPersister import AbstractPersister
+from Persistence.RedisConnectionPool import RedisConnectionPool
+from Persistence.RedisHedgedReader import RedisHedgedReader
+from Persistence.RedisReplicaTracker import RedisReplicaTracker
+from Persistence.RedisRouter import RedisHashRing, RedisClusterRouter
+from Persistence.VersionConflict import VersionConflict
 from redis.sentinel import Sentinel, MasterNotFoundError, SlaveNotFoundError, ResponseError
+from collections import OrderedDict
+import json
 import redis
 
 
 class Persister(AbstractPersister):
     _redis_connection = None
+    _hedger = None
+    _router = None
+
+    MAX_REDIRECTS = 5   # Most Redis Cluster redirects (MOVED/ASK) followed per command
+
+    # Games are stored as hashes holding the game's version (_version) and either one
+    # field per field of a JSON game holding its JSON text (when partial_updates is
+    # set, so that update writes only the fields which changed) or the whole payload
+    # (_payload). Games saved as strings by earlier releases are read as version 0.
+
+    # Returns the hash (as a flat list of fields and values) or string held by KEYS[1].
+    LOAD_SCRIPT = """
+        if redis.call('TYPE', KEYS[1]).ok == 'hash' then
+            return redis.call('HGETALL', KEYS[1])
+        end
+        return redis.call('GET', KEYS[1])
+    """
+
+    # Replaces the game KEYS[1] with the field, value pairs from ARGV[3] onwards and
+    # sets its ttl (ARGV[1]). If ARGV[2] is not empty, the game must be at version
+    # ARGV[2]. Returns the new version, or -1 (changing nothing) on a version conflict.
+    SAVE_SCRIPT = """
+        local kind = redis.call('TYPE', KEYS[1]).ok
+        local version = 0
+        if kind == 'hash' then
+            version = tonumber(redis.call('HGET', KEYS[1], '_version') or 0)
+        end
+        if ARGV[2] ~= '' and (kind == 'none' or version ~= tonumber(ARGV[2])) then
+            return -1
+        end
+        redis.call('DEL', KEYS[1])
+        redis.call('HSET', KEYS[1], '_version', version + 1, unpack(ARGV, 3))
+        redis.call('EXPIRE', KEYS[1], ARGV[1])
+        return version + 1
+    """
+
+    # Sets fields of the JSON game KEYS[1] (ARGV[3] onwards are field, JSON value
+    # pairs) and its ttl (ARGV[1]), checking the version as SAVE_SCRIPT does. Returns
+    # the new version, -1 on a version conflict, or 0 (changing nothing) if the game
+    # is not stored field by field.
+    UPDATE_SCRIPT = """
+        if redis.call('TYPE', KEYS[1]).ok ~= 'hash'
+                or redis.call('HEXISTS', KEYS[1], '_payload') == 1 then
+            return 0
+        end
+        local version = tonumber(redis.call('HGET', KEYS[1], '_version') or 0)
+        if ARGV[2] ~= '' and version ~= tonumber(ARGV[2]) then return -1 end
+        redis.call('HSET', KEYS[1], '_version', version + 1, unpack(ARGV, 3))
+        redis.call('EXPIRE', KEYS[1], ARGV[1])
+        return version + 1
+    """
+
+    # Applies a guess to a JSON game atomically (see atomic_guess). KEYS[1] is the game
+    # key; ARGV[1] is a JSON object of digit type to the guessed digits (or null if
+    # they are invalid for that type), ARGV[2] a JSON object of mode name to [digits,
+    # guesses allowed, digit type] for modes saved by reference, and ARGV[3] the ttl
+    # used if the game has none.
+    # Returns {outcome, game after the guess, analysis}; the outcome is APPLIED if the
+    # guess was scored and the game updated, with the analysis of each digit guessed
+    # (as PackedWord.compare, digits as numbers), or UNCHANGED (with no analysis) if
+    # the game is over or the guess is invalid.
+    GUESS_SCRIPT = """
+        local kind = redis.call('TYPE', KEYS[1]).ok
+        local raw, decoded, game
+        local version = 0
+        local by_field = false
+        if kind == 'hash' then
+            local stored = redis.call('HGETALL', KEYS[1])
+            local fields = {}
+            for i = 1, #stored, 2 do fields[stored[i]] = stored[i + 1] end
+            version = tonumber(fields._version or 0)
+            if fields._payload then
+                raw = fields._payload
+                decoded, game = pcall(cjson.decode, raw)
+            else
+                by_field = true
+                game = {}
+                for name, value in pairs(fields) do
+                    if string.sub(name, 1, 1) ~= '_' then game[name] = cjson.decode(value) end
+                end
+                raw = cjson.encode(game)
+                decoded = true
+            end
+        elseif kind == 'string' then
+            raw = redis.call('GET', KEYS[1])
+            decoded, game = pcall(cjson.decode, raw)
+        else
+            return {'MISSING'}
+        end
+        if not decoded or type(game) ~= 'table' or type(game.mode) ~= 'table'
+                or type(game.answer) ~= 'table' then
+            return {'FALLBACK'}
+        end
+
+        local mode = game.mode
+        if mode.digits == nil then
+            local known = cjson.decode(ARGV[2])[mode.mode]
+            if not known then return {'UNCHANGED', raw} end
+            mode = {digits = known[1], guesses_allowed = known[2], digit_type = known[3]}
+        end
+
+        local digits = tonumber(mode.digits)
+        local allowed = tonumber(mode.guesses_allowed)
+        local made = tonumber(game.guesses_made)
+        if game.status == 'won' or game.status == 'lost' or allowed - made < 1 then
+            return {'UNCHANGED', raw}
+        end
+
+        local guess = cjson.decode(ARGV[1])[tostring(mode.digit_type)]
+        if type(guess) ~= 'table' or #guess ~= #game.answer or #guess ~= digits then
+            return {'UNCHANGED', raw}
+        end
+
+        local answer, counts = {}, {}
+        for i = 1, #game.answer do
+            local digit = game.answer[i]
+            if type(digit) ~= 'number' then digit = tonumber(digit, 16) end
+            answer[i] = digit
+            counts[digit] = (counts[digit] or 0) + 1
+        end
+
+        local bulls, analysis = 0, {}
+        for i = 1, #guess do
+            local digit = guess[i]
+            if answer[i] == digit then bulls = bulls + 1 end
+            analysis[i] = {
+                index = i - 1,
+                digit = digit,
+                match = answer[i] == digit,
+                multiple = (counts[digit] or 0) > 1,
+                in_word = counts[digit] ~= nil
+            }
+        end
+
+        game.guesses_made = made + 1
+        if bulls == digits then
+            game.status = 'won'
+            game.guesses_made = allowed
+        elseif allowed - game.guesses_made < 1 then
+            game.status = 'lost'
+        end
+        raw = cjson.encode(game)
+        if by_field then
+            redis.call('HSET', KEYS[1], '_version', version + 1,
+                'guesses_made', game.guesses_made, 'status', cjson.encode(game.status))
+        else
+            redis.call('DEL', KEYS[1])
+            redis.call('HSET', KEYS[1], '_version', version + 1, '_payload', raw)
+        end
+        local ttl = tonumber(game.ttl)
+        if not ttl or ttl < 1 then ttl = ARGV[3] end
+        redis.call('EXPIRE', KEYS[1], ttl)
+        return {'APPLIED', raw, cjson.encode(analysis)}
+    """
 
     def __init__(
         self, 
@@ -13,8 +174,63 @@ class Persister(AbstractPersister):
         password="",
         port=6379, 
         master_port=26379, 
-        db=0
+        db=0,
+        socket_path=None,
+        max_connections=50,
+        pool_timeout=5,
+        socket_timeout=None,
+        socket_connect_timeout=None,
+        socket_keepalive=False,
+        health_check_interval=0,
+        sentinel_socket_timeout=0.1,
+        atomic_guesses=False,
+        partial_updates=True,
+        read_your_writes=True,
+        hedged_reads=False,
+        hedge_percentile=95,
+        hedge_min_delay_ms=1,
+        hedge_max_delay_ms=50,
+        cluster=False,
+        nodes=None,
+        virtual_nodes=160
     ):
+        """
+        :param host: <optional> The Redis (or Sentinel) host.
+        :param password: <optional> The Redis password.
+        :param port: <optional> The Redis port.
+        :param master_port: <optional> The Sentinel port.
+        :param db: <optional> The Redis database number.
+        :param socket_path: <optional> Connect to Redis through this unix domain socket
+        (e.g. a sidecar) instead of host and port; Sentinel is not used.
+        :param max_connections: <optional> The most connections each pool will open.
+        :param pool_timeout: <optional> Seconds to wait for a free pooled connection.
+        :param socket_timeout: <optional> Seconds to wait for a Redis command.
+        :param socket_connect_timeout: <optional> Seconds to wait to connect.
+        :param socket_keepalive: <optional> Enable TCP keepalive on connections.
+        :param health_check_interval: <optional> Seconds a connection may be idle before
+        it is checked (with a PING) when next used; 0 disables the check.
+        :param sentinel_socket_timeout: <optional> The socket timeout used with Sentinel.
+        :param atomic_guesses: <optional> Apply guesses in Redis with a Lua script (see
+        atomic_guess) instead of loading and then saving the game.
+        :param partial_updates: <optional> Store JSON games as hashes so that update
+        writes only the fields which changed; if False, games are stored as strings
+        and update rewrites the whole game.
+        :param read_your_writes: <optional> With Sentinel, read a key from the replicas
+        only once they have caught up with this process's last write to it (see
+        RedisReplicaTracker); if False, every read goes to the replicas.
+        :param hedged_reads: <optional> With Sentinel, connect to each replica and hedge
+        slow replica reads (see RedisHedgedReader).
+        :param hedge_percentile: <optional> The percentile of a replica's latency after
+        which a read is hedged.
+        :param hedge_min_delay_ms: <optional> The shortest hedge delay.
+        :param hedge_max_delay_ms: <optional> The longest hedge delay.
+        :param cluster: <optional> host and port are a node of a Redis Cluster; games
+        are spread across its masters by the cluster's slot map.
+        :param nodes: <optional> A list of independent Redis nodes ("host:port") to
+        spread games across by consistent hashing (see RedisHashRing); host and port
+        are then not used.
+        :param virtual_nodes: <optional> The points each node has on the hash ring.
+        """
         super(Persister, self).__init__()
 
         self.handler.module="Redis Persister"
@@ -25,13 +241,40 @@ class Persister(AbstractPersister):
         # Removed as per http://sonarqube:9000/project/issues?id=cowbull_server&issues=AWiRMKBbaAhZ-jY-ujHo&open=AWiRMKBbaAhZ-jY-ujHo
         # slave_nodes = [(host, port)]
 
-        self.handler.log(message="Host: {0}, Port: {1}".format(host, port))
+        self.handler.log(message="Host: {0}, Port: {1}, Socket: {2}".format(host, port, socket_path))
+
+        _connection_kwargs = {
+            "password": password or None,
+            "db": db,
+            "socket_timeout": socket_timeout,
+            "socket_connect_timeout": socket_connect_timeout,
+            "socket_keepalive": socket_keepalive,
+            "health_check_interval": health_check_interval
+        }
+
+        if cluster or nodes:
+            self._connect_router(
+                host=host,
+                port=port,
+                cluster=cluster,
+                nodes=nodes,
+                virtual_nodes=virtual_nodes,
+                pool_kwargs=dict(_connection_kwargs, max_connections=max_connections, timeout=pool_timeout)
+            )
+            self.atomic_guesses = atomic_guesses
+            self.partial_updates = partial_updates
+            self._register_scripts(self._redis_master, self._redis_master)
+            self._replication = None
+            return
 
         try:
-            self.handler.log(message="Checking if redis instance passed is a cluster")
-            sentinel = Sentinel([(host, master_port)], socket_timeout=0.1)
-            master_node = sentinel.discover_master('redis')
-            self.handler.log(message="It is a cluster. Setting master node")
+            if socket_path:
+                self.handler.log(message="Unix socket provided; Sentinel is not used")
+            else:
+                self.handler.log(message="Checking if redis instance passed is a cluster")
+                sentinel = Sentinel([(host, master_port)], socket_timeout=sentinel_socket_timeout)
+                master_node = sentinel.discover_master('redis')
+                self.handler.log(message="It is a cluster. Setting master node")
         except MasterNotFoundError:
             self.handler.log(message="No cluster found; using single redis instance only")
         except ResponseError:
@@ -41,36 +284,101 @@ class Persister(AbstractPersister):
 
         if master_node:
             self.handler.log(message="Setting redis master for writes")
-            self._redis_master = sentinel.master_for("redis", socket_timeout=0.1)
-            self._redis_connection = sentinel.slave_for("redis", socket_timeout=0.1)
+            _sentinel_kwargs = dict(_connection_kwargs, max_connections=max_connections)
+            _sentinel_kwargs["socket_timeout"] = socket_timeout or sentinel_socket_timeout
+            self._redis_master = sentinel.master_for("redis", **_sentinel_kwargs)
+            self._redis_connection = sentinel.slave_for("redis", **_sentinel_kwargs)
+
+            if hedged_reads:
+                _replicas = sentinel.discover_slaves("redis")
+                self.handler.log(message="Hedging reads across replicas {}".format(_replicas))
+                if _replicas:
+                    self._hedger = RedisHedgedReader(
+                        replicas=dict(
+                            (
+                                "{}:{}".format(_host, _port),
+                                redis.StrictRedis(connection_pool=RedisConnectionPool(
+                                    max_connections=max_connections,
+                                    timeout=pool_timeout,
+                                    host=_host,
+                                    port=_port,
+                                    **_connection_kwargs
+                                ))
+                            )
+                            for _host, _port in _replicas
+                        ),
+                        master=self._redis_master,
+                        percentile=hedge_percentile,
+                        min_delay_ms=hedge_min_delay_ms,
+                        max_delay_ms=hedge_max_delay_ms
+                    )
         else:
             self._redis_connection = redis.StrictRedis(
-                host=host,
-                port=port,
-                password=password,
-                db=db
+                connection_pool=RedisConnectionPool(
+                    max_connections=max_connections,
+                    timeout=pool_timeout,
+                    socket_path=socket_path,
+                    host=host,
+                    port=port,
+                    **_connection_kwargs
+                )
             )
             self.handler.log(message="Pointing redis master to connection")
             self._redis_master = self._redis_connection
 
+        self.atomic_guesses = atomic_guesses
+        self.partial_updates = partial_updates
+        self._register_scripts(self._redis_connection, self._redis_master)
+
+        self._replication = None
+        if read_your_writes and self._redis_connection is not self._redis_master:
+            self._replication = RedisReplicaTracker(master=self._redis_master)
+
     @property
     def redis_connection(self):
         return self._redis_connection or None
 
-    def save(self, key=None, jsonstr=None):
-        super(Persister, self).save(key=key, jsonstr=jsonstr)
+    def stats(self):
+        if self._router is not None:
+            return {"nodes": dict(
+                (_name, self._pool_stats(_client)) for _name, _client in self._router.clients().items()
+            )}
+        _stats = {"master": self._pool_stats(self._redis_master)}
+        if self._redis_connection is not self._redis_master:
+            _stats["replica"] = self._pool_stats(self._redis_connection)
+        if self._replication is not None:
+            _stats["replication"] = self._replication.stats()
+        if self._hedger is not None:
+            _stats["hedging"] = self._hedger.stats()
+        return _stats
+
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
         try:
-            self._redis_master.set(str(key), str(jsonstr), ex=(60*60))
+            _version = self._write([key], lambda pipeline: self._save_script(
+                keys=[str(key)],
+                args=self._save_args(jsonstr, expected_version, self._ttl_for(ttl)),
+                client=pipeline
+            ))[0]
         except redis.exceptions.ConnectionError as rce:
             raise KeyError("Unable to connect to the Redis persistence engine: {}".format(str(rce)))
-        self.handler.log(message="Key set.")
+        if _version < 0:
+            raise VersionConflict(key=key, expected_version=expected_version)
+        self.handler.log(message="Key set at version {}.".format(_version))
 
     def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
         super(Persister, self).load(key=key)
 
         self.handler.log(message="Fetching key: {}".format(key))
         try:
-            return_result = self._redis_connection.get(key)
+            _reader = self._reader([key])
+            return_result = self._read(_reader, lambda client: self._load_pipeline(client, [key])[0])
+            _master = self._fallback(_reader) if not return_result else None
+            if _master is not None:
+                return_result = self._load_pipeline(_master, [key])[0]
             if not return_result:
                 raise KeyError("Unable to load key {}".format(key))
         except redis.exceptions.ConnectionError as rce:
@@ -78,9 +386,416 @@ class Persister(AbstractPersister):
         except Exception as e:
             raise KeyError("An exception occurred: {}".format(str(e)))
 
-        # http://sonarqube:9000/project/issues?id=cowbull_server&issues=AWiRMKBcaAhZ-jY-ujHp&open=AWiRMKBcaAhZ-jY-ujHp
-        if return_result is not None and isinstance(return_result, bytes):
-                return_result = str(return_result.decode('utf-8'))
+        return_result, _version = self._decode(return_result)
+
+        self.handler.log(message="Key {} returned version {}: {}".format(key, _version, return_result))
+        return return_result, _version
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        self.handler.log(message="Pipelining {} keys".format(len(_items)))
+        try:
+            self._for_each_node(list(_items), lambda _client, _keys: self._write(_keys, lambda pipeline: [
+                self._save_script(
+                    keys=[str(_key)],
+                    args=self._save_args(_items[_key], ttl=self._ttl_for(ttl, _key)),
+                    client=pipeline
+                )
+                for _key in _keys
+            ]))
+        except redis.exceptions.ConnectionError as rce:
+            raise KeyError("Unable to connect to the Redis persistence engine: {}".format(str(rce)))
+        self.handler.log(message="Keys set.")
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        return dict(
+            (_key, _loaded[0]) for _key, _loaded in self.load_many_versioned(keys=_keys).items()
+        )
+
+    def load_many_versioned(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many_versioned")
+        if not _keys:
+            return {}
+
+        self.handler.log(message="Fetching {} keys".format(len(_keys)))
+        try:
+            _results = {}
+            for _node_keys, _node_results in self._for_each_node(_keys, self._load_node):
+                _results.update(zip(_node_keys, _node_results))
+        except redis.exceptions.ConnectionError as rce:
+            raise KeyError("Unable to connect to the Redis persistence engine: {}".format(str(rce)))
+        except Exception as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+
+        _loaded = dict((_key, self._decode(_results[_key])) for _key in _keys)
+        return dict(
+            (_key, _loaded[_key] if _loaded[_key][0] else (None, None))
+            for _key in _keys
+        )
+
+    def update(self, key=None, fields=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).load(key=key)
+        if not isinstance(fields, dict):
+            raise TypeError("Fields must be provided as a dict of field name to value.")
+        if not self.partial_updates:
+            return self.save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+
+        self.handler.log(message="Updating {} in key {}".format(", ".join(sorted(fields)), key))
+        try:
+            _version = self._write([key], lambda pipeline: self._update_script(
+                keys=[str(key)],
+                args=self._update_args(fields, expected_version, self._ttl_for(ttl)),
+                client=pipeline
+            ))[0]
+        except redis.exceptions.ConnectionError as rce:
+            raise KeyError("Unable to connect to the Redis persistence engine: {}".format(str(rce)))
+
+        if _version < 0:
+            raise VersionConflict(key=key, expected_version=expected_version)
+        if not _version:
+            # The game is missing or was not stored field by field.
+            self.handler.log(message="Key {} cannot be updated in place, so save".format(key))
+            self.save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+
+    def write_many(self, writes=None):
+        _writes = self._check_writes(writes=writes, method="write_many")
+        if not _writes:
+            return []
+
+        self.handler.log(message="Pipelining {} writes".format(len(_writes)))
+        _groups = OrderedDict()
+        for _index, _write in enumerate(_writes):
+            _node = self._router.node_for(key=_write["key"])[0] if self._router is not None else None
+            _groups.setdefault(_node, []).append(_index)
+
+        _batches = [(_writes, _indexes) for _indexes in _groups.values()]
+        if len(_batches) == 1:
+            _batch_results = [self._write_group(*_batches[0])]
+        else:
+            _batch_results = self._run_concurrently(self._write_group, _batches)
+
+        _results = [None] * len(_writes)
+        for (_, _indexes), _group_results in zip(_batches, _batch_results):
+            for _index, _result in zip(_indexes, _group_results):
+                _results[_index] = _result
+        return _results
+
+    def atomic_guess(self, key=None, guesses=None, modes=None):
+        """
+        Apply a guess to a game in one round trip to Redis. A Lua script loads the
+        game, checks it is still in play, scores the guess, updates the guesses made
+        and status and saves the game, atomically, so that concurrent guesses against
+        a game are all counted. Only games saved as JSON can be guessed this way.
+
+        The script also returns the game as saved after the guess and the analysis of
+        the guess, from which the caller builds its response (see
+        GameController.outcome) without scoring the guess again.
+
+        :param key: <required> The game key.
+        :param guesses: <required> A dict of digit type (e.g. PackedWord.DIGIT) to the
+        guessed digits as a list of ints, or None if the digits are not valid for
+        that digit type.
+        :param modes: <required> A dict of mode name to [digits, guesses allowed,
+        digit type] for the modes which may be saved by reference.
+        :return: <tuple> of (<str> the game after the guess, <list> the analysis of the
+        guess, or None if the game is over or the guess invalid and the game was left
+        unchanged), or None if the game is not JSON (the caller must then load, guess
+        and save the game itself).
+        """
+        super(Persister, self).load(key=key)
+
+        self.handler.log(message="Applying guess to key {} in Redis".format(key))
+        try:
+            _result = self._write([key], lambda pipeline: self._guess_script(
+                keys=[str(key)],
+                args=[
+                    json.dumps(dict((str(_type), _digits) for _type, _digits in guesses.items())),
+                    json.dumps(modes or {}),
+                    self.TTL
+                ],
+                client=pipeline
+            ))[0]
+        except redis.exceptions.ConnectionError as rce:
+            raise KeyError("Unable to connect to the Redis persistence engine: {}".format(str(rce)))
+        except Exception as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+
+        _outcome = _result[0].decode('utf-8') if isinstance(_result[0], bytes) else _result[0]
+        if _outcome == "MISSING":
+            raise KeyError("Unable to load key {}".format(key))
+        if _outcome == "FALLBACK":
+            return None
+
+        return_result = _result[1]
+        if isinstance(return_result, bytes):
+            return_result = str(return_result.decode('utf-8'))
+        _analysis = json.loads(_result[2]) if len(_result) > 2 else None
+        self.handler.log(message="Guess {} for key {}".format(_outcome.lower(), key))
+        return return_result, _analysis
+
+    def delete(self, key=None):
+        self.delete_many(keys=[key])
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        if not _keys:
+            return
+
+        self.handler.log(message="Deleting {} keys".format(len(_keys)))
+        try:
+            # One DEL per key: keys on one cluster node may be in different slots.
+            self._for_each_node(_keys, lambda _client, _node_keys: self._write(
+                _node_keys,
+                lambda pipeline: [pipeline.delete(str(_key)) for _key in _node_keys]
+            ))
+        except redis.exceptions.ConnectionError as rce:
+            raise KeyError("Unable to connect to the Redis persistence engine: {}".format(str(rce)))
+        self.handler.log(message="Keys deleted.")
+
+    def _connect_router(self, host, port, cluster, nodes, virtual_nodes, pool_kwargs):
+        if cluster:
+            from redis.cluster import RedisCluster
+            self.handler.log(message="Using Redis Cluster through {}:{}".format(host, port))
+            _cluster_kwargs = dict(pool_kwargs)
+            _cluster_kwargs.pop("db")
+            _cluster_kwargs.pop("timeout")
+            self._router = RedisClusterRouter(cluster=RedisCluster(host=host, port=port, **_cluster_kwargs))
+        else:
+            self.handler.log(message="Hashing keys across Redis nodes {}".format(nodes))
+            _clients = {}
+            for _node in nodes:
+                _host, _, _port = str(_node).rpartition(":")
+                if not _host or not _port.isdigit():
+                    raise ValueError("Redis nodes must be given as host:port, not {}".format(_node))
+                _clients["{}:{}".format(_host, _port)] = redis.StrictRedis(
+                    connection_pool=RedisConnectionPool(host=_host, port=int(_port), **pool_kwargs)
+                )
+            self._router = RedisHashRing(nodes=_clients, virtual_nodes=virtual_nodes)
+        # Scripts are always run in a pipeline on the node holding the key, so the
+        # client they are registered with is only used to compute their sha.
+        self._redis_master = self._redis_connection = list(self._router.clients().values())[0]
+
+    def _register_scripts(self, reader, master):
+        self._load_script = reader.register_script(self.LOAD_SCRIPT)
+        self._save_script = master.register_script(self.SAVE_SCRIPT)
+        self._update_script = master.register_script(self.UPDATE_SCRIPT)
+        self._guess_script = master.register_script(self.GUESS_SCRIPT)
+
+    def _write(self, keys, commands):
+        # Run commands (a function which adds them to a pipeline) on the master of
+        # keys (which must all be held by one node) in one round trip. With replicas,
+        # the master's replication offset is fetched in the same round trip so that
+        # later reads of the keys can be routed correctly.
+        _master = self._master_for(keys[0])
+        if self._replication is None:
+            return self._pipeline(_master, commands)
+        _results = self._pipeline(_master, lambda pipeline: [commands(pipeline), pipeline.info("replication")])
+        self._replication.written(keys=[str(_key) for _key in keys], info=_results[-1])
+        return _results[:-1]
+
+    def _pipeline(self, client, commands):
+        # Run commands in a pipeline on client. With a router, a command redirected
+        # by Redis Cluster (MOVED, or ASK while its slot is being migrated) is resent
+        # on its own to the node named, preceded by ASKING if it was asked; the
+        # commands which were not redirected have run and are not resent.
+        pipeline = client.pipeline(transaction=False)
+        commands(pipeline)
+        if self._router is None:
+            return pipeline.execute()
+
+        _stack, _scripts = list(pipeline.command_stack), set(pipeline.scripts)
+        _results = pipeline.execute(raise_on_error=False)
+        for _attempt in range(self.MAX_REDIRECTS):
+            _redirected = [
+                _index for _index, _result in enumerate(_results)
+                if isinstance(_result, (redis.exceptions.MovedError, redis.exceptions.AskError))
+            ]
+            if not _redirected:
+                break
+            _resends = OrderedDict()
+            for _index in _redirected:
+                _client, _asking = self._router.redirect(error=_results[_index])
+                _resends.setdefault(id(_client), (_client, []))[1].append((_index, _asking))
+            for _client, _resent in _resends.values():
+                _resent_results = self._resend(
+                    _client, _scripts, [(_stack[_index], _asking) for _index, _asking in _resent]
+                )
+                for (_index, _), _result in zip(_resent, _resent_results):
+                    _results[_index] = _result
+
+        for _result in _results:
+            if isinstance(_result, Exception):
+                raise _result
+        return _results
+
+    @staticmethod
+    def _resend(client, scripts, resent):
+        # Resend (args, options) commands from a pipeline's command stack to client in
+        # one pipeline, each preceded by ASKING if asked; returns their results.
+        pipeline = client.pipeline(transaction=False)
+        pipeline.scripts.update(scripts)
+        for (_args, _options), _asking in resent:
+            if _asking:
+                pipeline.execute_command("ASKING")
+            pipeline.execute_command(*_args, **_options)
+        _results, _position, _resent_results = pipeline.execute(raise_on_error=False), 0, []
+        for _, _asking in resent:
+            if _asking:
+                _position += 1  # The reply to ASKING
+            _resent_results.append(_results[_position])
+            _position += 1
+        return _resent_results
+
+    def _write_group(self, writes, indexes):
+        # Make the writes (held by one node) in one pipeline; see write_many.
+        def _commands(pipeline):
+            for _index in indexes:
+                _write = writes[_index]
+                _expected, _ttl = _write.get("expected_version"), self._ttl_for(_write.get("ttl"))
+                if _write.get("fields") is None or not self.partial_updates:
+                    _script, _args = self._save_script, self._save_args(_write["jsonstr"], _expected, _ttl)
+                else:
+                    _script, _args = self._update_script, self._update_args(_write["fields"], _expected, _ttl)
+                _script(keys=[str(_write["key"])], args=_args, client=pipeline)
+
+        try:
+            _versions = self._write([writes[_index]["key"] for _index in indexes], _commands)
+        except redis.exceptions.ConnectionError as rce:
+            return [KeyError("Unable to connect to the Redis persistence engine: {}".format(str(rce)))] * len(indexes)
+        except Exception as e:
+            return [KeyError("An exception occurred: {}".format(str(e)))] * len(indexes)
+
+        _results = []
+        for _index, _version in zip(indexes, _versions):
+            _key, _jsonstr, _expected = writes[_index]["key"], writes[_index]["jsonstr"], writes[_index].get("expected_version")
+            _result = None
+            if _version < 0:
+                _result = VersionConflict(key=_key, expected_version=_expected)
+            elif not _version:
+                # An update of a game not stored field by field.
+                try:
+                    self.save(key=_key, jsonstr=_jsonstr, expected_version=_expected, ttl=writes[_index].get("ttl"))
+                except Exception as e:
+                    _result = e
+            _results.append(_result)
+        return _results
+
+    def _master_for(self, key):
+        if self._router is not None:
+            return self._router.node_for(key=key)[1]
+        return self._redis_master
+
+    def _for_each_node(self, keys, function):
+        # Call function(client, keys) for the keys held by each node, concurrently if
+        # the keys are spread across nodes; returns the keys and result for each node.
+        if self._router is None:
+            return [(keys, function(self._redis_master, keys))]
+        _groups = self._router.group(keys=keys)
+        return list(zip(
+            [_keys for _, _keys in _groups],
+            self._run_concurrently(function, _groups)
+        ))
+
+    def _reader(self, keys):
+        # The connection to read keys from: the node holding them or, with Sentinel,
+        # the replicas unless they may not yet have a write this process made to one
+        # of the keys.
+        if self._router is not None:
+            return self._router.node_for(key=keys[0])[1]
+        if self._replication is None or self._replication.use_replica(keys=[str(_key) for _key in keys]):
+            return self._redis_connection
+        return self._redis_master
+
+    def _fallback(self, reader):
+        # The master, if a read was made on the replicas: a replica may not yet have
+        # a key written moments ago (e.g. by another process).
+        if self._router is not None or reader is self._redis_master:
+            return None
+        if self._replication is not None:
+            self._replication.fell_back()
+        return self._redis_master
+
+    def _read(self, reader, function):
+        # Make a read (a function given the client to read from), hedged if it is to
+        # be made on the replicas and hedging is enabled.
+        if self._hedger is not None and reader is self._redis_connection:
+            return self._hedger.read(function)
+        return function(reader)
+
+    def _load_node(self, client, keys):
+        if self._router is not None:
+            return self._load_pipeline(client, keys)
+        _reader = self._reader(keys)
+        _results = dict(zip(keys, self._read(_reader, lambda _client: self._load_pipeline(_client, keys))))
+        _missing = [_key for _key in keys if not _results[_key]]
+        _master = self._fallback(_reader) if _missing else None
+        if _master is not None:
+            _results.update(zip(_missing, self._load_pipeline(_master, _missing)))
+        return [_results[_key] for _key in keys]
+
+    def _load_pipeline(self, client, keys):
+        return self._pipeline(client, lambda pipeline: [
+            self._load_script(keys=[str(_key)], client=pipeline) for _key in keys
+        ])
+
+    def _save_args(self, jsonstr, expected_version=None, ttl=None):
+        _fields = self._hash_fields(jsonstr) if self.partial_updates else None
+        if _fields is None:
+            _fields = {"_payload": str(jsonstr)}
+        _args = [ttl or self.TTL, "" if expected_version is None else expected_version]
+        for _field, _value in _fields.items():
+            _args.extend([_field, _value])
+        return _args
+
+    def _update_args(self, fields, expected_version=None, ttl=None):
+        _args = [ttl or self.TTL, "" if expected_version is None else expected_version]
+        for _field, _value in fields.items():
+            _args.extend([_field, json.dumps(_value)])
+        return _args
+
+    @staticmethod
+    def _hash_fields(jsonstr):
+        try:
+            _game = json.loads(jsonstr)
+        except ValueError:
+            return None
+        if not isinstance(_game, dict) or not _game or any(_field.startswith("_") for _field in _game):
+            return None
+        return dict((_field, json.dumps(_value)) for _field, _value in _game.items())
+
+    @staticmethod
+    def _decode(return_result):
+        # Return the payload and version of a stored game. The fields of a game
+        # stored field by field are joined back into the JSON game.
+        if return_result is None:
+            return None, None
+        if isinstance(return_result, bytes):
+            # http://sonarqube:9000/project/issues?id=cowbull_server&issues=AWiRMKBcaAhZ-jY-ujHp&open=AWiRMKBcaAhZ-jY-ujHp
+            return str(return_result.decode('utf-8')), 0
+
+        _fields = dict(
+            (_field.decode('utf-8'), _value.decode('utf-8'))
+            for _field, _value in zip(return_result[0::2], return_result[1::2])
+        )
+        _version = int(_fields.pop("_version", 0))
+        if "_payload" in _fields:
+            return _fields["_payload"], _version
+        return "{" + ", ".join(
+            "{}: {}".format(json.dumps(_field), _value) for _field, _value in _fields.items()
+        ) + "}", _version
 
-        self.handler.log(message="Key {} returned: {}".format(key, return_result))
-        return return_result
+    @staticmethod
+    def _pool_stats(connection):
+        _pool = connection.connection_pool
+        if isinstance(_pool, RedisConnectionPool):
+            return _pool.stats()
+        # Sentinel managed pools keep no wait statistics.
+        _in_use = len(getattr(_pool, "_in_use_connections", ()))
+        _created = getattr(_pool, "_created_connections", _in_use)
+        return {
+            "max_connections": _pool.max_connections,
+            "created": _created,
+            "in_use": _in_use,
+            "idle": max(0, _created - _in_use)
+        }
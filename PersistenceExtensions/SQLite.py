@@ -0,0 +1,238 @@
+from flask_helpers.ErrorHandler import ErrorHandler
+from Persistence.AbstractPersister import AbstractPersister
+from Persistence.VersionConflict import VersionConflict
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class Persister(AbstractPersister):
+    """
+    SQLite - Keeps games in a table of an SQLite database file, which every worker
+    on the host can share. The database is in WAL mode, so reads do not wait for
+    writes (or writes for reads); writes are serialized by SQLite, waiting up to
+    busy_timeout_ms for each other.
+
+    Each thread (in each process) has its own connection, opened by its first call;
+    the statements are constant, so each connection prepares them once and reuses
+    them from its statement cache. The batch methods (save_many, delete_many and
+    write_many, used by GroupCommitPersister) make all their writes in one
+    transaction, so set group_commit_ms to commit concurrent writes together.
+
+    Games expire by the indexed expires_at column: loads treat an expired game as
+    not found and sweep (run by ExpirySweeper) deletes them.
+
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS games ("
+        "key TEXT PRIMARY KEY, game TEXT NOT NULL, version INTEGER NOT NULL, expires_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS games_expires_at ON games (expires_at)"
+    )
+
+    # An expired game is replaced, starting again at version 1.
+    UPSERT = (
+        "INSERT INTO games (key, game, version, expires_at) VALUES (?, ?, 1, ?) "
+        "ON CONFLICT (key) DO UPDATE SET game = excluded.game, expires_at = excluded.expires_at, "
+        "version = CASE WHEN games.expires_at > ? THEN games.version + 1 ELSE 1 END"
+    )
+    UPDATE_VERSION = (
+        "UPDATE games SET game = ?, expires_at = ?, version = version + 1 "
+        "WHERE key = ? AND version = ? AND expires_at > ?"
+    )
+    SELECT = "SELECT game, version FROM games WHERE key = ? AND expires_at > ?"
+    SELECT_MANY = "SELECT key, game, version FROM games WHERE expires_at > ? AND key IN ({})"
+    DELETE_MANY = "DELETE FROM games WHERE key IN ({})"
+    DELETE_EXPIRED = "DELETE FROM games WHERE key IN (SELECT key FROM games WHERE expires_at <= ? LIMIT ?)"
+
+    # Keys per statement of load_many and delete_many (older SQLite allows at most
+    # 999 parameters).
+    MAX_KEYS = 500
+
+    SYNCHRONOUS = ("off", "normal", "full")
+
+    def __init__(
+        self,
+        path="/tmp/cowbull.db",
+        synchronous="normal",
+        busy_timeout_ms=5000
+    ):
+        """
+        :param path: <optional> The database file, which is created if need be.
+        :param synchronous: <optional> SQLite's synchronous setting: normal (in WAL
+        mode, commits are synced at checkpoints, so a power loss can lose the last
+        commits but never corrupts the database), full (every commit is synced) or
+        off.
+        :param busy_timeout_ms: <optional> Milliseconds a write waits for another
+        connection's write to finish.
+        """
+        super(Persister, self).__init__()
+
+        self.handler.module = "SQLite Persister"
+        self.handler.log(message="Preparing SQLite database {}".format(path))
+
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            raise ValueError("SQLite 3.24 or later is needed; {} is installed.".format(sqlite3.sqlite_version))
+        if synchronous not in self.SYNCHRONOUS:
+            raise ValueError("synchronous must be one of {}.".format(", ".join(self.SYNCHRONOUS)))
+
+        self._path = os.path.abspath(path)
+        self._synchronous = synchronous
+        self._busy_timeout = busy_timeout_ms / 1000.0
+        self._local = threading.local()
+
+        if not os.path.isdir(os.path.dirname(self._path)):
+            os.makedirs(os.path.dirname(self._path))
+
+        # The journal mode is kept by the database file. This connection is closed
+        # so that none is open should the worker fork.
+        _connection = self._connect()
+        try:
+            _connection.execute("PRAGMA journal_mode = WAL")
+            with self._transaction(_connection):
+                for _statement in self.SCHEMA:
+                    _connection.execute(_statement)
+        finally:
+            _connection.close()
+
+    #
+    # 'public' methods
+    #
+    def save(self, key=None, jsonstr=None, expected_version=None, ttl=None):
+        super(Persister, self).save(key=key, jsonstr=jsonstr, expected_version=expected_version, ttl=ttl)
+        _result = self.write_many(writes=[
+            {"key": key, "jsonstr": jsonstr, "expected_version": expected_version, "ttl": ttl}
+        ])[0]
+        if _result is not None:
+            raise _result
+
+    def load(self, key=None):
+        return self.load_versioned(key=key)[0]
+
+    def load_versioned(self, key=None):
+        super(Persister, self).load(key=key)
+        try:
+            _row = self._connection().execute(self.SELECT, (str(key), time.time())).fetchone()
+        except sqlite3.Error as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+        if _row is None:
+            raise KeyError("Unable to load key {}".format(key))
+        return _row[0], _row[1]
+
+    def load_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many")
+        return dict(
+            (_key, _loaded[0]) for _key, _loaded in self.load_many_versioned(keys=_keys).items()
+        )
+
+    def load_many_versioned(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="load_many_versioned")
+        _found = {}
+        _now = time.time()
+        try:
+            for _chunk in self._chunks([str(_key) for _key in _keys]):
+                for _key, _game, _version in self._connection().execute(
+                    self.SELECT_MANY.format(", ".join("?" * len(_chunk))), [_now] + _chunk
+                ):
+                    _found[_key] = (_game, _version)
+        except sqlite3.Error as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+        return dict((_key, _found.get(str(_key), (None, None))) for _key in _keys)
+
+    def save_many(self, items=None, ttl=None):
+        _items = self._check_items(items=items, method="save_many")
+        self.handler.log(message="Saving {} games".format(len(_items)))
+        _now = time.time()
+        try:
+            _connection = self._connection()
+            with self._transaction(_connection):
+                _connection.executemany(self.UPSERT, [
+                    (str(_key), _jsonstr, self._expires_at(ttl, _key), _now) for _key, _jsonstr in _items.items()
+                ])
+        except sqlite3.Error as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+
+    def write_many(self, writes=None):
+        # The writes are made in one transaction; a version conflict fails only its
+        # own write.
+        _writes = self._check_writes(writes=writes, method="write_many")
+        _results = []
+        _now = time.time()
+        try:
+            _connection = self._connection()
+            with self._transaction(_connection):
+                for _write in _writes:
+                    _key, _version = str(_write["key"]), _write.get("expected_version")
+                    _expires_at = self._expires_at(_write.get("ttl"))
+                    if _version is None:
+                        _connection.execute(self.UPSERT, (_key, _write["jsonstr"], _expires_at, _now))
+                        _results.append(None)
+                    elif _connection.execute(
+                        self.UPDATE_VERSION, (_write["jsonstr"], _expires_at, _key, _version, _now)
+                    ).rowcount:
+                        _results.append(None)
+                    else:
+                        _results.append(VersionConflict(key=_write["key"], expected_version=_version))
+        except sqlite3.Error as e:
+            return [KeyError("An exception occurred: {}".format(str(e)))] * len(_writes)
+        return _results
+
+    def delete(self, key=None):
+        self.delete_many(keys=[key])
+
+    def delete_many(self, keys=None):
+        _keys = self._check_keys(keys=keys, method="delete_many")
+        self.handler.log(message="Deleting {} games".format(len(_keys)))
+        try:
+            _connection = self._connection()
+            with self._transaction(_connection):
+                for _chunk in self._chunks([str(_key) for _key in _keys]):
+                    _connection.execute(self.DELETE_MANY.format(", ".join("?" * len(_chunk))), _chunk)
+        except sqlite3.Error as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+
+    def sweep(self, limit=None):
+        try:
+            _connection = self._connection()
+            with self._transaction(_connection):
+                _deleted = _connection.execute(self.DELETE_EXPIRED, (time.time(), -1 if limit is None else limit)).rowcount
+        except sqlite3.Error as e:
+            raise KeyError("An exception occurred: {}".format(str(e)))
+        if _deleted:
+            self.handler.log(message="Swept {} expired games".format(_deleted))
+        return _deleted
+
+    #
+    # 'private' methods
+    #
+    def _connection(self):
+        # A connection may not be used by another thread, nor after a fork.
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _connect(self):
+        # Transactions are begun explicitly (see _transaction).
+        _connection = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+        _connection.execute("PRAGMA synchronous = {}".format(self._synchronous.upper()))
+        return _connection
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _transaction(connection):
+        # BEGIN IMMEDIATE takes the write lock at the start, so two connections which
+        # both read then write cannot deadlock.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+
+    def _chunks(self, keys):
+        return [keys[_start:_start + self.MAX_KEYS] for _start in range(0, len(keys), self.MAX_KEYS)]
+
@@ -29,6 +29,32 @@ class V1(object):
         game_view = controller.as_view('Game')
         self.app.add_url_rule('/v1/game', view_func=game_view, methods=["GET", "POST"])
 
+    def games(self, controller=None):
+        # Add a batch games view, allowing many new games to be created in a
+        # single request. See flask_controllers/Games.py
+        # ---------------------------------------------------------------------------
+        self.error_handler.method = "games"
+        self.error_handler.log(message="Adding game URL: /v1/games")
+        games_view = controller.as_view('Games')
+        self.app.add_url_rule(
+            '/v1/games',
+            view_func=games_view,
+            methods=["GET"]
+        )
+
+    def guesses(self, controller=None):
+        # Add a batch guesses view, allowing guesses to be made against many games
+        # in a single request. See flask_controllers/GameGuesses.py
+        # ---------------------------------------------------------------------------
+        self.error_handler.method = "guesses"
+        self.error_handler.log(message="Adding game URL: /v1/games/guesses")
+        guesses_view = controller.as_view('Guesses')
+        self.app.add_url_rule(
+            '/v1/games/guesses',
+            view_func=guesses_view,
+            methods=["POST"]
+        )
+
     def modes(self, controller=None):
         # Add a game modes view. The game modes view is actually contained within a class
         # based on a MethodView. See flask_controllers/GameModes.py
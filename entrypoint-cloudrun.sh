@@ -1,2 +1,3 @@
 #!/bin/sh
-gunicorn -b 0.0.0.0:$PORT -w 4 main:app
+export WORKERS=${WORKERS:-4}
+gunicorn -b 0.0.0.0:$PORT -w $WORKERS --threads ${THREADS:-1} main:app
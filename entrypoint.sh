@@ -1,2 +1,2 @@
 #!/bin/sh
-gunicorn -b 0.0.0.0:$PORT -w $WORKERS main:app
+gunicorn -b 0.0.0.0:$PORT -w $WORKERS --threads ${THREADS:-1} main:app
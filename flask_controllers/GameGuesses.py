@@ -0,0 +1,305 @@
+# GameGuesses is a class based on Flask.MethodView which makes guesses against
+# many games in a single request. It is intended for machine players (bots, load
+# generators, etc.) which would otherwise issue one POST to /v1/game per guess.
+# All of the games referenced are loaded in one bulk persister call and saved in
+# another, and each entry reports its own outcome (or error) and status. As for a
+# single guess, a game is only saved if it is still at the version it was loaded
+# at; otherwise its entries report a 409 and the guesses were not counted.
+
+# Import standard packages
+import socket
+
+# Import flask packages
+from flask import request
+from flask.views import MethodView
+from flask_helpers.build_response import build_response
+from werkzeug.exceptions import BadRequest
+
+# Import the Game Controller
+from Game.GameController import GameController
+from Game.GameToken import GameToken
+from Persistence.VersionConflict import VersionConflict
+
+# Import the Flask app object
+from python_cowbull_server import app, error_handler
+
+
+class GameGuesses(MethodView):
+    """
+    Make guesses against several games in one request. The request must be a JSON
+    list of guesses (or an object containing the list as "guesses"), e.g.
+
+        [
+            {"key": "<game key>", "digits": [0, 1, 2, 3]},
+            {"key": "<game key>", "digits": [4, 5, 6, 7]}
+        ]
+
+    The response contains one result per entry, in the same order. Each result
+    carries an HTML style status; entries fail independently of each other.
+    """
+
+    def __init__(self):
+        self.handler = error_handler
+        self.handler.module = "GameGuesses"
+        self.handler.method = "__init__"
+
+        self.game_tokens = GameToken.from_config(app.config)
+        self.persistence_engine = app.config.get("PERSISTER", None)
+        if not self.persistence_engine and not self.game_tokens:
+            raise ValueError(
+                "No persistence engine is defined and for some unknown "
+                "reason, the default of redis did not make it through "
+                "configuration!"
+            )
+        self.max_batch = app.config.get("COWBULL_MAX_BATCH", None) or 1000
+        self.codec = app.config.get("COWBULL_CODEC", None)
+
+    def post(self):
+        self.handler.method = "post"
+        self.handler.log(message='Processing batch POST request.', status=0)
+
+        try:
+            json_data = request.get_json()
+        except BadRequest as e:
+            return self.handler.error(
+                status=400,
+                exception=e.description,
+                message="Bad request. There was no JSON present. Are you sure the "
+                        "header Content-type is set to application/json?"
+            )
+
+        if isinstance(json_data, dict):
+            json_data = json_data.get("guesses", None)
+        if not isinstance(json_data, list):
+            return self.handler.error(
+                status=400,
+                exception="No list of guesses",
+                message="Bad request. The request must contain a list of guesses, "
+                        "each with a key and an array of digits."
+            )
+        if len(json_data) > self.max_batch:
+            return self.handler.error(
+                status=400,
+                exception="Too many guesses",
+                message="A batch may contain at most {} guesses.".format(self.max_batch)
+            )
+
+        #
+        # Validate every entry and fetch all of the (distinct) games referenced
+        # in one call to the persister.
+        #
+        _results = [self._validate_entry(entry) for entry in json_data]
+        _keys = list(set(
+            entry["key"] for entry, result in zip(json_data, _results) if result is None
+        ))
+
+        persister = None
+        _persisted = {}
+        if not self.game_tokens:
+            persister = self.persistence_engine.persister
+            self.handler.log(message='Loading {} games'.format(len(_keys)), status=0)
+            try:
+                _persisted = persister.load_many_versioned(keys=_keys) if _keys else {}
+            except KeyError as ke:
+                return self.handler.error(
+                    status=503,
+                    exception=str(ke),
+                    message="Unable to load the games from the persister."
+                )
+
+        #
+        # Make each guess in order; a key that appears more than once is guessed
+        # against the same game so that the guesses are counted correctly.
+        #
+        _games = {}
+        _created = {}
+        _previous = {}
+        _changed = set()
+        for idx, entry in enumerate(json_data):
+            if _results[idx] is not None:
+                continue
+            _key = entry["key"]
+            _game = _games.get(_key, None)
+            if _game is None:
+                if self.game_tokens:
+                    _game = self._get_game_from_token(_key)
+                    if isinstance(_game, tuple):
+                        _game, _created[_key] = _game
+                else:
+                    _game = self._get_game(_persisted.get(_key, (None, None))[0])
+                if not isinstance(_game, GameController):
+                    _results[idx] = self._entry_error(_key, **_game)
+                    continue
+                _games[_key] = _game
+                _previous[_key] = _game.game.guesses_made
+
+            _before = (_game.game.guesses_made, _game.game.status)
+            try:
+                _analysis = _game.guess(*entry["digits"])
+            except ValueError as ve:
+                _results[idx] = self._entry_error(
+                    _key,
+                    status=400,
+                    exception=str(ve),
+                    message="There is a problem with the digits provided!"
+                )
+                continue
+
+            # A guess against a game which is over changes nothing to save.
+            if (_game.game.guesses_made, _game.game.status) != _before:
+                _changed.add(_key)
+            _display_info = _game.game.dump()
+            del(_display_info["answer"])
+            if self.game_tokens:
+                #
+                # Each token issued replaces the one before it, so a key guessed more
+                # than once in the batch is advanced from its last token.
+                #
+                try:
+                    _display_info["key"] = self.game_tokens.dumps(
+                        _game.game,
+                        created=_created[_key],
+                        previous=_previous[_key]
+                    )
+                except KeyError as ke:
+                    _results[idx] = self._entry_error(
+                        _key,
+                        status=400,
+                        exception=str(ke),
+                        message="The request must contain a valid game key."
+                    )
+                    continue
+                _previous[_key] = _game.game.guesses_made
+            _results[idx] = {
+                "key": _key,
+                "status": 200,
+                "game": _display_info,
+                "outcome": _analysis
+            }
+
+        #
+        # Save all of the games which were changed in one call, each only if it is
+        # still at the version loaded (and, if the persister can, writing just the
+        # fields changed). The entries of a game which could not be saved report why.
+        #
+        if _changed and not self.game_tokens:
+            self.handler.log(message='Saving {} games'.format(len(_changed)), status=0)
+            _changed = sorted(_changed)
+            try:
+                _saved = persister.write_many(writes=[
+                    self._write_for(_key, _games[_key], _persisted[_key][1]) for _key in _changed
+                ])
+            except KeyError as ke:
+                return self.handler.error(
+                    status=503,
+                    exception=str(ke),
+                    message="Unable to save the games to the persister."
+                )
+            _failed = dict((_key, _error) for _key, _error in zip(_changed, _saved) if _error is not None)
+            for idx, entry in enumerate(json_data):
+                if _results[idx].get("status") == 200 and entry["key"] in _failed:
+                    _results[idx] = self._save_error(entry["key"], _failed[entry["key"]])
+
+        self.handler.log(message='Returning {} results'.format(len(_results)), status=0)
+        return build_response(
+            response_data={
+                "results": _results,
+                "served-by": socket.gethostname()
+            }
+        )
+
+    # Private methods
+    def _validate_entry(self, entry):
+        if not isinstance(entry, dict):
+            return self._entry_error(
+                None,
+                status=400,
+                exception="Entry is not an object",
+                message="Each guess must be an object containing a key and digits."
+            )
+
+        _key = entry.get("key", None)
+        if not _key or not isinstance(_key, str):
+            return self._entry_error(
+                None,
+                status=400,
+                exception="Key is missing or not a string",
+                message="Bad request. The guess does not contain a key!"
+            )
+
+        if not isinstance(entry.get("digits", None), list):
+            return self._entry_error(
+                _key,
+                status=400,
+                exception="digits",
+                message="The request must contain an array of digits called 'digits'"
+            )
+        return None
+
+    def _get_game(self, persisted_game):
+        if persisted_game is None:
+            return {
+                "status": 400,
+                "exception": "Unable to load key",
+                "message": "The request must contain a valid game key."
+            }
+
+        try:
+            return GameController(
+                game_modes=app.config["COWBULL_CUSTOM_MODES"],
+                game_json=persisted_game,
+                codec=self.codec
+            )
+        except (ValueError, TypeError, KeyError) as e:
+            return {
+                "status": 400,
+                "exception": str(e),
+                "message": "Exception while trying to load game from game key."
+            }
+
+    def _get_game_from_token(self, key):
+        try:
+            _loaded_game, _created = self.game_tokens.loads(
+                token=key,
+                game_modes=app.config["COWBULL_CUSTOM_MODES"]
+            )
+        except (KeyError, ValueError) as e:
+            return {
+                "status": 400,
+                "exception": str(e),
+                "message": "The request must contain a valid game key."
+            }
+        return self._get_game(_loaded_game), _created
+
+    @staticmethod
+    def _write_for(key, game, version):
+        _write = {"key": key, "jsonstr": game.save(), "expected_version": version, "ttl": game.game.ttl}
+        _changes = game.changes()
+        if _changes is not None:
+            _write["fields"] = _changes
+        return _write
+
+    def _save_error(self, key, error):
+        if isinstance(error, VersionConflict):
+            return self._entry_error(
+                key,
+                status=409,
+                exception=str(error),
+                message="The game was changed by another request while the guess was "
+                        "being made. The guess was not counted; please make it again."
+            )
+        return self._entry_error(
+            key,
+            status=503,
+            exception=str(error),
+            message="Unable to save the game to the persister."
+        )
+
+    def _entry_error(self, key, status=None, exception=None, message=None):
+        self.handler.log(message="Guess for key {} failed: {}".format(key, message))
+        return {
+            "key": key,
+            "status": status,
+            "exception": exception,
+            "message": message
+        }
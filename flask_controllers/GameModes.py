@@ -7,24 +7,23 @@ from flask_helpers.build_response import build_response
 # Import the Flask app object
 from python_cowbull_server import app, error_handler
 
-# Import the Game Controller
-from Game.GameController import GameController
+# Import the game mode registry
+from Game.GameModeRegistry import GameModeRegistry
 
 
 class GameModes(MethodView):
     def get(self):
-        logging.debug("GameModes: GET: Initializing GameObject")
-        game_controller = GameController(
-            game_modes=app.config["COWBULL_CUSTOM_MODES"],
+        logging.debug("GameModes: GET: Fetching game mode registry")
+        registry = GameModeRegistry.get(
+            input_modes=app.config["COWBULL_CUSTOM_MODES"]
         )
-        logging.debug("GameModes: GET: GameObject initialized to {}".format(game_controller.save()))
 
         logging.debug("GameModes: GET: Checking if textmode flag set")
         if request.args.get('textmode', None):
             logging.debug("GameModes: GET: Responding with list of names")
-            response_data = game_controller.game_mode_names
+            response_data = list(registry.names)
         else:
-            logging.debug("GameModes: GET: Responding with JSON object: {}".format(game_controller.game_modes))
+            logging.debug("GameModes: GET: Responding with JSON object: {}".format(registry.names))
             response_data = {
                 "instructions": "Welcome to the CowBull game. The objective of this game "
                                 "is to guess a set of digits by entering a sequence of "
@@ -33,7 +32,7 @@ class GameModes(MethodView):
                                 "of your guesses.",
                 "notes": "The modes can be different depending upon the game server that "
                          "serves the game.",
-                "default-mode": str(game_controller.default_mode),
+                "default-mode": str(registry.default_mode),
                 "modes": [
                     {
                         "mode": gt.mode,
@@ -41,7 +40,7 @@ class GameModes(MethodView):
                         "digit-type": gt.digit_type,
                         "guesses": gt.guesses_allowed
                     }
-                    for gt in game_controller.game_modes
+                    for gt in registry.modes
                 ]
             }
 #            response_data = [{"mode": gt.mode,
@@ -4,7 +4,6 @@
 # an existing game
 
 # Import standard packages
-import json
 import socket
 from redis.exceptions import ConnectionError
 
@@ -15,7 +14,13 @@ from flask_helpers.build_response import build_response
 from werkzeug.exceptions import BadRequest
 
 # Import the Game Controller
+from Game.GameCodec import GameCodec
 from Game.GameController import GameController
+from Game.GameModeRegistry import GameModeRegistry
+from Game.GamePool import GamePool
+from Game.GameToken import GameToken
+from Game.PackedWord import PackedWord
+from Persistence.VersionConflict import VersionConflict
 
 # Import the Flask app object
 from python_cowbull_server import app, error_handler
@@ -48,10 +53,33 @@ class GameServerController(MethodView):
         #
         self.game_version = app.config.get("GAME_VERSION")
 
+        #
+        # The codec used to encode games for the persister (see Game/GameCodec.py).
+        # Games are decoded in whatever format they were saved in.
+        #
+        self.codec = app.config.get("COWBULL_CODEC", None)
+
+        #
+        # New games are taken from a pool of pre-generated games, if one has been
+        # configured (see Game/GamePool.py), and created on demand otherwise.
+        #
+        self.game_pool = GamePool.from_config(app.config)
+
+        #
+        # In stateless mode, games are never persisted. The game state is held by
+        # the client in an encrypted, signed token (see Game/GameToken.py) which is
+        # returned as the game key.
+        #
+        self.game_tokens = GameToken.from_config(app.config)
+        if self.game_tokens:
+            self.handler.log(message="Stateless mode; games will not be persisted.", status=0)
+
         #
         # Persistence Engine selector, v2.0
         #
         self.persistence_engine = app.config.get("PERSISTER", None)
+        if not self.persistence_engine and self.game_tokens:
+            return
         if not self.persistence_engine:
             raise ValueError(
                 "No persistence engine is defined and for some unknown "
@@ -97,7 +125,9 @@ class GameServerController(MethodView):
             self.handler.log(message="Creating game with mode {} ({})".format(game_mode, type(game_mode)))
             game_controller = GameController(
                 game_modes=app.config["COWBULL_CUSTOM_MODES"],
-                mode=game_mode
+                game_json=self.game_pool.take(mode=game_mode) if self.game_pool else None,
+                mode=game_mode,
+                codec=self.codec
             )
             self.handler.log(message='New game created with key {}'.format(game_controller.game.key), status=0)
         except ValueError as ve:
@@ -107,25 +137,32 @@ class GameServerController(MethodView):
                 message="{}: game mode {}!".format(str(ve), game_mode)
             )
 
-        # Get a persistence engine. The persister is set in configuration
-        # and dynamically loaded at the start of the transaction. See
-        # Persistence/PersistenceEngine.py for more info.
-        self.handler.log(message="Fetching persistence engine - {}".format(self.persistence_engine.engine_name))
-        persister = self.persistence_engine.persister
-        self.handler.log(message='Persister instantiated', status=0)
-
-        #
-        # Save the newly created game to the persistence engine
-        #
-        self.handler.log(message="Saving game to persister")
-        persister.save(game_controller.game.key, game_controller.save())
-        self.handler.log(message='Game {} persisted.'.format(game_controller.game.key), status=0)
+        if self.game_tokens:
+            #
+            # Stateless mode: the key returned is the game itself.
+            #
+            _key = self.game_tokens.dumps(game_controller.game)
+        else:
+            # Get a persistence engine. The persister is set in configuration
+            # and dynamically loaded at the start of the transaction. See
+            # Persistence/PersistenceEngine.py for more info.
+            self.handler.log(message="Fetching persistence engine - {}".format(self.persistence_engine.engine_name))
+            persister = self.persistence_engine.persister
+            self.handler.log(message='Persister instantiated', status=0)
+
+            #
+            # Save the newly created game to the persistence engine
+            #
+            self.handler.log(message="Saving game to persister")
+            persister.save(game_controller.game.key, game_controller.save(), ttl=game_controller.game.ttl)
+            self.handler.log(message='Game {} persisted.'.format(game_controller.game.key), status=0)
+            _key = game_controller.game.key
 
         #
         # Build the user response - key, no. of digits, and no. of guesses
         #
         _response = {
-            "key": game_controller.game.key,
+            "key": _key,
             "mode": game_controller.game.mode.mode,
             "digits": game_controller.game.mode.digits,
             "digit-type": game_controller.game.mode.digit_type,
@@ -154,21 +191,47 @@ class GameServerController(MethodView):
 
         json_dict = self._fetch_json(request=request)
 
-        #
-        # Get a persister to enable the game to be loaded and then saved (updated).
-        # See the GET method above for more information on the persister.
-        #
-        self.handler.log(message='Getting persister', status=0)
-        persister = self.persistence_engine.persister
-
         _key = self._get_key(json_dict=json_dict)
         if not isinstance(_key, str):
             return _key
 
+        #
+        # Get a persister to enable the game to be loaded and then saved (updated).
+        # See the GET method above for more information on the persister. In
+        # stateless mode, the game is loaded from the key itself.
+        #
+        persister = None
+        _created = None
+        _persisted = False
+        _version = None
         self.handler.log(message='Attempting to execute_load game {}'.format(_key), status=0)
-        _loaded_game = self._load_game(key=_key, persister=persister)
-        if not isinstance(_loaded_game, dict):
-            return _loaded_game
+        if self.game_tokens:
+            _loaded_game = self._load_token(key=_key)
+            if not isinstance(_loaded_game, tuple):
+                return _loaded_game
+            _loaded_game, _created = _loaded_game
+            _previous = _loaded_game["guesses_made"]
+        else:
+            self.handler.log(message='Getting persister', status=0)
+            persister = self.persistence_engine.persister
+
+            #
+            # If the persister can apply the guess itself (see atomic_guess in
+            # PersistenceExtensions/Redis.py), the game is guessed, scored and saved in
+            # one round trip; the game returned is the game after the guess, which is
+            # not saved again, and the response is built from the persister's analysis.
+            #
+            _loaded_game = self._atomic_guess(key=_key, persister=persister, json_dict=json_dict)
+            _persisted = _loaded_game is not None
+            if isinstance(_loaded_game, tuple):
+                _loaded_game, _persisted_analysis = _loaded_game
+            if _loaded_game is None:
+                _loaded_game = self._load_game(key=_key, persister=persister)
+                if not isinstance(_loaded_game, tuple):
+                    return _loaded_game
+                _loaded_game, _version = _loaded_game
+            if not isinstance(_loaded_game, dict):
+                return _loaded_game
 
         _game = self._get_game(
             _loaded_game,
@@ -190,7 +253,10 @@ class GameServerController(MethodView):
         # Make a guess
         #
         try:
-            _analysis = _game.guess(*_guesses)
+            if _persisted:
+                _analysis = _game.outcome(_persisted_analysis, *_guesses)
+            else:
+                _analysis = _game.guess(*_guesses)
         except ValueError as ve:
             return self.handler.error(
                 status=400,
@@ -200,18 +266,58 @@ class GameServerController(MethodView):
         self.handler.log(message='Retrieved guess analysis', status=0)
 
         #
-        # Save the game
-        #
-        self.handler.log(message="Saving game to persister")
-        save_game = _game.save()
-        persister.save(key=_key, jsonstr=save_game)
-        self.handler.log(message='Game {} persisted.'.format(_key), status=0)
+        # Save the game. The game is encoded once for storage; the response is built
+        # from the game object itself rather than by decoding the stored copy.
+        #
+        if self.game_tokens:
+            self.handler.log(message="Issuing new game token")
+            try:
+                _new_key = self.game_tokens.dumps(_game.game, created=_created, previous=_previous)
+            except KeyError as ke:
+                return self.handler.error(
+                    status=400,
+                    exception=str(ke),
+                    message="The request must contain a valid game key."
+                )
+        elif not _persisted:
+            #
+            # Only the fields changed by the guess are written if the persister can
+            # update them in place; otherwise the whole game is saved. The game is
+            # only written if it is still at the version loaded, so that a guess made
+            # concurrently (e.g. a resubmitted request) is not silently overwritten.
+            #
+            _changes = _game.changes()
+            try:
+                if _changes is None:
+                    self.handler.log(message="Saving game to persister")
+                    persister.save(key=_key, jsonstr=_game.save(), expected_version=_version, ttl=_game.game.ttl)
+                else:
+                    self.handler.log(message="Updating game in persister")
+                    persister.update(
+                        key=_key,
+                        fields=_changes,
+                        jsonstr=_game.save(),
+                        expected_version=_version,
+                        ttl=_game.game.ttl
+                    )
+            except VersionConflict as vc:
+                _response = self.handler.error(
+                    status=409,
+                    exception=str(vc),
+                    message="The game was changed by another request while the guess was "
+                            "being made. The guess was not counted; please make it again."
+                )
+                _response.headers["Retry-After"] = "0"
+                return _response
+            self.handler.log(message='Game {} persisted.'.format(_key), status=0)
 
         #
         # Return the analysis of the guess to the user.
         #
-        _display_info = json.loads(save_game)
+        _display_info = _game.game.dump()
         del(_display_info["answer"])
+        if self.game_tokens:
+            _display_info["key"] = _new_key
         _return_response = \
             {
                 "game": _display_info,
@@ -282,7 +388,7 @@ class GameServerController(MethodView):
         #
         _persisted_response = None
         try:
-            _persisted_response = persister.load(key=key)
+            _persisted_response, _version = persister.load_versioned(key=key)
         except KeyError as ke:
             return self.handler.error(
                 status=400,
@@ -291,14 +397,82 @@ class GameServerController(MethodView):
             )
 
         try:
-            _loaded_game = json.loads(_persisted_response)
+            _loaded_game = GameCodec.decode_any(
+                payload=_persisted_response,
+                registry=GameModeRegistry.get(input_modes=app.config["COWBULL_CUSTOM_MODES"])
+            )
         except Exception as e:
             return self.handler.error(
                 status=400,
                 exception=str(e),
                 message="Exception while trying to load game from game key."
             )
-        return _loaded_game
+        return _loaded_game, _version
+
+    def _atomic_guess(self, key=None, persister=None, json_dict=None):
+        #
+        # Apply the guess with the persister's atomic guess, if it has one and it
+        # is enabled. The digits are parsed for every digit type since the mode
+        # of the game is not known until the game is loaded. Returns the game after
+        # the guess and the persister's analysis of it, or None if the game must be
+        # loaded, guessed and saved in the usual way.
+        #
+        if not getattr(persister, "atomic_guesses", False):
+            return None
+        _digits = json_dict.get("digits", None)
+        if not isinstance(_digits, list):
+            return None
+
+        _guesses = {}
+        for _digit_type in (PackedWord.DIGIT, PackedWord.HEXDIGIT):
+            try:
+                _guesses[_digit_type] = list(PackedWord.parse(_digits, wordtype=_digit_type).digits)
+            except (ValueError, TypeError):
+                _guesses[_digit_type] = None
+
+        _registry = GameModeRegistry.get(input_modes=app.config["COWBULL_CUSTOM_MODES"])
+        _modes = dict(
+            (_mode.mode, [_mode.digits, _mode.guesses_allowed, _mode.digit_type])
+            for _mode in _registry.modes
+        )
+
+        try:
+            _persisted_response = persister.atomic_guess(key=key, guesses=_guesses, modes=_modes)
+        except KeyError as ke:
+            return self.handler.error(
+                status=400,
+                exception=str(ke),
+                message="The request must contain a valid game key."
+            )
+        if _persisted_response is None:
+            return None
+
+        try:
+            _persisted_game, _persisted_analysis = _persisted_response
+            return GameCodec.decode_any(payload=_persisted_game, registry=_registry), _persisted_analysis
+        except Exception as e:
+            return self.handler.error(
+                status=400,
+                exception=str(e),
+                message="Exception while trying to load game from game key."
+            )
+
+    def _load_token(self, key=None):
+        #
+        # Load the game from a stateless game token. Tokens that have been
+        # tampered with or have expired are treated as invalid game keys.
+        #
+        try:
+            return self.game_tokens.loads(
+                token=key,
+                game_modes=app.config["COWBULL_CUSTOM_MODES"]
+            )
+        except (KeyError, ValueError) as e:
+            return self.handler.error(
+                status=400,
+                exception=str(e),
+                message="The request must contain a valid game key."
+            )
 
     def _get_game(
         self,
@@ -311,14 +485,11 @@ class GameServerController(MethodView):
         # response to the user indicating an HTML status, the exception, and an
         # explanatory message. If the data
         #
-        self.handler.log(message="Loading game mode from: {}.".format(loaded_game["mode"]))
-        _mode = loaded_game["mode"]
-        self.handler.log(message="Loaded game mode {}.".format(str(_mode["mode"])))
-
+        self.handler.log(message="Loading game {}.".format(loaded_game["key"]))
         _game = GameController(
             game_modes=app.config["COWBULL_CUSTOM_MODES"],
-            game_json=json.dumps(loaded_game),
-            mode=str(_mode["mode"])
+            game_json=loaded_game,
+            codec=self.codec
         )
         return _game
 
@@ -0,0 +1,129 @@
+# Games is a class based on Flask.MethodView which creates many new games in a
+# single request, e.g. GET /v1/games?mode=Hex&count=500. It is intended for
+# tournament runners and load generators which would otherwise issue one GET to
+# /v1/game per game. All of the games are persisted in one bulk persister call.
+
+# Import standard packages
+import socket
+
+# Import flask packages
+from flask import request
+from flask.views import MethodView
+from flask_helpers.build_response import build_response
+
+# Import the Game Controller
+from Game.GameController import GameController
+from Game.GamePool import GamePool
+from Game.GameToken import GameToken
+
+# Import the Flask app object
+from python_cowbull_server import app, error_handler
+
+
+class Games(MethodView):
+    """
+    Create several games (of the same mode) in one request. The optional query
+    parameters are mode (as for /v1/game) and count (the number of games, default 1).
+    """
+
+    def __init__(self):
+        self.handler = error_handler
+        self.handler.module = "Games"
+        self.handler.method = "__init__"
+
+        self.game_tokens = GameToken.from_config(app.config)
+        self.persistence_engine = app.config.get("PERSISTER", None)
+        if not self.persistence_engine and not self.game_tokens:
+            raise ValueError(
+                "No persistence engine is defined and for some unknown "
+                "reason, the default of redis did not make it through "
+                "configuration!"
+            )
+        self.max_batch = app.config.get("COWBULL_MAX_BATCH", None) or 1000
+        self.codec = app.config.get("COWBULL_CODEC", None)
+        self.game_pool = GamePool.from_config(app.config)
+
+    def get(self):
+        self.handler.method = "get"
+        self.handler.log(message='Processing batch GET request', status=0)
+
+        game_mode = request.args.get('mode', default=None, type=None)
+        try:
+            count = int(request.args.get('count', default=1))
+        except ValueError:
+            count = None
+        if count is None or count < 1 or count > self.max_batch:
+            return self.handler.error(
+                status=400,
+                exception="Invalid count",
+                message="count must be a whole number between 1 and {}.".format(self.max_batch)
+            )
+
+        self.handler.log(message="Creating {} games with mode {}".format(count, game_mode))
+        _pooled = self.game_pool.take_many(mode=game_mode, count=count) if self.game_pool else []
+        _pooled.extend([None] * (count - len(_pooled)))
+        try:
+            game_controllers = [
+                GameController(
+                    game_modes=app.config["COWBULL_CUSTOM_MODES"],
+                    game_json=_game,
+                    mode=game_mode,
+                    codec=self.codec
+                )
+                for _game in _pooled
+            ]
+        except ValueError as ve:
+            return self.handler.error(
+                status=400,
+                exception="Invalid game mode",
+                message="{}: game mode {}!".format(str(ve), game_mode)
+            )
+
+        if self.game_tokens:
+            #
+            # Stateless mode: the keys returned are the games themselves.
+            #
+            _keys = [self.game_tokens.dumps(game_controller.game) for game_controller in game_controllers]
+        else:
+            #
+            # Save all of the new games to the persistence engine in one call.
+            #
+            persister = self.persistence_engine.persister
+            self.handler.log(message="Saving {} games to persister".format(count))
+            try:
+                persister.save_many(
+                    items=dict(
+                        (game_controller.game.key, game_controller.save())
+                        for game_controller in game_controllers
+                    ),
+                    ttl=dict(
+                        (game_controller.game.key, game_controller.game.ttl)
+                        for game_controller in game_controllers
+                    )
+                )
+            except KeyError as ke:
+                return self.handler.error(
+                    status=503,
+                    exception=str(ke),
+                    message="Unable to save the games to the persister."
+                )
+            _keys = [game_controller.game.key for game_controller in game_controllers]
+
+        _mode = game_controllers[0].game.mode
+        _response = {
+            "keys": _keys,
+            "mode": _mode.mode,
+            "digits": _mode.digits,
+            "digit-type": _mode.digit_type,
+            "guesses": _mode.guesses_allowed,
+            "served-by": socket.gethostname(),
+            "help-text": _mode.help_text,
+            "instruction-text": _mode.instruction_text
+        }
+
+        self.handler.log(message='Batch GET request fulfilled with {} games'.format(count), status=0)
+        return build_response(
+            html_status=200,
+            response_data=_response,
+            response_mimetype="application/json"
+        )
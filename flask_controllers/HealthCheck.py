@@ -1,5 +1,6 @@
 from flask.views import MethodView
 from flask_helpers.build_response import build_response
+from Game.GamePool import GamePool
 from python_cowbull_server import app, error_handler
 
 
@@ -33,4 +34,12 @@ class HealthCheck(MethodView):
                 "comment": "Unable to persist {}".format(str(e.message))
             }
 
+        _persister_stats = self.persistence_engine.persister.stats()
+        if _persister_stats:
+            _response["persister"] = _persister_stats
+
+        _game_pool = GamePool.from_config(app.config)
+        if _game_pool:
+            _response["pool"] = _game_pool.stats()
+
         return build_response(response_data=_response, html_status=_status)
@@ -2,3 +2,5 @@ from .GameServerController import GameServerController
 from .HealthCheck import HealthCheck
 from .Readiness import Readiness
 from .GameModes import GameModes
+from .GameGuesses import GameGuesses
+from .Games import Games
@@ -29,7 +29,7 @@ from python_cowbull_server import app, error_handler
 # -----------------------------------------
 # This enables request handlers to be defined outside of app.py making them
 # more object-oriented and easier to manage and maintain.
-from flask_controllers import GameServerController, HealthCheck, Readiness, GameModes
+from flask_controllers import GameServerController, HealthCheck, Readiness, GameModes, GameGuesses, Games
 
 # Import the Flask routes
 # -----------------------
@@ -52,6 +52,12 @@ v1 = V1(error_handler=error_handler, app=app)
 v1.game(controller=GameServerController)
 error_handler.log(message="Added route v1.game", logger=logging.info)
 
+v1.games(controller=Games)
+error_handler.log(message="Added route v1.games", logger=logging.info)
+
+v1.guesses(controller=GameGuesses)
+error_handler.log(message="Added route v1.guesses", logger=logging.info)
+
 v1.modes(controller=GameModes)
 error_handler.log(message="Added route v1.modes", logger=logging.info)
 
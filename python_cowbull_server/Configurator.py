@@ -102,7 +102,7 @@ class Configurator(object):
                    ("COWBULL_CONFIG", self.app.config["COWBULL_CONFIG"])
                ] \
                + \
-               [(i["name"], self.app.config[i["name"]]) for i in self.env_vars]
+               [(i["name"], self._mask(i["name"], self.app.config[i["name"]])) for i in self.env_vars]
 
     def print_variables(self):
         print('')
@@ -170,6 +170,8 @@ class Configurator(object):
             else:
                 raise TypeError("Unexpected item in configuration: {}, type: {}".format(item, type(item)))
 
+        self._check_workers()
+
     def _load_defaults(
             self,
             source
@@ -222,6 +224,15 @@ class Configurator(object):
             "default": _defaults["flask_debug"],
             "caster": bool
         }
+        _workers = {
+            "name": "WORKERS",
+            "description": "The number of worker processes serving requests (gunicorn -w, "
+                            "see entrypoint.sh). Configurations which keep state in each "
+                            "process are refused if it is more than 1. Default is 1",
+            "required": False,
+            "default": 1,
+            "caster": int
+        }
         _cowbull_dry_run = {
             "name": "COWBULL_DRY_RUN",
             "description": "Do not run the server, simply report the configuration that would "
@@ -241,17 +252,108 @@ class Configurator(object):
             "default": None,
             "caster": self._load_from_json
         }
+        _cowbull_max_batch = {
+            "name": "COWBULL_MAX_BATCH",
+            "description": "The maximum number of entries (guesses or new games) "
+                            "accepted by a single batch request.",
+            "required": False,
+            "default": 1000,
+            "caster": int
+        }
+
+        _cowbull_stateless = {
+            "name": "COWBULL_STATELESS",
+            "description": "Do not persist games. Instead, the full (encrypted and signed) "
+                            "game state is returned to the client as the game key and "
+                            "a new key is returned with every guess.",
+            "required": False,
+            "default": False,
+            "caster": bool
+        }
+        _cowbull_token_secret = {
+            "name": "COWBULL_TOKEN_SECRET",
+            "description": "The secret used to encrypt and sign game keys when "
+                            "COWBULL_STATELESS is set. Every server must use the same secret.",
+            "required": False,
+            "default": None
+        }
+        _cowbull_token_max_age = {
+            "name": "COWBULL_TOKEN_MAX_AGE",
+            "description": "When COWBULL_STATELESS is set, the number of seconds a game key "
+                            "remains valid after it is issued. Default is 3600",
+            "required": False,
+            "default": 3600,
+            "caster": int
+        }
+        _cowbull_token_counters = {
+            "name": "COWBULL_TOKEN_COUNTERS",
+            "description": "When COWBULL_STATELESS is set, where the guess counter of each "
+                            "game is kept so that an earlier game key cannot be used again: "
+                            "memory (the default, for each worker) or persister (shared by "
+                            "every worker and server).",
+            "required": False,
+            "default": "memory",
+            "caster": str,
+            "choices": ["memory", "persister"]
+        }
+
+        _cowbull_codec = {
+            "name": "COWBULL_CODEC",
+            "description": "The codec used to encode games for the persister: json (the "
+                            "default), binary, or binary-zlib. Games saved with any codec "
+                            "can always be loaded.",
+            "required": False,
+            "default": "json",
+            "caster": str,
+            "choices": ["json", "binary", "binary-zlib"]
+        }
+
+        _cowbull_pool_depth = {
+            "name": "COWBULL_POOL_DEPTH",
+            "description": "The number of new games to generate in advance for each mode "
+                            "(a number for every mode, or a JSON object of mode names to "
+                            "numbers, e.g. {\"Normal\": 500, \"Hex\": 50}). Default is 0, "
+                            "games are created when requested.",
+            "required": False,
+            "default": 0,
+            "caster": self._load_pool_depth
+        }
 
         return [
             _persister,
             _flask_host,
             _flask_port,
             _flask_debug,
+            _workers,
             _cowbull_dry_run,
-            _cowbull_custom_modes
+            _cowbull_custom_modes,
+            _cowbull_max_batch,
+            _cowbull_stateless,
+            _cowbull_token_secret,
+            _cowbull_token_max_age,
+            _cowbull_token_counters,
+            _cowbull_codec,
+            _cowbull_pool_depth
         ]
 
 
+    def _check_workers(self):
+        #
+        # Refuse configurations which keep state in each process when there is more
+        # than one worker process, as the other workers would not see it.
+        #
+        _workers = self.app.config.get("WORKERS", None) or 1
+        if self.app.config.get("PERSISTER", None):
+            self.app.config["PERSISTER"].check_workers(workers=_workers)
+        if _workers > 1 \
+                and self.app.config.get("COWBULL_STATELESS", False) \
+                and self.app.config.get("COWBULL_TOKEN_COUNTERS", None) != "persister":
+            raise ValueError(
+                "COWBULL_STATELESS keeps the guess counters of games in each process, but "
+                "WORKERS is {}. Set COWBULL_TOKEN_COUNTERS to persister to share them, or "
+                "set WORKERS to 1.".format(_workers)
+            )
+
     # http://sonarqube:9000/project/issues?id=cowbull_server&issues=AWiRMKAZaAhZ-jY-ujHl&open=AWiRMKAZaAhZ-jY-ujHl
     def _set_config(
             self,
@@ -300,7 +402,7 @@ class Configurator(object):
 
         self.error_handler.log(
             method="_set_config",
-            message="Before casting: {}".format(value),
+            message="Before casting: {}".format(self._mask(name, value)),
             logger=logging.debug
         )
 
@@ -322,7 +424,7 @@ class Configurator(object):
 
         self.error_handler.log(
             method="_set_config",
-            message="After casting: {}".format(value),
+            message="After casting: {}".format(self._mask(name, value)),
             logger=logging.debug
         )
 
@@ -331,7 +433,7 @@ class Configurator(object):
                     errmsg or
                         "The configuration value for {}({}) is not in the list of choices: {}".format(
                         name,
-                        value,
+                        self._mask(name, value),
                         choices
                     )
                 )
@@ -341,12 +443,28 @@ class Configurator(object):
             message="In _set_config Set app.config[{}] = {}"
                 .format(
                     name,
-                    value
+                    self._mask(name, value)
                 ),
             logger=logging.debug
         )
         return value
 
+    @staticmethod
+    def _mask(name, value):
+        # Secrets are never written to the console or logs.
+        if value and name.endswith("_SECRET"):
+            return "********"
+        return value
+
+    @staticmethod
+    def _load_pool_depth(value):
+        if isinstance(value, (int, dict)):
+            return value
+        value = json.loads(str(value))
+        if not isinstance(value, (int, dict)):
+            raise ValueError("COWBULL_POOL_DEPTH must be a number or a JSON object of mode names to numbers.")
+        return value
+
     def _load_from_json(self, json_file_name):
         if not json_file_name:
             return None
@@ -0,0 +1,212 @@
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+import redis
+
+from unittest import SkipTest
+
+
+class RedisServers(object):
+    """
+    RedisServers - Runs local redis-server processes for the tests which need a real
+    Redis (e.g. to run the Lua scripts of PersistenceExtensions/Redis.py). Tests are
+    skipped (SkipTest is raised by start) if redis-server is not on the path.
+
+    With cluster set, the servers are started in cluster mode, the slots are shared
+    evenly between them and they are joined into one Redis Cluster.
+
+    """
+    SLOTS = 16384
+    BUS_OFFSET = 10000
+    START_TIMEOUT = 10  # Seconds to wait for the servers (or the cluster) to be ready
+
+    def __init__(self, count=1, cluster=False):
+        """
+        :param count: <optional> The number of servers to run.
+        :param cluster: <optional> Join the servers into a Redis Cluster.
+        """
+        self.count = count
+        self.cluster = cluster
+        self.ports = []
+        self._processes = []
+        self._directory = None
+
+    #
+    # 'public' methods
+    #
+    def start(self):
+        """
+        Start the servers.
+
+        :return: <list> of the ports the servers listen on.
+        """
+        _binary = shutil.which("redis-server")
+        if _binary is None:
+            raise SkipTest("redis-server is not installed")
+
+        self._directory = tempfile.mkdtemp(prefix="cowbull-redis-")
+        try:
+            for _ in range(self.count):
+                _port = self._free_port()
+                _arguments = [
+                    _binary,
+                    "--port", str(_port),
+                    "--bind", "127.0.0.1",
+                    "--dir", self._directory,
+                    "--save", "",
+                    "--appendonly", "no"
+                ]
+                if self.cluster:
+                    _arguments.extend([
+                        "--cluster-enabled", "yes",
+                        "--cluster-config-file", "nodes-{}.conf".format(_port)
+                    ])
+                self._processes.append(subprocess.Popen(
+                    _arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                ))
+                self.ports.append(_port)
+
+            for _port in self.ports:
+                self._wait(lambda: self.client(_port).ping())
+            if self.cluster:
+                self._join()
+        except Exception:
+            self.stop()
+            raise
+        return list(self.ports)
+
+    def stop(self):
+        """
+        Stop the servers and remove their files.
+        """
+        for _process in self._processes:
+            _process.terminate()
+        for _process in self._processes:
+            try:
+                _process.wait(timeout=self.START_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                _process.kill()
+        self._processes = []
+        self.ports = []
+        if self._directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def client(self, port):
+        """
+        A client connected directly to one server.
+
+        :param port: <required> The server's port.
+        :return: redis.StrictRedis
+        """
+        return redis.StrictRedis(host="127.0.0.1", port=port)
+
+    def node_id(self, port):
+        """
+        The cluster node id of a server.
+
+        :param port: <required> The server's port.
+        :return: <str>
+        """
+        _id = self.client(port).execute_command("CLUSTER", "MYID")
+        return _id.decode("utf-8") if isinstance(_id, bytes) else _id
+
+    def slot_of(self, key):
+        """
+        The cluster slot of a key.
+
+        :param key: <required> The key.
+        :return: <int>
+        """
+        return int(self.client(self.ports[0]).execute_command("CLUSTER", "KEYSLOT", key))
+
+    def owner_of(self, slot):
+        """
+        The port of the server which holds a cluster slot.
+
+        :param slot: <required> The slot.
+        :return: <int>
+        """
+        for _start, _end, _owner in self.client(self.ports[0]).execute_command("CLUSTER", "SLOTS"):
+            if _start <= slot <= _end:
+                return int(_owner[1])
+        return None
+
+    def migrate_slot(self, slot, source, target):
+        """
+        Begin migrating an (empty) cluster slot from the server source to the server
+        target: source then answers ASK for keys of the slot it does not hold.
+        """
+        self.client(target).execute_command("CLUSTER", "SETSLOT", slot, "IMPORTING", self.node_id(source))
+        self.client(source).execute_command("CLUSTER", "SETSLOT", slot, "MIGRATING", self.node_id(target))
+
+    def move_slot(self, slot, source, target):
+        """
+        Move an (empty) cluster slot from the server source to the server target:
+        every other server then answers MOVED for keys of the slot.
+        """
+        self.migrate_slot(slot, source, target)
+        self.assign_slot(slot, target)
+
+    def assign_slot(self, slot, target):
+        """
+        Finish a migration (see migrate_slot): the slot is held by the server target.
+        """
+        _target_id = self.node_id(target)
+        for _port in [target] + [_port for _port in self.ports if _port != target]:
+            self.client(_port).execute_command("CLUSTER", "SETSLOT", slot, "NODE", _target_id)
+
+    #
+    # 'private' methods
+    #
+    def _join(self):
+        _share = self.SLOTS // len(self.ports)
+        for _index, _port in enumerate(self.ports):
+            _last = self.SLOTS if _index == len(self.ports) - 1 else (_index + 1) * _share
+            self.client(_port).execute_command("CLUSTER", "ADDSLOTS", *range(_index * _share, _last))
+        for _port in self.ports[1:]:
+            self.client(_port).execute_command("CLUSTER", "MEET", "127.0.0.1", self.ports[0])
+
+        def _ready():
+            for _port in self.ports:
+                _info = self.client(_port).execute_command("CLUSTER", "INFO")
+                _info = _info.decode("utf-8") if isinstance(_info, bytes) else str(_info)
+                if "cluster_state:ok" not in _info or \
+                        "cluster_known_nodes:{}".format(len(self.ports)) not in _info:
+                    return False
+            return True
+        self._wait(_ready)
+
+    def _wait(self, ready):
+        _deadline = time.time() + self.START_TIMEOUT
+        while True:
+            try:
+                if ready():
+                    return
+            except redis.exceptions.ConnectionError:
+                pass
+            if time.time() > _deadline:
+                raise RuntimeError("The local Redis servers did not start in time")
+            time.sleep(0.05)
+
+    def _free_port(self):
+        # A cluster node also listens on its port + 10000 (the cluster bus).
+        while True:
+            _port = self._bind(0)
+            if not self.cluster or (_port + self.BUS_OFFSET < 65536 and self._bind(_port + self.BUS_OFFSET)):
+                return _port
+
+    @staticmethod
+    def _bind(port):
+        # Bind port (0 for any) and return the port bound, or None if it is in use.
+        _socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            _socket.bind(("127.0.0.1", port))
+            return _socket.getsockname()[1]
+        except socket.error:
+            return None
+        finally:
+            _socket.close()
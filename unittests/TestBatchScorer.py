@@ -0,0 +1,90 @@
+import random
+import numpy
+
+from unittest import TestCase
+from Game.BatchScorer import BatchScorer
+from Game.GameMode import GameMode
+from Game.GameModeRegistry import GameModeRegistry
+from Game.PackedWord import PackedWord
+from python_digits.DigitWord import DigitWord
+
+
+class TestBatchScorer(TestCase):
+    def setUp(self):
+        self.rng = random.Random(4321)
+        self.registry = GameModeRegistry.get()
+
+    def _expected(self, answer, guess, wordtype):
+        analysis = DigitWord(*answer.word, wordtype=wordtype).compare(
+            DigitWord(*guess.word, wordtype=wordtype)
+        )
+        bulls = sum(1 for a in analysis if a.match)
+        cows = sum(1 for a in analysis if a.in_word and not a.match)
+        return bulls, cows
+
+    def test_bs_for_mode_cached(self):
+        mode = self.registry.match("Normal")
+        self.assertIs(BatchScorer.for_mode(mode), BatchScorer.for_mode(mode))
+
+    def test_bs_bad_mode(self):
+        with self.assertRaises(TypeError):
+            BatchScorer(mode="Normal")
+
+    def test_bs_same_as_digitword(self):
+        for mode in self.registry.modes:
+            scorer = BatchScorer.for_mode(mode)
+            answers = [PackedWord.random(mode.digits, mode.digit_type, self.rng) for _ in range(300)]
+            guesses = [PackedWord.random(mode.digits, mode.digit_type, self.rng) for _ in range(300)]
+            bulls, cows = scorer.score(answers, guesses)
+            for idx, (answer, guess) in enumerate(zip(answers, guesses)):
+                self.assertEqual(
+                    (bulls[idx], cows[idx]),
+                    self._expected(answer, guess, mode.digit_type),
+                    "Mode {}: {} vs {}".format(mode.mode, answer, guess)
+                )
+
+    def test_bs_score_matrix(self):
+        mode = self.registry.match("Hex")
+        scorer = BatchScorer.for_mode(mode)
+        answers = [PackedWord.random(4, mode.digit_type, self.rng) for _ in range(20)]
+        guesses = [PackedWord.random(4, mode.digit_type, self.rng) for _ in range(30)]
+        bulls, cows = scorer.score_matrix(answers, guesses)
+        self.assertEqual(bulls.shape, (20, 30))
+        self.assertEqual((bulls[3, 7], cows[3, 7]), answers[3].score(guesses[7]))
+
+    def test_bs_broadcast_single_guess(self):
+        mode = self.registry.match("Hard")
+        scorer = BatchScorer.for_mode(mode)
+        answers = [PackedWord.random(6, mode.digit_type, self.rng) for _ in range(50)]
+        bulls, cows = scorer.score(answers, [[0, 1, 2, 3, 4, 5]])
+        self.assertEqual(len(bulls), 50)
+
+    def test_bs_index_roundtrip(self):
+        scorer = BatchScorer.for_mode(self.registry.match("Hex"))
+        words = numpy.array([[10, 1, 0, 15]], dtype=numpy.int8)
+        self.assertEqual(scorer.index(words)[0], PackedWord([10, 1, 0, 15]).packed)
+        self.assertTrue((scorer.words(scorer.index(words)) == words).all())
+
+    def test_bs_table_easy(self):
+        mode = self.registry.match("Easy")
+        scorer = BatchScorer.for_mode(mode)
+        self.assertEqual(scorer.table.shape, (1000, 1000))
+        answers = [PackedWord.random(3, mode.digit_type, self.rng) for _ in range(300)]
+        guesses = [PackedWord.random(3, mode.digit_type, self.rng) for _ in range(300)]
+        bulls, cows = scorer.lookup(answers, guesses)
+        for idx, (answer, guess) in enumerate(zip(answers, guesses)):
+            self.assertEqual((bulls[idx], cows[idx]), self._expected(answer, guess, mode.digit_type))
+
+    def test_bs_table_too_large(self):
+        with self.assertRaises(ValueError):
+            BatchScorer(mode=self.registry.match("Hex")).table
+
+    def test_bs_bad_lengths(self):
+        scorer = BatchScorer.for_mode(self.registry.match("Normal"))
+        with self.assertRaises(ValueError):
+            scorer.score([[1, 2, 3, 4]], [[1, 2, 3]])
+
+    def test_bs_bad_digits(self):
+        scorer = BatchScorer.for_mode(GameMode(mode="test", priority=5))
+        with self.assertRaises(ValueError):
+            scorer.score([["X", 2, 3, 4]], [[1, 2, 3, 4]])
@@ -0,0 +1,87 @@
+import json
+
+from unittest import TestCase
+from Game.GameCodec import GameCodec, BinaryCodec
+from Game.GameController import GameController
+from Game.GameMode import GameMode
+from Game.GameModeRegistry import GameModeRegistry
+from Persistence.PersistenceEngine import PersistenceEngine
+from python_cowbull_server import app
+from python_cowbull_server.Configurator import Configurator
+
+
+class TestGameCodec(TestCase):
+    def setUp(self):
+        self.registry = GameModeRegistry.get()
+
+    def tearDown(self):
+        app.config["COWBULL_CODEC"] = "json"
+
+    def test_codec_get(self):
+        self.assertEqual(GameCodec.get().NAME, "json")
+        self.assertEqual(GameCodec.get("binary-zlib").NAME, "binary-zlib")
+        with self.assertRaises(ValueError):
+            GameCodec.get("xml")
+
+    def test_codec_json_mode_reference(self):
+        g = GameController(mode="Hard")
+        saved = json.loads(g.save())
+        self.assertEqual(saved["mode"], {"mode": "Hard", "hash": g.game.mode.fingerprint})
+        self.assertIs(GameController(game_json=g.save()).game.mode, g.game.mode)
+
+    def test_codec_binary_roundtrip(self):
+        for codec in ("binary", "binary-zlib"):
+            for mode in self.registry.names:
+                g = GameController(mode=mode, codec=codec)
+                g.guess(*g.game.answer.word[::-1])
+                payload = g.save()
+                self.assertTrue(payload.startswith("cb1:"))
+                g2 = GameController(game_json=payload)
+                self.assertEqual(g.game.dump(), g2.game.dump())
+                self.assertIs(g2.game.mode, self.registry.match(mode))
+
+    def test_codec_binary_smaller(self):
+        g = GameController(codec="binary")
+        self.assertLess(len(g.save()), len(GameCodec.get("json").encode(g.game, self.registry)))
+        self.assertLess(len(g.save()), len(json.dumps(g.game.dump())) / 5)
+
+    def test_codec_binary_embedded_mode(self):
+        mode = GameMode(mode="Custom", priority=99, digits=5, guesses_allowed=7)
+        g = GameController(mode=mode, codec="binary")
+        g2 = GameController(game_json=g.save())
+        self.assertEqual(g2.game.mode.dump(), mode.dump())
+        self.assertEqual(g2.game.answer, g.game.answer)
+
+    def test_codec_binary_text_key_status(self):
+        game = GameController().game.dump()
+        game["key"] = "not-a-uuid"
+        game["status"] = "paused"
+        g = GameController(game_json=game, codec="binary")
+        g2 = GameController(game_json=g.save())
+        self.assertEqual(g2.game.key, "not-a-uuid")
+        self.assertEqual(g2.game.status, "paused")
+
+    def test_codec_legacy_json(self):
+        g = GameController()
+        g2 = GameController(game_json=json.dumps(g.game.dump()), codec="binary")
+        self.assertEqual(g.game.dump(), g2.game.dump())
+
+    def test_codec_bad_version(self):
+        with self.assertRaises(ValueError):
+            BinaryCodec.decode_payload("cb9:AAAA", self.registry)
+
+    def test_codec_server_binary(self):
+        app.testing = True
+        Configurator().execute_load(app)
+        app.config["PERSISTER"] = PersistenceEngine(engine_name="file", parameters={})
+        app.config["COWBULL_CODEC"] = "binary-zlib"
+        with app.test_client() as c:
+            key = json.loads(c.get('/v1/game?mode=Hex').data)["key"]
+            self.assertTrue(app.config["PERSISTER"].persister.load(key=key).startswith("cb1:"))
+            response = c.post(
+                '/v1/game',
+                data=json.dumps({"key": key, "digits": ["a", "b", "c", "d"]}),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status, '200 OK')
+            self.assertEqual(json.loads(response.data)["game"]["guesses_made"], 1)
@@ -100,8 +100,17 @@ class TestGameController(TestCase):
     def test_gc_load_game(self):
         g = GameController()
         with self.assertRaises(TypeError):
+            g._load_game(123)
+        with self.assertRaises(ValueError):
             g._load_game({"gameid":123})
 
+    def test_gc_load_decoded(self):
+        g = GameController()
+        g2 = GameController(game_json=g.game.dump())
+        self.assertEqual(g.save(), g2.save())
+        g3 = GameController(game_json=g.game)
+        self.assertIs(g3.game, g.game)
+
     def test_gc_new_game_json_normal(self):
         json_string = '{' \
                           '"answer": [9, 6, 9, 4], ' \
@@ -284,5 +293,11 @@ class TestGameController(TestCase):
         r = g.guess(*ans)
         self.assertEqual(r["bulls"], None)
 
+    def test_gc_changes(self):
+        g = GameController()
+        g.guess(*g.game.answer.word)
+        self.assertEqual(g.changes(), {"guesses_made": g.game.mode.guesses_allowed, "status": "won"})
+        self.assertIsNone(GameController(codec="binary").changes())
+
     def tearDown(self):
         pass
\ No newline at end of file
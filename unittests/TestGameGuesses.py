@@ -0,0 +1,131 @@
+import json
+
+from unittest import TestCase
+from flask_controllers.GameGuesses import GameGuesses
+from python_cowbull_server import app
+from python_cowbull_server.Configurator import Configurator
+from Persistence.PersistenceEngine import PersistenceEngine
+
+
+class TestGameGuesses(TestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+
+        self.c = Configurator()
+        self.c.execute_load(self.app.application)
+
+        # Force use of File persister
+        p = {"engine_name": "file", "parameters": {}}
+        self.app.application.config["PERSISTER"] = PersistenceEngine(**p)
+
+    def _new_game(self, c):
+        response = c.get('/v1/game')
+        self.assertEqual(response.status[0:3], '200')
+        return json.loads(response.data)["key"]
+
+    def _post(self, c, data):
+        return c.post(
+            '/v1/games/guesses',
+            data=json.dumps(data),
+            content_type="application/json"
+        )
+
+    def test_gg_init(self):
+        GameGuesses()
+
+    def test_gg_bad_init(self):
+        self.app.application.config["PERSISTER"] = None
+        with self.assertRaises(ValueError):
+            GameGuesses()
+
+    def test_gg_post_guesses(self):
+        with self.app as c:
+            key1 = self._new_game(c)
+            key2 = self._new_game(c)
+            response = self._post(c, [
+                {"key": key1, "digits": [0, 1, 2, 3]},
+                {"key": key2, "digits": [4, 5, 6, 7]},
+                {"key": key1, "digits": [8, 9, 0, 1]}
+            ])
+            self.assertEqual(response.status[0:3], '200')
+            results = json.loads(response.data)["results"]
+            self.assertEqual([r["status"] for r in results], [200, 200, 200])
+            self.assertEqual(results[0]["game"]["guesses_made"], 1)
+            self.assertEqual(results[2]["game"]["guesses_made"], 2)
+            self.assertNotIn("answer", results[0]["game"])
+            self.assertIn("bulls", results[1]["outcome"])
+
+            response = self._post(c, {"guesses": [{"key": key1, "digits": [0, 1, 2, 3]}]})
+            results = json.loads(response.data)["results"]
+            self.assertEqual(results[0]["game"]["guesses_made"], 3)
+
+    def test_gg_post_entry_errors(self):
+        with self.app as c:
+            key = self._new_game(c)
+            response = self._post(c, [
+                {"key": key, "digits": [0, 1, 2, 3]},
+                {"key": "1234", "digits": [0, 1, 2, 3]},
+                {"key": key, "digits": ['X', 'Y', 2, 3]},
+                {"key": key},
+                {"digits": [0, 1, 2, 3]},
+                "foobar"
+            ])
+            self.assertEqual(response.status[0:3], '200')
+            results = json.loads(response.data)["results"]
+            self.assertEqual([r["status"] for r in results], [200, 400, 400, 400, 400, 400])
+            self.assertIn("valid game key", results[1]["message"])
+            self.assertIn("A digit must be", results[2]["exception"])
+
+    def test_gg_post_not_a_list(self):
+        with self.app as c:
+            response = self._post(c, {"key": "1234", "digits": [0, 1, 2, 3]})
+            self.assertEqual(response.status[0:3], '400')
+
+    def test_gg_post_too_many(self):
+        with self.app as c:
+            self.app.application.config["COWBULL_MAX_BATCH"] = 2
+            response = self._post(c, [{"key": "1", "digits": [0]}] * 3)
+            self.assertEqual(response.status[0:3], '400')
+            self.assertIn("at most 2", str(response.data))
+
+    def test_gg_post_version_conflict(self):
+        with self.app as c:
+            key1 = self._new_game(c)
+            key2 = self._new_game(c)
+            persister = self.app.application.config["PERSISTER"].persister
+            load_many_versioned = persister.load_many_versioned
+
+            def load_then_change(keys=None):
+                # Another request guesses against key1 after it was loaded.
+                loaded = load_many_versioned(keys=keys)
+                persister.save(key=key1, jsonstr=loaded[key1][0])
+                return loaded
+
+            persister.load_many_versioned = load_then_change
+            try:
+                response = self._post(c, [
+                    {"key": key1, "digits": [0, 1, 2, 3]},
+                    {"key": key2, "digits": [4, 5, 6, 7]},
+                    {"key": key1, "digits": [8, 9, 0, 1]}
+                ])
+            finally:
+                del persister.load_many_versioned
+            results = json.loads(response.data)["results"]
+            self.assertEqual([r["status"] for r in results], [409, 200, 409])
+            self.assertEqual(json.loads(persister.load(key=key1))["guesses_made"], 0)
+            self.assertEqual(json.loads(persister.load(key=key2))["guesses_made"], 1)
+
+    def test_gg_post_game_over_not_saved(self):
+        with self.app as c:
+            key = self._new_game(c)
+            persister = self.app.application.config["PERSISTER"].persister
+            game = json.loads(persister.load(key=key))
+            game["status"] = "lost"
+            persister.save(key=key, jsonstr=json.dumps(game))
+            version = persister.load_versioned(key=key)[1]
+            response = self._post(c, [{"key": key, "digits": [0, 1, 2, 3]}])
+            results = json.loads(response.data)["results"]
+            self.assertEqual(results[0]["status"], 200)
+            self.assertIn("lost", results[0]["outcome"]["status"])
+            self.assertEqual(persister.load_versioned(key=key)[1], version)
@@ -78,3 +78,14 @@ class TestGameMode(TestCase):
         self.assertEqual(gm.help_text, "Help")
         gm.help_text = "This is some help"
         self.assertEqual(gm.help_text, "This is some help")
+
+    def test_gm_property_ttl(self):
+        gm = GameMode(mode="test", priority=3)
+        self.assertIsNone(gm.ttl)
+        self.assertNotIn("ttl", gm.dump())
+        gm = GameMode(mode="test", priority=3, ttl=600)
+        self.assertEqual(gm.dump()["ttl"], 600)
+        with self.assertRaises(TypeError):
+            GameMode(mode="test", priority=3, ttl="600")
+        with self.assertRaises(ValueError):
+            GameMode(mode="test", priority=3, ttl=-1)
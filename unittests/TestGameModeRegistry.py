@@ -0,0 +1,91 @@
+from unittest import TestCase
+from Game.GameMode import GameMode
+from Game.GameModeRegistry import GameModeRegistry
+from Game.GameController import GameController
+
+
+class TestGameModeRegistry(TestCase):
+    def setUp(self):
+        self.mode_list = [
+            GameMode(
+                mode="test1",
+                priority=5,
+            ),
+            GameMode(
+                mode="test2",
+                priority=50,
+            )
+        ]
+
+    def test_gmr_defaults(self):
+        r = GameModeRegistry.get()
+        self.assertEqual(r.names, ("Easy", "Normal", "Hard", "Hex"))
+        self.assertEqual(r.default_mode, "Normal")
+        self.assertEqual(r.find(0).mode, "Normal")
+
+    def test_gmr_cached(self):
+        self.assertIs(GameModeRegistry.get(), GameModeRegistry.get())
+        r = GameModeRegistry.get(input_modes=self.mode_list)
+        self.assertIs(r, GameModeRegistry.get(input_modes=self.mode_list))
+        self.assertIsNot(r, GameModeRegistry.get())
+
+    def test_gmr_custom_modes(self):
+        r = GameModeRegistry.get(input_modes=self.mode_list)
+        self.assertEqual(r.names[0], "test1")
+        self.assertEqual(r.names[-1], "test2")
+        self.assertIn("test2", r)
+        self.assertIs(r.match("test1"), self.mode_list[0])
+
+    def test_gmr_custom_dict_modes(self):
+        r = GameModeRegistry.get(input_modes=[{"mode": "test3", "priority": 1}])
+        self.assertIsInstance(r.match("test3"), GameMode)
+
+    def test_gmr_mutated_list(self):
+        r = GameModeRegistry.get(input_modes=self.mode_list)
+        self.mode_list.append(GameMode(mode="test3", priority=60))
+        r2 = GameModeRegistry.get(input_modes=self.mode_list)
+        self.assertIsNot(r, r2)
+        self.assertIn("test3", r2)
+
+    def test_gmr_duplicate_name(self):
+        r = GameModeRegistry.get(input_modes=[GameMode(mode="Normal", priority=1)])
+        self.assertEqual(r.match("Normal").priority, 20)
+
+    def test_gmr_bad_mode(self):
+        with self.assertRaises(ValueError):
+            GameModeRegistry.get().match("foobar")
+
+    def test_gmr_bad_list(self):
+        with self.assertRaises(TypeError):
+            GameModeRegistry.get(input_modes=GameMode(mode="test1", priority=5))
+
+    def test_gmr_shared_by_controllers(self):
+        g1 = GameController(mode="Hex")
+        g2 = GameController(mode="Hex")
+        self.assertIs(g1.game.mode, g2.game.mode)
+
+    def test_gmr_reference_builtin(self):
+        r = GameModeRegistry.get()
+        mode = r.match("Hex")
+        self.assertEqual(r.reference(mode), {"mode": "Hex", "hash": mode.fingerprint})
+        self.assertIs(r.resolve(r.reference(mode)), mode)
+
+    def test_gmr_reference_custom(self):
+        r = GameModeRegistry.get(input_modes=self.mode_list)
+        reference = r.reference(r.match("test1"))
+        self.assertEqual(reference["digits"], 4)
+        self.assertIs(r.resolve(reference), r.match("test1"))
+        removed = GameModeRegistry.get().resolve(reference)
+        self.assertEqual(removed.dump(), r.match("test1").dump())
+
+    def test_gmr_resolve_legacy(self):
+        r = GameModeRegistry.get()
+        self.assertIs(r.resolve(r.match("Easy").dump()), r.match("Easy"))
+
+    def test_gmr_resolve_changed(self):
+        r = GameModeRegistry.get()
+        self.assertIs(r.resolve({"mode": "Normal", "hash": "0"}), r.match("Normal"))
+
+    def test_gmr_resolve_unknown(self):
+        with self.assertRaises(ValueError):
+            GameModeRegistry.get().resolve({"mode": "foobar", "hash": "0"})
@@ -2,7 +2,7 @@ from unittest import TestCase
 from Game.GameObject import GameObject
 from Game.GameMode import GameMode
 from Game.GameController import GameController
-from python_digits.DigitWord import DigitWord
+from Game.PackedWord import PackedWord
 
 
 class TestGameObject(TestCase):
@@ -47,7 +47,7 @@ class TestGameObject(TestCase):
 
     def test_go_answer(self):
         go = GameObject(mode=GameMode(mode="test", priority=5))
-        self.assertIsInstance(go.answer, DigitWord)
+        self.assertIsInstance(go.answer, PackedWord)
         self.assertIsInstance(go.answer.word, list)
 
     def test_go_guesses_made(self):
@@ -106,5 +106,9 @@ class TestGameObject(TestCase):
         go.new(mode=GameMode(mode="Normal", priority=5))
         self.assertNotEqual(go.key, key)
 
+    def test_go_mode_ttl(self):
+        self.assertEqual(GameObject(mode=GameMode(mode="Normal", priority=5)).ttl, GameObject.TTL)
+        self.assertEqual(GameObject(mode=GameMode(mode="Quick", priority=5, ttl=600)).ttl, 600)
+
     def tearDown(self):
         pass
@@ -0,0 +1,97 @@
+import json
+
+from unittest import TestCase
+from Game.GamePool import GamePool
+from Game.GameMode import GameMode
+from Game.GameObject import GameObject
+from Persistence.PersistenceEngine import PersistenceEngine
+from python_cowbull_server import app
+from python_cowbull_server.Configurator import Configurator
+
+
+class TestGamePool(TestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+
+        self.c = Configurator()
+        self.c.execute_load(self.app.application)
+
+        p = {"engine_name": "file", "parameters": {}}
+        self.app.application.config["PERSISTER"] = PersistenceEngine(**p)
+
+    def tearDown(self):
+        self.app.application.config["COWBULL_POOL_DEPTH"] = 0
+
+    def test_gp_bad_depth(self):
+        with self.assertRaises(TypeError):
+            GamePool(depth="10")
+        with self.assertRaises(ValueError):
+            GamePool(depth={"foobar": 10})
+        with self.assertRaises(ValueError):
+            GamePool(depth={"Normal": -1})
+
+    def test_gp_fill_take(self):
+        pool = GamePool(depth={"Hex": 20, "Easy": 0})
+        self.assertEqual(pool.modes, ["Hex"])
+        self.assertEqual(pool.fill(), 20)
+        games = pool.take_many(mode="Hex", count=5)
+        self.assertEqual(len(games), 5)
+        self.assertEqual(len(set(game.key for game in games)), 5)
+        for game in games:
+            self.assertIsInstance(game, GameObject)
+            self.assertEqual(game.mode.mode, "Hex")
+            self.assertEqual(game.status, "playing")
+            self.assertEqual(len(game.answer), 4)
+
+    def test_gp_mode_ttl(self):
+        pool = GamePool(depth={"Quick": 2}, input_modes=[GameMode(mode="Quick", priority=5, ttl=600)])
+        pool.fill()
+        self.assertEqual(pool.take(mode="Quick").ttl, 600)
+        pool = GamePool(depth={"Normal": 2})
+        pool.fill()
+        self.assertEqual(pool.take(mode="Normal").ttl, GameObject.TTL)
+
+    def test_gp_not_pooled(self):
+        pool = GamePool(depth={"Hex": 5})
+        self.assertIsNone(pool.take(mode="Easy"))
+        self.assertIsNone(pool.take(mode="foobar"))
+
+    def test_gp_drained(self):
+        pool = GamePool(depth={"Normal": 3})
+        pool.IDLE_WAIT = 60
+        pool.fill()
+        pool._ensure_running()
+        games = pool.take_many(count=5)
+        self.assertLessEqual(len(games), 5)
+        stats = pool.stats()["Normal"]
+        self.assertEqual(stats["depth"], 3)
+        self.assertEqual(stats["taken"] + stats["misses"], 5)
+        self.assertGreaterEqual(stats["generated"], 3)
+
+    def test_gp_random_digits(self):
+        digits = GamePool._random_digits(10, 10000)
+        self.assertEqual(len(digits), 10000)
+        self.assertEqual(set(digits), set(range(10)))
+
+    def test_gp_from_config(self):
+        self.assertIsNone(GamePool.from_config({"COWBULL_POOL_DEPTH": 0}))
+        config = {"COWBULL_POOL_DEPTH": {"Hard": 2}, "COWBULL_CUSTOM_MODES": None}
+        self.assertIs(GamePool.from_config(config), GamePool.from_config(config))
+
+    def test_gp_get_game(self):
+        self.app.application.config["COWBULL_POOL_DEPTH"] = {"Easy": 10}
+        GamePool.from_config(self.app.application.config).fill()
+        with self.app as c:
+            response = c.get('/v1/game?mode=Easy')
+            self.assertEqual(response.status, '200 OK')
+            key = json.loads(response.data)["key"]
+            response = c.post(
+                '/v1/game',
+                data=json.dumps({"key": key, "digits": [0, 1, 2]}),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status, '200 OK')
+
+            response = c.get('/v1/games?mode=Easy&count=30')
+            self.assertEqual(len(set(json.loads(response.data)["keys"])), 30)
@@ -115,6 +115,26 @@ class TestGameServerController(TestCase):
             )
             self.assertEqual(response.status[0:3], '200')
 
+    def test_gsc_post_version_conflict(self):
+        persister = self.app.application.config["PERSISTER"].persister
+        with self.app as c:
+            response = c.get('/v1/game')
+            key = json.loads(response.data)["key"]
+            # The game is changed by another request after this one loads it.
+            load_versioned = persister.load_versioned
+            persister.load_versioned = lambda key=None: (load_versioned(key=key)[0], 0)
+            try:
+                response = c.post(
+                    '/v1/game',
+                    data=json.dumps({"key": key, "digits": [0, 1, 2, 3]}),
+                    content_type="application/json"
+                )
+            finally:
+                del persister.load_versioned
+            self.assertEqual(response.status[0:3], '409')
+            self.assertEqual(response.headers["Retry-After"], "0")
+            self.assertEqual(persister.load_versioned(key=key)[1], 1)
+
     def test_gsc_post_bad_key(self):
         with self.app as c:
             key = '1234'
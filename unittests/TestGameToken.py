@@ -0,0 +1,210 @@
+import json
+import logging
+import time
+
+from unittest import TestCase
+from Game.GameObject import GameObject
+from Game.GameModeRegistry import GameModeRegistry
+from Game.GameToken import GameToken
+from Persistence.PersistenceEngine import PersistenceEngine
+from python_cowbull_server import app
+from python_cowbull_server.Configurator import Configurator
+
+
+class TestGameToken(TestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+
+        self.c = Configurator()
+        self.c.execute_load(self.app.application)
+
+        self.tokens = GameToken(secret="test-secret", max_age=60)
+        self.game = GameObject(mode=GameModeRegistry.get().match("Hex"))
+
+    def tearDown(self):
+        self.app.application.config["COWBULL_STATELESS"] = False
+        self.app.application.config["COWBULL_TOKEN_SECRET"] = None
+
+    def _stateless(self):
+        self.app.application.config["COWBULL_STATELESS"] = True
+        self.app.application.config["COWBULL_TOKEN_SECRET"] = "test-secret"
+        self.app.application.config["PERSISTER"] = None
+
+    def test_gt_no_secret(self):
+        with self.assertRaises(ValueError):
+            GameToken(secret=None)
+
+    def test_gt_from_config(self):
+        self.assertIsNone(GameToken.from_config({"COWBULL_STATELESS": False}))
+        with self.assertRaises(ValueError):
+            GameToken.from_config({"COWBULL_STATELESS": True})
+
+    def test_gt_secret_not_logged(self):
+        logging.disable(logging.NOTSET)
+        try:
+            with self.assertLogs(level="DEBUG") as logs:
+                self.c._set_config(
+                    source={"COWBULL_TOKEN_SECRET": "do-not-log-me"}.get,
+                    name="COWBULL_TOKEN_SECRET",
+                    caster=str
+                )
+        finally:
+            logging.disable(logging.CRITICAL)
+        self.assertEqual(self.app.application.config["COWBULL_TOKEN_SECRET"], "do-not-log-me")
+        self.assertFalse([_line for _line in logs.output if "do-not-log-me" in _line])
+
+    def test_gt_roundtrip(self):
+        token = self.tokens.dumps(self.game)
+        game, created = self.tokens.loads(token)
+        self.assertEqual(game["key"], self.game.key)
+        self.assertEqual(game["answer"], self.game.answer.word)
+        self.assertEqual(game["mode"]["mode"], "Hex")
+        self.assertNotIn(self.game.key, token)
+
+    def test_gt_tampered(self):
+        token = self.tokens.dumps(self.game)
+        with self.assertRaises(KeyError):
+            self.tokens.loads(token[:10] + ("A" if token[10] != "A" else "B") + token[11:])
+        with self.assertRaises(KeyError):
+            GameToken(secret="other-secret").loads(token)
+
+    def test_gt_game_expired(self):
+        token = self.tokens.dumps(self.game, created=time.time() - self.game.ttl - 1)
+        with self.assertRaises(KeyError):
+            self.tokens.loads(token)
+
+    def test_gt_stale_token(self):
+        token = self.tokens.dumps(self.game)
+        self.game.guesses_made += 1
+        later = self.tokens.dumps(self.game)
+        with self.assertRaises(KeyError):
+            self.tokens.loads(token)
+        # Counters are shared by every GameToken of the process.
+        with self.assertRaises(KeyError):
+            GameToken(secret="test-secret", max_age=60).loads(token)
+        self.assertEqual(self.tokens.loads(later)[0]["guesses_made"], 1)
+
+        # An earlier token issued after a later one does not lower the counter.
+        self.game.guesses_made -= 1
+        self.tokens.dumps(self.game)
+        with self.assertRaises(KeyError):
+            self.tokens.loads(token)
+
+    def test_gt_stale_token_persisted_counters(self):
+        config = {
+            "COWBULL_STATELESS": True,
+            "COWBULL_TOKEN_SECRET": "test-secret",
+            "COWBULL_TOKEN_COUNTERS": "persister",
+            "PERSISTER": PersistenceEngine(engine_name="file", parameters={})
+        }
+        tokens = GameToken.from_config(config)
+        token = tokens.dumps(self.game)
+        self.game.guesses_made += 1
+        tokens.dumps(self.game)
+        # A worker holding no counters in memory.
+        GameToken._counters.clear()
+        with self.assertRaises(KeyError):
+            GameToken.from_config(config).loads(token)
+
+        del config["PERSISTER"]
+        with self.assertRaises(ValueError):
+            GameToken.from_config(config)
+
+    def test_gt_token_replaced_once(self):
+        token = self.tokens.dumps(self.game)
+        game, created = self.tokens.loads(token)
+        self.game.guesses_made += 1
+        self.tokens.dumps(self.game, created=created, previous=game["guesses_made"])
+        # The same token, loaded by a concurrent request before the first was issued.
+        with self.assertRaises(KeyError):
+            self.tokens.dumps(self.game, created=created, previous=game["guesses_made"])
+
+    def test_gt_token_replaced_once_persisted_counters(self):
+        config = {
+            "COWBULL_STATELESS": True,
+            "COWBULL_TOKEN_SECRET": "test-secret",
+            "COWBULL_TOKEN_COUNTERS": "persister",
+            "PERSISTER": PersistenceEngine(engine_name="file", parameters={})
+        }
+        tokens = GameToken.from_config(config)
+        persister = config["PERSISTER"].persister
+        tokens.dumps(self.game)
+        # A new game needs no counter.
+        with self.assertRaises(KeyError):
+            persister.load(key=GameToken.COUNTER_PREFIX + self.game.key)
+
+        self.game.guesses_made += 1
+        tokens.dumps(self.game, previous=0)
+        with self.assertRaises(KeyError):
+            GameToken.from_config(config).dumps(self.game, previous=0)
+        self.game.guesses_made += 1
+        tokens.dumps(self.game, previous=1)
+
+    def test_gt_stateless_workers(self):
+        self._stateless()
+        config = self.app.application.config
+        try:
+            config["WORKERS"] = 4
+            with self.assertRaises(ValueError):
+                self.c._check_workers()
+            config["COWBULL_TOKEN_COUNTERS"] = "persister"
+            self.c._check_workers()
+        finally:
+            config["WORKERS"] = 1
+            config["COWBULL_TOKEN_COUNTERS"] = "memory"
+
+    def test_gt_stateless_game(self):
+        self._stateless()
+        with self.app as c:
+            response = c.get('/v1/game?mode=Easy')
+            self.assertEqual(response.status, '200 OK')
+            key = json.loads(response.data)["key"]
+
+            response = c.post(
+                '/v1/game',
+                data=json.dumps({"key": key, "digits": [0, 1, 2]}),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status, '200 OK')
+            game = json.loads(response.data)["game"]
+            self.assertNotEqual(game["key"], key)
+            self.assertEqual(game["guesses_made"], 1)
+
+            response = c.post(
+                '/v1/game',
+                data=json.dumps({"key": game["key"], "digits": [0, 1, 2]}),
+                content_type="application/json"
+            )
+            self.assertEqual(json.loads(response.data)["game"]["guesses_made"], 2)
+
+            response = c.post(
+                '/v1/game',
+                data=json.dumps({"key": key, "digits": [0, 1, 2]}),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status, '400 BAD REQUEST')
+
+    def test_gt_stateless_bad_key(self):
+        self._stateless()
+        with self.app as c:
+            response = c.post(
+                '/v1/game',
+                data=json.dumps({"key": "not-a-token", "digits": [0, 1, 2, 3]}),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status, '400 BAD REQUEST')
+
+    def test_gt_stateless_batch(self):
+        self._stateless()
+        with self.app as c:
+            response = c.get('/v1/games?mode=Normal&count=3')
+            keys = json.loads(response.data)["keys"]
+            response = c.post(
+                '/v1/games/guesses',
+                data=json.dumps([{"key": key, "digits": [0, 1, 2, 3]} for key in keys]),
+                content_type="application/json"
+            )
+            results = json.loads(response.data)["results"]
+            self.assertEqual([r["status"] for r in results], [200, 200, 200])
+            self.assertNotEqual(results[0]["game"]["key"], keys[0])
@@ -0,0 +1,63 @@
+import json
+
+from unittest import TestCase
+from flask_controllers.Games import Games
+from python_cowbull_server import app
+from python_cowbull_server.Configurator import Configurator
+from Persistence.PersistenceEngine import PersistenceEngine
+
+
+class TestGames(TestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+
+        self.c = Configurator()
+        self.c.execute_load(self.app.application)
+
+        # Force use of File persister
+        p = {"engine_name": "file", "parameters": {}}
+        self.app.application.config["PERSISTER"] = PersistenceEngine(**p)
+
+    def test_gs_init(self):
+        Games()
+
+    def test_gs_bad_init(self):
+        self.app.application.config["PERSISTER"] = None
+        with self.assertRaises(ValueError):
+            Games()
+
+    def test_gs_get_games(self):
+        with self.app as c:
+            response = c.get('/v1/games?mode=Hex&count=5')
+            self.assertEqual(response.status, '200 OK')
+            data = json.loads(response.data)
+            self.assertEqual(data["mode"], "Hex")
+            self.assertEqual(len(set(data["keys"])), 5)
+
+            game_data = {"key": data["keys"][3], "digits": ["a", "b", "c", "d"]}
+            response = c.post(
+                '/v1/game',
+                data=json.dumps(game_data),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status[0:3], '200')
+
+    def test_gs_get_games_default(self):
+        with self.app as c:
+            response = c.get('/v1/games')
+            data = json.loads(response.data)
+            self.assertEqual(data["mode"], "Normal")
+            self.assertEqual(len(data["keys"]), 1)
+
+    def test_gs_get_games_bad_count(self):
+        with self.app as c:
+            for count in ("0", "foo", "1000000"):
+                response = c.get('/v1/games?count={}'.format(count))
+                self.assertEqual(response.status, '400 BAD REQUEST')
+
+    def test_gs_get_games_bad_mode(self):
+        with self.app as c:
+            response = c.get('/v1/games?mode=reallyreallytough&count=2')
+            self.assertEqual(response.status, '400 BAD REQUEST')
+            self.assertIn("Mode reallyreallytough not found", str(response.data))
@@ -0,0 +1,69 @@
+import copy
+import random
+
+from unittest import TestCase
+from Game.PackedWord import PackedWord
+from python_digits.DigitWord import DigitWord
+
+
+class TestPackedWord(TestCase):
+    def setUp(self):
+        self.rng = random.Random(1234)
+
+    def test_pw_parse_digits(self):
+        pw = PackedWord.parse([1, "2", 3, "4"])
+        self.assertEqual(pw.word, [1, 2, 3, 4])
+        self.assertEqual(pw.packed, 0x4321)
+        self.assertEqual(len(pw), 4)
+
+    def test_pw_parse_hex(self):
+        pw = PackedWord.parse(["a", "B", "0xc", 15], wordtype=PackedWord.HEXDIGIT)
+        self.assertEqual(pw.word, ["a", "b", "c", "f"])
+        self.assertEqual(pw.digits, (10, 11, 12, 15))
+
+    def test_pw_from_packed(self):
+        pw = PackedWord.parse([9, 6, 9, 4])
+        self.assertEqual(PackedWord.from_packed(pw.packed, 4), pw)
+
+    def test_pw_parse_bad_digits(self):
+        for bad in (["X", 1, 2, 3], [-10, 21, 32, 43], [10, 1, 2, 3], ["0x1", 1, 2, 3]):
+            with self.assertRaises(ValueError) as cm:
+                PackedWord.parse(bad)
+            self.assertIn("A digit must be a string representation or integer", str(cm.exception))
+
+    def test_pw_parse_bad_hex(self):
+        for bad in (["g", 1, 2, 3], ["ff", 1, 2, 3], [16, 1, 2, 3], ["0x1f", 1, 2, 3]):
+            with self.assertRaises(ValueError):
+                PackedWord.parse(bad, wordtype=PackedWord.HEXDIGIT)
+
+    def test_pw_parse_bad_type(self):
+        with self.assertRaises(ValueError):
+            PackedWord.parse([1.5, 1, 2, 3])
+        with self.assertRaises(TypeError):
+            PackedWord.parse("1234")
+
+    def test_pw_immutable(self):
+        pw = PackedWord.parse([1, 2, 3, 4])
+        with self.assertRaises(AttributeError):
+            pw.foo = 1
+        self.assertEqual(copy.deepcopy(pw), pw)
+
+    def test_pw_compare_lengths(self):
+        with self.assertRaises(ValueError) as cm:
+            PackedWord.parse([1, 2, 3, 4]).compare(PackedWord.parse([1, 2, 3]))
+        self.assertIn("The DigitWord objects are of different lengths", str(cm.exception))
+
+    def test_pw_same_as_digitword(self):
+        for wordtype, length in ((DigitWord.DIGIT, 3), (DigitWord.DIGIT, 4),
+                                 (DigitWord.DIGIT, 6), (DigitWord.HEXDIGIT, 4)):
+            for _ in range(200):
+                answer = PackedWord.random(length, wordtype=wordtype, rng=self.rng)
+                guess = PackedWord.random(length, wordtype=wordtype, rng=self.rng)
+                expected = DigitWord(*answer.word, wordtype=wordtype).compare(
+                    DigitWord(*guess.word, wordtype=wordtype)
+                )
+                expected = [analysis.get_object() for analysis in expected]
+                self.assertEqual(answer.compare(guess), expected)
+                bulls = sum(1 for analysis in expected if analysis["match"])
+                cows = sum(1 for analysis in expected if analysis["in_word"] and not analysis["match"])
+                self.assertEqual(answer.score(guess), (bulls, cows))
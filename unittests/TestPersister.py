@@ -1,9 +1,11 @@
 import json
+import os
 import pymongo
 from pymongo.errors import ServerSelectionTimeoutError
 
 from unittest import TestCase
 from Persistence.PersistenceEngine import PersistenceEngine
+from Persistence.VersionConflict import VersionConflict
 
 class TestPersister(TestCase):
     def test_rp_bad_engine(self):
@@ -42,3 +44,454 @@ class TestPersister(TestCase):
                 }
             )
 
+
+    def test_rp_file_many(self):
+        p = PersistenceEngine(engine_name="file", parameters={}).persister
+        p.save_many(items={"test-many-1": '{"foo": 1}', "test-many-2": '{"foo": 2}'})
+        loaded = p.load_many(keys=["test-many-1", "test-many-2", "test-many-missing"])
+        self.assertEqual(loaded["test-many-2"], '{"foo": 2}')
+        self.assertIsNone(loaded["test-many-missing"])
+
+    def test_rp_file_delete_many(self):
+        p = PersistenceEngine(engine_name="file", parameters={}).persister
+        p.save_many(items={"test-delete-1": '{"foo": 1}', "test-delete-2": '{"foo": 2}'})
+        p.delete_many(keys=["test-delete-1", "test-delete-2", "test-delete-missing"])
+        loaded = p.load_many(keys=["test-delete-1", "test-delete-2"])
+        self.assertEqual(loaded, {"test-delete-1": None, "test-delete-2": None})
+        with self.assertRaises(KeyError):
+            p.load(key="test-delete-1")
+
+    def test_rp_file_update(self):
+        p = PersistenceEngine(engine_name="file", parameters={}).persister
+        p.update(key="test-update-1", fields={"foo": 2}, jsonstr='{"foo": 2}')
+        self.assertEqual(p.load(key="test-update-1"), '{"foo": 2}')
+        with self.assertRaises(TypeError):
+            p.update(key="test-update-1", fields=None, jsonstr='{"foo": 2}')
+
+    def test_rp_file_versions(self):
+        p = PersistenceEngine(engine_name="file", parameters={}).persister
+        p.delete(key="test-version-1")
+        p.save(key="test-version-1", jsonstr='{"foo": 1}')
+        self.assertEqual(p.load_versioned(key="test-version-1"), ('{"foo": 1}', 1))
+        p.save(key="test-version-1", jsonstr='{"foo": 2}', expected_version=1)
+        with self.assertRaises(VersionConflict):
+            p.save(key="test-version-1", jsonstr='{"foo": 3}', expected_version=1)
+        self.assertEqual(p.load_versioned(key="test-version-1"), ('{"foo": 2}', 2))
+        self.assertEqual(
+            p.load_many_versioned(keys=["test-version-1", "test-version-missing"]),
+            {"test-version-1": ('{"foo": 2}', 2), "test-version-missing": (None, None)}
+        )
+
+    def test_rp_group_commit(self):
+        from concurrent.futures import ThreadPoolExecutor
+        engine = PersistenceEngine(engine_name="file", parameters={}, group_commit_ms=20)
+        p = engine.persister
+        p.delete_many(keys=["test-group-{}".format(n) for n in range(8)])
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(
+                lambda n: p.save(key="test-group-{}".format(n), jsonstr='{{"foo": {}}}'.format(n)),
+                range(8)
+            ))
+        self.assertEqual(p.load(key="test-group-7"), '{"foo": 7}')
+        stats = p.stats()["group_commit"]
+        self.assertEqual(stats["writes"], 8)
+        self.assertLess(stats["batches"], 8)
+
+        results = p.write_many(writes=[
+            {"key": "test-group-0", "jsonstr": '{"foo": 10}', "expected_version": 1},
+            {"key": "test-group-1", "jsonstr": '{"foo": 11}', "expected_version": 5}
+        ])
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], VersionConflict)
+        with self.assertRaises(VersionConflict):
+            p.update(key="test-group-0", fields={"foo": 12}, jsonstr='{"foo": 12}', expected_version=1)
+
+    def test_rp_write_behind(self):
+        import os
+        import tempfile
+        spool_dir = tempfile.mkdtemp()
+        p = PersistenceEngine(
+            engine_name="file", parameters={}, write_behind={"spool_dir": spool_dir, "interval_ms": 60000}
+        ).persister
+        backend = p.persister
+        backend.delete_many(keys=["test-behind-1", "test-behind-2"])
+        p.save(key="test-behind-1", jsonstr='{"foo": 1}')
+        p.update(key="test-behind-2", fields={"foo": 2}, jsonstr='{"foo": 2}')
+        self.assertEqual(p.load_versioned(key="test-behind-1"), ('{"foo": 1}', None))
+        self.assertEqual(p.load_many(keys=["test-behind-2"]), {"test-behind-2": '{"foo": 2}'})
+        self.assertFalse(p.atomic_guesses)
+        with self.assertRaises(KeyError):
+            backend.load(key="test-behind-1")
+        self.assertEqual(p.stats()["write_behind"]["queued"], 2)
+
+        # A new persister replays the spool of one which did not close.
+        os.rename(
+            os.path.join(spool_dir, "{}{}.spool".format(p.SPOOL_PREFIX, os.getpid())),
+            os.path.join(spool_dir, "{}999999999.spool".format(p.SPOOL_PREFIX))
+        )
+        p._spool = None
+        replayed = PersistenceEngine(
+            engine_name="file", parameters={}, write_behind={"spool_dir": spool_dir}
+        ).persister
+        self.assertEqual(replayed.stats()["write_behind"]["replayed"], 2)
+        replayed.delete(key="test-behind-2")
+        replayed.close()
+        self.assertEqual(backend.load(key="test-behind-1"), '{"foo": 1}')
+        with self.assertRaises(KeyError):
+            backend.load(key="test-behind-2")
+        self.assertEqual(os.listdir(spool_dir), ["{}{}.spool".format(p.SPOOL_PREFIX, os.getpid())])
+        p.close()
+
+    def test_rp_write_behind_replay_order(self):
+        import json
+        import os
+        import tempfile
+        spool_dir = tempfile.mkdtemp()
+        # The later write to a key is replayed, whatever the order of the spools.
+        for pid, writes in (
+            (999999998, [("test-order-1", '{"foo": 2}', 200), ("test-order-2", '{"foo": 1}', 100)]),
+            (999999999, [("test-order-1", '{"foo": 1}', 100), ("test-order-2", '{"foo": 2}', 200)])
+        ):
+            with open(os.path.join(spool_dir, "cowbull-write-behind-{}.spool".format(pid)), "w") as spool:
+                for key, jsonstr, at in writes:
+                    spool.write(json.dumps({"key": key, "jsonstr": jsonstr, "ttl": None, "at": at}) + "\n")
+        p = PersistenceEngine(engine_name="file", parameters={}, write_behind={"spool_dir": spool_dir}).persister
+        self.assertEqual(
+            p.load_many(keys=["test-order-1", "test-order-2"]),
+            {"test-order-1": '{"foo": 2}', "test-order-2": '{"foo": 2}'}
+        )
+        p.close()
+        self.assertEqual(p.persister.load(key="test-order-1"), '{"foo": 2}')
+
+    def test_rp_write_behind_one_worker(self):
+        import tempfile
+        engine = PersistenceEngine(
+            engine_name="file", parameters={}, write_behind={"spool_dir": tempfile.mkdtemp()}
+        )
+        engine.check_workers(workers=1)
+        with self.assertRaises(ValueError):
+            engine.check_workers(workers=4)
+        engine.persister.close()
+        PersistenceEngine(engine_name="file", parameters={}).check_workers(workers=4)
+
+    def test_rp_file_expiry(self):
+        import time
+        from Persistence.ExpirySweeper import ExpirySweeper
+        engine = PersistenceEngine(engine_name="file", parameters={}, sweep_interval=3600)
+        self.assertIsInstance(engine.sweeper, ExpirySweeper)
+        p = engine.persister
+        p.save(key="test-expiry-1", jsonstr='{"foo": 1}', ttl=1)
+        p.save_many(items={"test-expiry-2": '{"foo": 2}'}, ttl={"test-expiry-2": 3600})
+        self.assertEqual(p.load(key="test-expiry-1"), '{"foo": 1}')
+        time.sleep(1.1)
+        with self.assertRaises(KeyError):
+            p.load(key="test-expiry-1")
+        self.assertEqual(p.load_many(keys=["test-expiry-1", "test-expiry-2"])["test-expiry-1"], None)
+        self.assertGreaterEqual(engine.sweeper.sweep(), 1)
+        self.assertFalse(os.path.exists(p._filename("test-expiry-1")))
+        self.assertEqual(p.load(key="test-expiry-2"), '{"foo": 2}')
+
+        # As in a forked worker: the sweeper is started again when the persister is used.
+        import threading
+        engine.sweeper._pid = None
+        sweepers = len([t for t in threading.enumerate() if t.name == "expiry-sweeper"])
+        self.assertIs(engine.persister, p)
+        self.assertEqual(engine.sweeper._pid, os.getpid())
+        self.assertEqual(len([t for t in threading.enumerate() if t.name == "expiry-sweeper"]), sweepers + 1)
+        engine.sweeper.stop()
+
+    def test_rp_file_sharding(self):
+        import tempfile
+        root = tempfile.mkdtemp()
+        p = PersistenceEngine(
+            engine_name="file", parameters={"root": root, "fsync": "always"}, sweep_interval=0
+        ).persister
+        p.save(key="test-shard-1", jsonstr='{"foo": 1}')
+        filename = p._filename("test-shard-1")
+        self.assertEqual(len(os.path.relpath(filename, root).split(os.sep)), 3)
+        self.assertTrue(os.path.isfile(filename))
+        self.assertEqual(p.load_versioned(key="test-shard-1"), ('{"foo": 1}', 1))
+        self.assertEqual([name for name in os.listdir(os.path.dirname(filename)) if name.endswith(".tmp")], [])
+        with self.assertRaises(KeyError):
+            p.load(key="../test-shard-1")
+        with self.assertRaises(ValueError):
+            PersistenceEngine(engine_name="file", parameters={"root": root, "fsync": "sometimes"})
+
+        p = PersistenceEngine(
+            engine_name="file", parameters={"root": root, "shard_depth": 0, "fsync": "batch"}, sweep_interval=0
+        ).persister
+        p.save(key="test-shard-2", jsonstr='{"foo": 2}')
+        self.assertTrue(os.path.isfile(os.path.join(root, "test-shard-2.cow")))
+
+    def test_rp_file_batch_fsync(self):
+        import tempfile
+        import time
+        root = tempfile.mkdtemp()
+        p = PersistenceEngine(
+            engine_name="file", parameters={"root": root, "fsync": "batch", "fsync_interval_ms": 50}, sweep_interval=0
+        ).persister
+        p.save(key="test-batch-1", jsonstr='{"foo": 1}')
+        p.save(key="test-batch-2", jsonstr='{"foo": 2}')
+        p.delete(key="test-batch-2")
+        # Only the files written (and their directories) are synced.
+        self.assertTrue({p._filename("test-batch-1"), os.path.dirname(p._filename("test-batch-1"))} <= p._unsynced_paths)
+        time.sleep(0.3)
+        self.assertEqual(p._unsynced_paths, set())
+
+    def test_rp_file_legacy_root(self):
+        import tempfile
+        legacy_root = tempfile.mkdtemp()
+        with open(os.path.join(legacy_root, "test-legacy-1.cow"), "w") as f:
+            f.write('{"foo": 1}')
+        p = PersistenceEngine(
+            engine_name="file", parameters={"root": tempfile.mkdtemp(), "legacy_root": legacy_root}, sweep_interval=0
+        ).persister
+        self.assertEqual(p.load_versioned(key="test-legacy-1"), ('{"foo": 1}', 0))
+        self.assertEqual(p.load_many(keys=["test-legacy-1"]), {"test-legacy-1": '{"foo": 1}'})
+
+        # Saving the game moves it into root.
+        p.save(key="test-legacy-1", jsonstr='{"foo": 2}', expected_version=0)
+        self.assertFalse(os.path.exists(os.path.join(legacy_root, "test-legacy-1.cow")))
+        self.assertEqual(p.load_versioned(key="test-legacy-1"), ('{"foo": 2}', 1))
+
+        with open(os.path.join(legacy_root, "test-legacy-2.cow"), "w") as f:
+            f.write('{"foo": 3}')
+        p.delete(key="test-legacy-2")
+        with self.assertRaises(KeyError):
+            p.load(key="test-legacy-2")
+
+    def test_rp_file_locks_kept(self):
+        import fcntl
+        import tempfile
+        import threading
+        import time
+        root = tempfile.mkdtemp()
+        p = PersistenceEngine(engine_name="file", parameters={"root": root}, sweep_interval=0).persister
+        p.save(key="test-lock-1", jsonstr='{"foo": 1}')
+        lockname = p._lockname("test-lock-1")
+        self.assertTrue(os.path.isfile(lockname))
+
+        # A delete waits for the writer holding the lock, and the lock file is kept.
+        with open(lockname, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            deleter = threading.Thread(target=p.delete, kwargs={"key": "test-lock-1"})
+            deleter.start()
+            time.sleep(0.2)
+            self.assertTrue(os.path.isfile(p._filename("test-lock-1")))
+        deleter.join()
+        self.assertFalse(os.path.exists(p._filename("test-lock-1")))
+        self.assertTrue(os.path.isfile(lockname))
+
+        p.save(key="test-lock-2", jsonstr='{"foo": 2}', ttl=1)
+        time.sleep(1.1)
+        self.assertEqual(p.sweep(), 1)
+        self.assertTrue(os.path.isfile(p._lockname("test-lock-2")))
+        p.delete_many(keys=["test-lock-missing"])
+
+        # The lock files of every key are shared from one directory.
+        p.save_many(items=dict(("test-lock-many-{}".format(i), '{"foo": 1}') for i in range(1000)))
+        self.assertLessEqual(len(os.listdir(os.path.dirname(lockname))), p.LOCK_STRIPES)
+
+    def test_rp_log_store(self):
+        import tempfile
+        directory = tempfile.mkdtemp()
+        p = PersistenceEngine(engine_name="logstore", parameters={"directory": directory}, sweep_interval=0).persister
+        p.save(key="test-log-1", jsonstr='{"foo": 1}')
+        p.save(key="test-log-1", jsonstr='{"foo": 2}', expected_version=1)
+        with self.assertRaises(VersionConflict):
+            p.save(key="test-log-1", jsonstr='{"foo": 3}', expected_version=1)
+        self.assertEqual(p.load_versioned(key="test-log-1"), ('{"foo": 2}', 2))
+        p.save_many(items={"test-log-2": '{"foo": 2}', "test-log-3": '{"foo": 3}'})
+        p.delete(key="test-log-3")
+        self.assertEqual(
+            p.load_many(keys=["test-log-1", "test-log-2", "test-log-3"]),
+            {"test-log-1": '{"foo": 2}', "test-log-2": '{"foo": 2}', "test-log-3": None}
+        )
+        self.assertEqual(
+            p.load_many_versioned(keys=["test-log-1", "test-log-3"]),
+            {"test-log-1": ('{"foo": 2}', 2), "test-log-3": (None, None)}
+        )
+        with self.assertRaises(IOError):
+            PersistenceEngine(engine_name="logstore", parameters={"directory": directory}).persister.load(key="test-log-1")
+
+        # Reopened, the index is rebuilt by reading the segment.
+        p.close()
+        p = PersistenceEngine(engine_name="logstore", parameters={"directory": directory}, sweep_interval=0).persister
+        self.assertEqual(p.load_versioned(key="test-log-1"), ('{"foo": 2}', 2))
+        with self.assertRaises(KeyError):
+            p.load(key="test-log-3")
+        p.close()
+
+    def test_rp_log_store_one_worker(self):
+        import tempfile
+        engine = PersistenceEngine(engine_name="logstore", parameters={"directory": tempfile.mkdtemp()}, sweep_interval=0)
+        engine.check_workers(workers=1)
+        with self.assertRaises(ValueError):
+            engine.check_workers(workers=4)
+
+    def test_rp_log_store_compaction(self):
+        import tempfile
+        import time
+        directory = tempfile.mkdtemp()
+        parameters = {"directory": directory, "segment_size_mb": 0.001, "fsync": "always"}
+        p = PersistenceEngine(engine_name="logstore", parameters=parameters, sweep_interval=0).persister
+        for i in range(50):
+            p.save(key="test-compact-{}".format(i % 5), jsonstr=json.dumps({"foo": i}))
+        p.save(key="test-compact-expired", jsonstr='{"foo": 0}', ttl=1)
+        p.delete(key="test-compact-4")
+        for i in range(20):
+            p.save(key="test-compact-{}".format(i % 2), jsonstr=json.dumps({"foo": 100 + i}))
+        time.sleep(1.1)
+        segments = p.stats()["log_store"]["segments"]
+        self.assertGreater(segments, 2)
+        self.assertEqual(p.sweep(), 1)
+        self.assertEqual(p.stats()["log_store"]["compactions"], 1)
+        self.assertLess(p.stats()["log_store"]["segments"], segments)
+        expected = {
+            "test-compact-0": '{"foo": 118}',
+            "test-compact-1": '{"foo": 119}',
+            "test-compact-2": '{"foo": 47}',
+            "test-compact-3": '{"foo": 48}',
+            "test-compact-4": None,
+            "test-compact-expired": None
+        }
+        self.assertEqual(p.load_many(keys=list(expected)), expected)
+        self.assertEqual(p.load_versioned(key="test-compact-2")[1], 10)
+
+        # Reopened, the compacted segment is read from its hint file; a record cut
+        # short at the end of the last segment is dropped.
+        p.save(key="test-compact-5", jsonstr='{"foo": 5}')
+        p.save(key="test-compact-6", jsonstr='{"foo": 6}')
+        p.close()
+        last = sorted(name for name in os.listdir(directory) if name.endswith(".segment"))[-1]
+        with open(os.path.join(directory, last), "r+b") as f:
+            data = f.read()
+            f.seek(data.index(b'{"foo": 6}'))
+            f.write(b'{"foo": 7}')
+        self.assertTrue(any(name.endswith(".hint") for name in os.listdir(directory)))
+        p = PersistenceEngine(engine_name="logstore", parameters=parameters, sweep_interval=0).persister
+        expected["test-compact-5"] = '{"foo": 5}'
+        expected["test-compact-6"] = None
+        self.assertEqual(p.load_many(keys=list(expected)), expected)
+        p.close()
+
+    def test_rp_log_store_compaction_cut_short(self):
+        import tempfile
+        directory = tempfile.mkdtemp()
+        parameters = {"directory": directory, "segment_size_mb": 0.001}
+        p = PersistenceEngine(engine_name="logstore", parameters=parameters, sweep_interval=0).persister
+        p.save(key="test-crash-deleted", jsonstr='{"foo": 1}')
+        p.save(key="test-crash-expired", jsonstr='{"foo": 1}')
+        for i in range(20):
+            p.save(key="test-crash-{}".format(i % 3), jsonstr=json.dumps({"foo": i, "pad": "x" * 100}))
+        p.delete(key="test-crash-deleted")
+        p.save(key="test-crash-expired", jsonstr='{"foo": 2}', ttl=1)
+        # Seal the segment holding the delete (so it is the one compaction replaces).
+        p.save(key="test-crash-big", jsonstr=json.dumps({"foo": "x" * 2000}))
+
+        # The compacted segment replaces the newest sealed one, then the process
+        # dies before the older segments are deleted.
+        remove = p._remove
+
+        def crash(path):
+            if path.endswith(p.SEGMENT_SUFFIX):
+                raise RuntimeError("Crashed")
+            remove(path)
+        p._remove = crash
+        import time
+        time.sleep(1.1)
+        with self.assertRaises(RuntimeError):
+            p.compact(force=True)
+        p.close()
+
+        p = PersistenceEngine(engine_name="logstore", parameters=parameters, sweep_interval=0).persister
+        self.assertEqual(
+            p.load_many(keys=["test-crash-deleted", "test-crash-expired", "test-crash-2"]),
+            {"test-crash-deleted": None, "test-crash-expired": None, "test-crash-2": '{"foo": 17, "pad": "%s"}' % ("x" * 100)}
+        )
+        # And again, rebuilt without the hint file.
+        p.close()
+        for name in os.listdir(directory):
+            if name.endswith(p.HINT_SUFFIX):
+                os.remove(os.path.join(directory, name))
+        p = PersistenceEngine(engine_name="logstore", parameters=parameters, sweep_interval=0).persister
+        self.assertEqual(p.load_many(keys=["test-crash-deleted", "test-crash-expired"]), {"test-crash-deleted": None, "test-crash-expired": None})
+        self.assertTrue(p.compact(force=True))
+        self.assertEqual(p.load_many(keys=["test-crash-deleted", "test-crash-1"])["test-crash-deleted"], None)
+        p.close()
+
+    def test_rp_sqlite(self):
+        import sqlite3
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), "cowbull.db")
+        p = PersistenceEngine(engine_name="sqlite", parameters={"path": path}, sweep_interval=0).persister
+        p.save(key="test-sqlite-1", jsonstr='{"foo": 1}')
+        p.save(key="test-sqlite-1", jsonstr='{"foo": 2}', expected_version=1)
+        with self.assertRaises(VersionConflict):
+            p.save(key="test-sqlite-1", jsonstr='{"foo": 3}', expected_version=1)
+        with self.assertRaises(VersionConflict):
+            p.save(key="test-sqlite-missing", jsonstr='{"foo": 1}', expected_version=1)
+        self.assertEqual(p.load_versioned(key="test-sqlite-1"), ('{"foo": 2}', 2))
+        p.save_many(items={"test-sqlite-2": '{"foo": 2}', "test-sqlite-3": '{"foo": 3}'})
+        p.delete(key="test-sqlite-3")
+        self.assertEqual(
+            p.load_many(keys=["test-sqlite-1", "test-sqlite-2", "test-sqlite-3"]),
+            {"test-sqlite-1": '{"foo": 2}', "test-sqlite-2": '{"foo": 2}', "test-sqlite-3": None}
+        )
+        self.assertEqual(
+            p.load_many_versioned(keys=["test-sqlite-1", "test-sqlite-3"]),
+            {"test-sqlite-1": ('{"foo": 2}', 2), "test-sqlite-3": (None, None)}
+        )
+        results = p.write_many(writes=[
+            {"key": "test-sqlite-1", "jsonstr": '{"foo": 4}', "expected_version": 2},
+            {"key": "test-sqlite-2", "jsonstr": '{"foo": 4}', "expected_version": 5}
+        ])
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], VersionConflict)
+        self.assertEqual(p.load_versioned(key="test-sqlite-1"), ('{"foo": 4}', 3))
+        self.assertEqual(
+            sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0], "wal"
+        )
+
+    def test_rp_sqlite_errors(self):
+        import sqlite3
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), "cowbull.db")
+        p = PersistenceEngine(engine_name="sqlite", parameters={"path": path}, sweep_interval=0).persister
+        connection = sqlite3.connect(path)
+        connection.execute("DROP TABLE games")
+        connection.close()
+        for call in (
+            lambda: p.load_versioned(key="test-sqlite-1"),
+            lambda: p.load_many_versioned(keys=["test-sqlite-1"]),
+            lambda: p.save(key="test-sqlite-1", jsonstr='{"foo": 1}'),
+            lambda: p.save_many(items={"test-sqlite-1": '{"foo": 1}'}),
+            lambda: p.delete_many(keys=["test-sqlite-1"]),
+            lambda: p.sweep()
+        ):
+            with self.assertRaises(KeyError):
+                call()
+        self.assertIsInstance(p.write_many(writes=[{"key": "test-sqlite-1", "jsonstr": "{}"}])[0], KeyError)
+
+    def test_rp_sqlite_expiry(self):
+        import tempfile
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        path = os.path.join(tempfile.mkdtemp(), "cowbull.db")
+        engine = PersistenceEngine(engine_name="sqlite", parameters={"path": path}, sweep_interval=3600)
+        p = engine.persister
+        p.save(key="test-sqlite-expiry-1", jsonstr='{"foo": 1}', ttl=1)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(
+                lambda i: p.save(key="test-sqlite-expiry-{}".format(i), jsonstr='{"foo": 2}', ttl=3600),
+                range(2, 10)
+            ))
+        time.sleep(1.1)
+        with self.assertRaises(KeyError):
+            p.load(key="test-sqlite-expiry-1")
+        self.assertEqual(engine.sweeper.sweep(), 1)
+        self.assertEqual(p.sweep(), 0)
+        p.save(key="test-sqlite-expiry-1", jsonstr='{"foo": 3}')
+        self.assertEqual(p.load_versioned(key="test-sqlite-expiry-1"), ('{"foo": 3}', 1))
+        self.assertEqual(p.load(key="test-sqlite-expiry-9"), '{"foo": 2}')
+        engine.sweeper.stop()
@@ -21,3 +21,61 @@ class TestPersisterMongo(TestCase):
     def test_mp_bad_load(self):
         with self.assertRaises(KeyError):
             self.p.load(key="foo")
+
+    def test_mp_bad_save_many(self):
+        with self.assertRaises(ServerSelectionTimeoutError):
+            self.p.save_many(items={"foo": '{"foo": "bar"}'})
+
+    def test_mp_bad_load_many(self):
+        with self.assertRaises(KeyError):
+            self.p.load_many(keys=["foo", "bar"])
+
+    def test_mp_bad_delete_many(self):
+        with self.assertRaises(ServerSelectionTimeoutError):
+            self.p.delete_many(keys=["foo", "bar"])
+
+    def test_mp_bad_update(self):
+        with self.assertRaises(ServerSelectionTimeoutError):
+            self.p.update(key="foo", fields={"status": "won"}, jsonstr='{"status": "won"}')
+
+    def test_mp_version_filter(self):
+        self.assertEqual(Persister._version_filter("foo", None), {"_id": "foo"})
+        self.assertEqual(Persister._version_filter("foo", 2), {"_id": "foo", "version": 2})
+        self.assertEqual(Persister._version_filter("foo", 0), {"_id": "foo", "version": {"$in": [0, None]}})
+
+    def test_mp_bad_write_many(self):
+        results = self.p.write_many(writes=[
+            {"key": "foo", "jsonstr": '{"foo": "bar"}'},
+            {"key": "baz", "jsonstr": '{"foo": "bar"}', "fields": {"foo": "bar"}, "expected_version": 1}
+        ])
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(isinstance(result, ServerSelectionTimeoutError) for result in results))
+        with self.assertRaises(TypeError):
+            self.p.write_many(writes=[{"key": "foo", "jsonstr": "bar", "fields": "foo"}])
+
+    def test_mp_expired(self):
+        from datetime import datetime, timedelta
+        self.assertFalse(self.p._expired({"_id": "foo"}))
+        self.assertTrue(self.p._expired({"expires_at": datetime.utcnow() - timedelta(seconds=1)}))
+        self.assertFalse(self.p._expired({"expires_at": self.p._expiry(60)}))
+        self.assertEqual(self.p._write('{"foo": 1}', "when")["$set"]["expires_at"], "when")
+
+    def test_mp_startup_does_not_wait(self):
+        import time
+        started = time.time()
+        Persister(host="foobar", server_selection_timeout_ms=30000)
+        self.assertLess(time.time() - started, 5)
+
+    def test_mp_client_options(self):
+        p = Persister(
+            host="foobar",
+            server_selection_timeout_ms=100,
+            max_pool_size=10,
+            wait_queue_timeout_ms=500,
+            read_preference="nearest",
+            w="majority"
+        )
+        self.assertEqual(p.connection.read_preference.mongos_mode, "nearest")
+        self.assertEqual(p.connection.write_concern.document, {"w": "majority"})
+        self.assertFalse(p._indexed)
+        self.assertNotIn("write_id", p.PROJECTION)
@@ -3,6 +3,9 @@ import redis
 
 from unittest import TestCase
 from PersistenceExtensions.Redis import Persister
+from Persistence.RedisHedgedReader import RedisHedgedReader
+from Persistence.RedisReplicaTracker import RedisReplicaTracker
+from Persistence.RedisRouter import RedisHashRing
 
 class TestPersisterRedis(TestCase):
     def setUp(self):
@@ -23,3 +26,169 @@ class TestPersisterRedis(TestCase):
     def test_rp_bad_load(self):
         with self.assertRaises(KeyError):
             self.p.load(key="foo")
+
+    def test_rp_bad_save_many(self):
+        with self.assertRaises(KeyError):
+            self.p.save_many(items={"foo": "bar", "baz": "bar"})
+
+    def test_rp_bad_load_many(self):
+        with self.assertRaises(KeyError):
+            self.p.load_many(keys=["foo", "baz"])
+
+    def test_rp_load_many_bad_keys(self):
+        with self.assertRaises(TypeError):
+            self.p.load_many(keys="foo")
+
+    def test_rp_bad_delete_many(self):
+        with self.assertRaises(KeyError):
+            self.p.delete_many(keys=["foo", "baz"])
+
+    def test_rp_socket_path(self):
+        p = Persister(socket_path="/tmp/cowbull-missing.sock", max_connections=2, pool_timeout=1)
+        with self.assertRaises(KeyError):
+            p.save(key="foo", jsonstr="bar")
+        stats = p.stats()["master"]
+        self.assertEqual(stats["max_connections"], 2)
+        self.assertEqual(stats["in_use"], 0)
+
+    def test_rp_pool_stats(self):
+        stats = self.p.stats()
+        self.assertEqual(list(stats), ["master"])
+        self.assertEqual(stats["master"]["max_connections"], 50)
+
+    def test_rp_atomic_guesses_default(self):
+        self.assertFalse(self.p.atomic_guesses)
+        self.assertTrue(Persister(host="foobar", atomic_guesses=True).atomic_guesses)
+
+    def test_rp_bad_atomic_guess(self):
+        p = Persister(host="foobar", atomic_guesses=True)
+        with self.assertRaises(KeyError):
+            p.atomic_guess(key="foo", guesses={0: [1, 2, 3, 4], 1: [1, 2, 3, 4]}, modes={"Normal": [4, 10, 0]})
+
+    def test_rp_bad_update(self):
+        with self.assertRaises(KeyError):
+            self.p.update(key="foo", fields={"status": "won"}, jsonstr='{"status": "won"}')
+
+    def test_rp_hash_fields(self):
+        game = {"key": "foo", "answer": [1, 2, 3, 4], "mode": {"mode": "Normal"}, "guesses_made": 3}
+        fields = Persister._hash_fields(json.dumps(game))
+        flat = [b"_version", b"3"]
+        for field, value in fields.items():
+            flat.extend([field.encode("utf-8"), value.encode("utf-8")])
+        payload, version = Persister._decode(flat)
+        self.assertEqual(json.loads(payload), game)
+        self.assertEqual(version, 3)
+        self.assertIsNone(Persister._hash_fields("cb1:AAAA"))
+        self.assertEqual(Persister._decode([b"_version", b"1", b"_payload", b"cb1:AAAA"]), ("cb1:AAAA", 1))
+        self.assertEqual(Persister._decode(b"cb1:AAAA"), ("cb1:AAAA", 0))
+
+    def test_rp_save_args(self):
+        args = self.p._save_args("cb1:AAAA", expected_version=2)
+        self.assertEqual(args, [Persister.TTL, 2, "_payload", "cb1:AAAA"])
+        args = self.p._save_args('{"status": "won"}')
+        self.assertEqual(args, [Persister.TTL, "", "status", '"won"'])
+
+    def test_rp_bad_load_versioned(self):
+        with self.assertRaises(KeyError):
+            self.p.load_versioned(key="foo")
+
+    def test_rp_no_replication_without_sentinel(self):
+        self.assertNotIn("replication", self.p.stats())
+
+    def test_rp_replica_tracker(self):
+        info = {
+            "master_repl_offset": 100,
+            "slave0": {"ip": "10.0.0.2", "port": 6379, "state": "online", "offset": 90, "lag": 0}
+        }
+
+        class Master(object):
+            def info(self, section=None):
+                return info
+
+        tracker = RedisReplicaTracker(master=Master())
+        self.assertTrue(tracker.use_replica(keys=["foo"]))
+        tracker.written(keys=["foo"], info=info)
+        tracker._refreshed = 0
+        self.assertFalse(tracker.use_replica(keys=["foo", "bar"]))
+        self.assertTrue(tracker.use_replica(keys=["bar"]))
+        info["slave0"]["offset"] = 100
+        tracker._refreshed = 0
+        self.assertTrue(tracker.use_replica(keys=["foo"]))
+        stats = tracker.stats()
+        self.assertEqual(stats["replicas"]["10.0.0.2:6379"], {"offset": 100, "lag_bytes": 0})
+        self.assertEqual(stats["reads"], {"replica": 3, "master": 1, "master_fallback": 0})
+
+    def test_rp_hedged_reader(self):
+        import time
+
+        class Node(object):
+            def __init__(self, name, delay):
+                self.name, self.delay = name, delay
+
+        def read(client):
+            time.sleep(client.delay)
+            return client.name
+
+        hedger = RedisHedgedReader(
+            replicas={"slow": Node("slow", 0.2), "fast": Node("fast", 0)},
+            master=Node("master", 0),
+            min_delay_ms=1,
+            max_delay_ms=10
+        )
+        self.assertEqual(hedger.read(read), "fast")
+        self.assertEqual(hedger.read(read), "fast")
+        stats = hedger.stats()
+        self.assertEqual(stats["reads"], 2)
+        self.assertEqual(stats["hedged"], 1)
+        self.assertEqual(stats["hedge_wins"], 1)
+        self.assertEqual(stats["hedge_rate"], 0.5)
+
+    def test_rp_hedged_reader_needs_replicas(self):
+        with self.assertRaises(ValueError):
+            RedisHedgedReader(replicas={}, master=None)
+
+    def test_rp_hash_ring(self):
+        ring = RedisHashRing(nodes={"a:6379": "a", "b:6379": "b", "c:6379": "c"})
+        keys = ["game-{}".format(n) for n in range(3000)]
+        placed = dict((key, ring.node_for(key=key)[0]) for key in keys)
+        self.assertEqual(placed, dict((key, ring.node_for(key=key)[0]) for key in keys))
+        for node in ("a:6379", "b:6379", "c:6379"):
+            self.assertTrue(700 < list(placed.values()).count(node) < 1300)
+
+        ring.add_node(name="d:6379", client="d")
+        moved = [key for key in keys if ring.node_for(key=key)[0] != placed[key]]
+        self.assertTrue(500 < len(moved) < 1000)
+        self.assertTrue(all(ring.node_for(key=key)[0] == "d:6379" for key in moved))
+
+        groups = ring.group(keys=keys[:50])
+        self.assertEqual(sorted(key for _, node_keys in groups for key in node_keys), sorted(keys[:50]))
+        for client, node_keys in groups:
+            self.assertTrue(all(ring.node_for(key=key)[1] == client for key in node_keys))
+
+    def test_rp_hash_ring_bad_args(self):
+        with self.assertRaises(ValueError):
+            RedisHashRing(nodes={})
+        with self.assertRaises(ValueError):
+            RedisHashRing(nodes={"a:6379": "a"}, virtual_nodes=0)
+        with self.assertRaises(ValueError):
+            RedisHashRing(nodes={"a:6379": "a"}).remove_node(name="a:6379")
+
+    def test_rp_nodes(self):
+        p = Persister(nodes=["foobar:6379", "foobaz:6379"])
+        self.assertEqual(sorted(p.stats()["nodes"]), ["foobar:6379", "foobaz:6379"])
+        with self.assertRaises(KeyError):
+            p.save(key="foo", jsonstr="bar")
+        with self.assertRaises(KeyError):
+            p.load_many(keys=["foo", "baz", "qux"])
+        with self.assertRaises(ValueError):
+            Persister(nodes=["foobar"])
+
+    def test_rp_bad_write_many(self):
+        results = self.p.write_many(writes=[
+            {"key": "foo", "jsonstr": "bar"},
+            {"key": "baz", "jsonstr": '{"foo": "bar"}', "fields": {"foo": "bar"}, "expected_version": 1}
+        ])
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(isinstance(result, KeyError) for result in results))
+        with self.assertRaises(ValueError):
+            self.p.write_many(writes=[{"key": None, "jsonstr": "bar"}])
@@ -0,0 +1,335 @@
+import json
+import threading
+
+from unittest import TestCase
+from Game.GameController import GameController
+from Game.GameModeRegistry import GameModeRegistry
+from Game.PackedWord import PackedWord
+from PersistenceExtensions.Redis import Persister
+from Persistence.VersionConflict import VersionConflict
+from RedisServers import RedisServers
+
+
+class TestPersisterRedisServer(TestCase):
+    """
+    Tests of the Redis persister's Lua scripts against a local redis-server; skipped
+    if redis-server is not installed.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = RedisServers()
+        cls.port = cls.servers.start()[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servers.stop()
+
+    def setUp(self):
+        self.servers.client(self.port).flushall()
+        self.p = Persister(host="127.0.0.1", port=self.port, atomic_guesses=True)
+        self.modes = dict(
+            (_mode.mode, [_mode.digits, _mode.guesses_allowed, _mode.digit_type])
+            for _mode in GameModeRegistry.get().modes
+        )
+
+    def _guesses(self, digits):
+        # As GameServerController._atomic_guess parses them.
+        _guesses = {}
+        for _digit_type in (PackedWord.DIGIT, PackedWord.HEXDIGIT):
+            try:
+                _guesses[_digit_type] = list(PackedWord.parse(digits, wordtype=_digit_type).digits)
+            except (ValueError, TypeError):
+                _guesses[_digit_type] = None
+        return _guesses
+
+    def _new_game(self, mode):
+        _controller = GameController(mode=mode)
+        self.p.save(key=_controller.game.key, jsonstr=_controller.save(), ttl=_controller.game.ttl)
+        return _controller
+
+    def test_rs_atomic_guess_matches_controller(self):
+        for _mode in ("Easy", "Normal", "Hard", "Hex"):
+            _game = self._new_game(_mode)
+            _key, _answer = _game.game.key, list(_game.game.answer.word)
+            _reference = GameController(game_json=_game.save())
+            _wrong = _answer[1:] + _answer[:1]
+
+            for _digits in [_wrong, _answer[:-1], _wrong, _answer, _wrong]:
+                _after, _analysis = self.p.atomic_guess(key=_key, guesses=self._guesses(_digits), modes=self.modes)
+
+                # The response built from the script's analysis, as GameServerController does.
+                _outcome = GameController(game_json=_after)
+                try:
+                    _expected = _reference.guess(*_digits)
+                except ValueError:
+                    self.assertIsNone(_analysis)
+                    with self.assertRaises(ValueError):
+                        _outcome.outcome(_analysis, *_digits)
+                else:
+                    self.assertEqual(_outcome.outcome(_analysis, *_digits), _expected)
+                self.assertEqual(json.loads(_after)["guesses_made"], _reference.game.guesses_made)
+
+                _stored = GameController(game_json=self.p.load(key=_key))
+                self.assertEqual(_stored.game.guesses_made, _reference.game.guesses_made)
+                self.assertEqual(_stored.game.status, _reference.game.status)
+                self.assertEqual(
+                    _stored.game.mode.guesses_allowed - _stored.game.guesses_made,
+                    _reference.game.mode.guesses_allowed - _reference.game.guesses_made
+                )
+            self.assertEqual(_reference.game.status, GameController.GAME_WON)
+
+    def test_rs_atomic_guess_lost(self):
+        _game = self._new_game("Easy")
+        _answer = list(_game.game.answer.word)
+        _wrong = _answer[1:] + _answer[:1]
+        for _ in range(_game.game.mode.guesses_allowed + 2):
+            self.p.atomic_guess(key=_game.game.key, guesses=self._guesses(_wrong), modes=self.modes)
+        _stored = GameController(game_json=self.p.load(key=_game.game.key))
+        self.assertEqual(_stored.game.status, GameController.GAME_LOST)
+        self.assertEqual(_stored.game.guesses_made, _game.game.mode.guesses_allowed)
+
+    def test_rs_atomic_guess_concurrent(self):
+        # Every concurrent guess is counted once, and none after the game is lost.
+        _game = self._new_game("Normal")
+        _answer = list(_game.game.answer.word)
+        _wrong = _answer[1:] + _answer[:1]
+        _allowed = _game.game.mode.guesses_allowed
+        _applied = []
+
+        def _guess():
+            _persister = Persister(host="127.0.0.1", port=self.port, atomic_guesses=True)
+            _after, _analysis = _persister.atomic_guess(
+                key=_game.game.key, guesses=self._guesses(_wrong), modes=self.modes
+            )
+            if _analysis is not None:
+                _applied.append(json.loads(_after)["guesses_made"])
+
+        _threads = [threading.Thread(target=_guess) for _ in range(_allowed + 4)]
+        for _thread in _threads:
+            _thread.start()
+        for _thread in _threads:
+            _thread.join()
+
+        _stored = GameController(game_json=self.p.load(key=_game.game.key))
+        self.assertEqual(_stored.game.guesses_made, _allowed)
+        self.assertEqual(_stored.game.status, GameController.GAME_LOST)
+        self.assertEqual(sorted(_applied), list(range(1, _allowed + 1)))
+
+    def test_rs_atomic_guess_missing(self):
+        with self.assertRaises(KeyError):
+            self.p.atomic_guess(key="missing", guesses=self._guesses([0, 1, 2, 3]), modes=self.modes)
+
+    def test_rs_partial_update(self):
+        _game = self._new_game("Normal")
+        _key = _game.game.key
+        _client = self.servers.client(self.port)
+        _answer = _client.hget(_key, "answer")
+        _version = self.p.load_versioned(key=_key)[1]
+
+        _game.guess(*(list(_game.game.answer.word)[1:] + list(_game.game.answer.word)[:1]))
+        self.p.update(key=_key, fields=_game.changes(), jsonstr=_game.save(), expected_version=_version)
+
+        # Only the fields which changed were written.
+        self.assertEqual(_client.hget(_key, "answer"), _answer)
+        self.assertEqual(json.loads(_client.hget(_key, "guesses_made")), 1)
+        _loaded, _loaded_version = self.p.load_versioned(key=_key)
+        self.assertEqual(_loaded_version, _version + 1)
+        self.assertEqual(json.loads(_loaded), json.loads(_game.save()))
+        self.assertTrue(0 < _client.ttl(_key) <= _game.game.ttl)
+
+    def test_rs_partial_update_write_many(self):
+        _games = [self._new_game("Easy") for _ in range(3)]
+        for _game in _games:
+            _game.guess(*(list(_game.game.answer.word)[1:] + list(_game.game.answer.word)[:1]))
+        self.assertEqual(self.p.write_many(writes=[
+            {"key": _game.game.key, "jsonstr": _game.save(), "fields": _game.changes(), "expected_version": 1}
+            for _game in _games
+        ]), [None, None, None])
+        _loaded = self.p.load_many_versioned(keys=[_game.game.key for _game in _games])
+        for _game in _games:
+            self.assertEqual(json.loads(_loaded[_game.game.key][0]), json.loads(_game.save()))
+            self.assertEqual(_loaded[_game.game.key][1], 2)
+
+    def test_rs_partial_update_falls_back_to_save(self):
+        # A game saved with the binary codec, and a missing game, are saved whole.
+        _game = GameController(mode="Normal", codec="binary")
+        self.p.save(key=_game.game.key, jsonstr=_game.save())
+        _game.game.guesses_made = 1
+        self.p.update(key=_game.game.key, fields={"guesses_made": 1}, jsonstr=_game.save())
+        self.assertEqual(self.p.load(key=_game.game.key), _game.save())
+
+        self.p.update(key="missing", fields={"guesses_made": 1}, jsonstr='{"guesses_made": 1}')
+        self.assertEqual(json.loads(self.p.load(key="missing")), {"guesses_made": 1})
+
+    def test_rs_partial_updates_disabled(self):
+        p = Persister(host="127.0.0.1", port=self.port, partial_updates=False)
+        _game = GameController(mode="Normal")
+        p.save(key=_game.game.key, jsonstr=_game.save())
+        _game.game.guesses_made = 1
+        p.update(key=_game.game.key, fields=_game.changes(), jsonstr=_game.save())
+        self.assertEqual(p.load(key=_game.game.key), _game.save())
+        self.assertTrue(self.servers.client(self.port).hexists(_game.game.key, "_payload"))
+
+    def test_rs_save_version_conflict(self):
+        self.p.save(key="versioned", jsonstr='{"foo": 1}')
+        self.assertEqual(self.p.load_versioned(key="versioned"), ('{"foo": 1}', 1))
+        self.p.save(key="versioned", jsonstr='{"foo": 2}', expected_version=1)
+        with self.assertRaises(VersionConflict):
+            self.p.save(key="versioned", jsonstr='{"foo": 3}', expected_version=1)
+        self.assertEqual(self.p.load_versioned(key="versioned"), ('{"foo": 2}', 2))
+
+        # A game must exist to be saved with an expected version.
+        with self.assertRaises(VersionConflict):
+            self.p.save(key="missing", jsonstr='{"foo": 1}', expected_version=1)
+        with self.assertRaises(KeyError):
+            self.p.load(key="missing")
+
+    def test_rs_update_version_conflict(self):
+        self.p.save(key="versioned", jsonstr='{"foo": 1, "bar": 1}')
+        self.p.update(key="versioned", fields={"foo": 2}, jsonstr='{"foo": 2, "bar": 1}', expected_version=1)
+        with self.assertRaises(VersionConflict):
+            self.p.update(key="versioned", fields={"foo": 3}, jsonstr='{"foo": 3, "bar": 1}', expected_version=1)
+        _loaded, _version = self.p.load_versioned(key="versioned")
+        self.assertEqual(json.loads(_loaded), {"foo": 2, "bar": 1})
+        self.assertEqual(_version, 2)
+
+    def test_rs_write_many_version_conflict(self):
+        self.p.save_many(items={"first": '{"foo": 1}', "second": '{"foo": 1}'})
+        self.p.save(key="second", jsonstr='{"foo": 2}')
+        _results = self.p.write_many(writes=[
+            {"key": "first", "jsonstr": '{"foo": 3}', "fields": {"foo": 3}, "expected_version": 1},
+            {"key": "second", "jsonstr": '{"foo": 3}', "fields": {"foo": 3}, "expected_version": 1},
+            {"key": "third", "jsonstr": '{"foo": 3}'}
+        ])
+        self.assertIsNone(_results[0])
+        self.assertIsInstance(_results[1], VersionConflict)
+        self.assertIsNone(_results[2])
+        _loaded = self.p.load_many_versioned(keys=["first", "second", "third"])
+        self.assertEqual(_loaded["first"], ('{"foo": 3}', 2))
+        self.assertEqual(_loaded["second"], ('{"foo": 2}', 2))
+        self.assertEqual(_loaded["third"], ('{"foo": 3}', 1))
+
+    def test_rs_string_game_version(self):
+        # Games saved as strings by earlier releases are at version 0.
+        self.servers.client(self.port).set("legacy", '{"foo": 1}')
+        self.assertEqual(self.p.load_versioned(key="legacy"), ('{"foo": 1}', 0))
+        self.p.save(key="legacy", jsonstr='{"foo": 2}', expected_version=0)
+        self.assertEqual(self.p.load_versioned(key="legacy"), ('{"foo": 2}', 1))
+
+
+class TestPersisterRedisNodes(TestCase):
+    """
+    Tests of the Redis persister spreading games across local redis-servers by
+    consistent hashing; skipped if redis-server is not installed.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = RedisServers(count=3)
+        cls.ports = cls.servers.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servers.stop()
+
+    def setUp(self):
+        for _port in self.ports:
+            self.servers.client(_port).flushall()
+        self.p = Persister(nodes=["127.0.0.1:{}".format(_port) for _port in self.ports])
+        self.keys = ["game-{}".format(_n) for _n in range(60)]
+
+    def test_rn_hash_ring_routing(self):
+        self.p.save_many(items=dict((_key, '{"foo": 1}') for _key in self.keys))
+        for _key in self.keys:
+            _node = self.p._router.node_for(key=_key)[0]
+            for _port in self.ports:
+                self.assertEqual(
+                    self.servers.client(_port).exists(_key),
+                    1 if _node == "127.0.0.1:{}".format(_port) else 0
+                )
+        self.assertTrue(all(self.servers.client(_port).dbsize() for _port in self.ports))
+
+        self.assertEqual(self.p.load_many(keys=self.keys), dict((_key, '{"foo": 1}') for _key in self.keys))
+        self.p.delete_many(keys=self.keys)
+        self.assertEqual(sum(self.servers.client(_port).dbsize() for _port in self.ports), 0)
+
+    def test_rn_bulk_grouping(self):
+        # Bulk operations make one round trip (pipeline) to each node.
+        _pipelines = []
+        for _name, _client in self.p._router.clients().items():
+            _client.pipeline = self._counting(_client.pipeline, _name, _pipelines)
+
+        self.p.save_many(items=dict((_key, '{"foo": 1}') for _key in self.keys))
+        self.assertEqual(sorted(_pipelines), sorted(self.p._router.clients()))
+        del _pipelines[:]
+        self.p.load_many_versioned(keys=self.keys)
+        self.assertEqual(sorted(_pipelines), sorted(self.p._router.clients()))
+        del _pipelines[:]
+        self.assertEqual(
+            self.p.write_many(writes=[{"key": _key, "jsonstr": '{"foo": 2}'} for _key in self.keys]),
+            [None] * len(self.keys)
+        )
+        self.assertEqual(sorted(_pipelines), sorted(self.p._router.clients()))
+
+    @staticmethod
+    def _counting(pipeline, name, pipelines):
+        def _pipeline(*args, **kwargs):
+            pipelines.append(name)
+            return pipeline(*args, **kwargs)
+        return _pipeline
+
+
+class TestPersisterRedisCluster(TestCase):
+    """
+    Tests of the Redis persister against a local three node Redis Cluster, including
+    MOVED and ASK redirects; skipped if redis-server is not installed.
+    """
+    def setUp(self):
+        self.servers = RedisServers(count=3, cluster=True)
+        self.ports = self.servers.start()
+        self.p = Persister(host="127.0.0.1", port=self.ports[0], cluster=True)
+        self.keys = ["game-{}".format(_n) for _n in range(30)]
+
+    def tearDown(self):
+        self.servers.stop()
+
+    def _versions(self):
+        return dict(
+            (_key, _loaded[1]) for _key, _loaded in self.p.load_many_versioned(keys=self.keys).items()
+        )
+
+    def _redirected(self):
+        # A key of the batch, the port holding it and another server's port.
+        _key = self.keys[0]
+        _source = self.servers.owner_of(self.servers.slot_of(_key))
+        _target = [_port for _port in self.ports if _port != _source][0]
+        return _key, self.servers.slot_of(_key), _source, _target
+
+    def test_rc_routing(self):
+        self.p.save_many(items=dict((_key, '{"foo": 1}') for _key in self.keys))
+        for _key in self.keys:
+            _owner = self.servers.owner_of(self.servers.slot_of(_key))
+            self.assertEqual(self.servers.client(_owner).exists(_key), 1)
+        self.assertEqual(self._versions(), dict((_key, 1) for _key in self.keys))
+
+    def test_rc_moved(self):
+        _key, _slot, _source, _target = self._redirected()
+        self.servers.move_slot(_slot, _source, _target)
+
+        # The persister's slot map is stale: only the moved key is resent.
+        self.assertEqual(
+            self.p.write_many(writes=[{"key": _k, "jsonstr": '{"foo": 1}'} for _k in self.keys]),
+            [None] * len(self.keys)
+        )
+        self.assertEqual(self._versions(), dict((_k, 1) for _k in self.keys))
+        self.assertEqual(self.servers.client(_target).exists(_key), 1)
+
+    def test_rc_ask(self):
+        _key, _slot, _source, _target = self._redirected()
+        self.servers.migrate_slot(_slot, _source, _target)
+
+        # The key is not held by the source, which asks for it to be sent to the
+        # target; only the asked key is resent.
+        self.p.save_many(items=dict((_k, '{"foo": 1}') for _k in self.keys))
+        self.servers.assign_slot(_slot, _target)
+        self.assertEqual(self._versions(), dict((_k, 1) for _k in self.keys))
+        self.assertEqual(self.servers.client(_target).exists(_key), 1)
@@ -1,16 +1,25 @@
 import unittest
 import logging
 from TestGameServerController import TestGameServerController
+from TestGameGuesses import TestGameGuesses
+from TestGames import TestGames
 from TestGameController import TestGameController
 from TestGameObject import TestGameObject
+from TestPackedWord import TestPackedWord
+from TestBatchScorer import TestBatchScorer
 from TestHelpers import TestHelpers
 from TestPersister import TestPersister
 from TestPersisterMongo import TestPersisterMongo
 from TestPersisterRedis import TestPersisterRedis
+from TestPersisterRedisServer import TestPersisterRedisServer, TestPersisterRedisNodes, TestPersisterRedisCluster
 from TestFlaskControllers import TestFlaskControllers
 from TestHealthCheck import TestHealthCheck
 from TestGameMode import TestGameMode
 from TestGameModes import TestGameModes
+from TestGameModeRegistry import TestGameModeRegistry
+from TestGameToken import TestGameToken
+from TestGameCodec import TestGameCodec
+from TestGamePool import TestGamePool
 from python_cowbull_server import app
 from Routes.V1 import V1
 from flask_helpers.ErrorHandler import ErrorHandler
@@ -18,11 +27,15 @@ from flask_controllers import GameServerController
 from flask_controllers import HealthCheck
 from flask_controllers import Readiness
 from flask_controllers import GameModes
+from flask_controllers import GameGuesses
+from flask_controllers import Games
 
 logging.disable(logging.CRITICAL)
 error_handler = ErrorHandler()
 v1 = V1(error_handler=error_handler, app=app)
 v1.game(controller=GameServerController)
+v1.games(controller=Games)
+v1.guesses(controller=GameGuesses)
 v1.modes(controller=GameModes)
 v1.health(controller=HealthCheck)
 v1.readiness(controller=Readiness)